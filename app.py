@@ -1,11 +1,32 @@
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for
+from flask import Flask, render_template, request, jsonify, session, redirect, url_for, make_response, stream_with_context, g
 from flask_sqlalchemy import SQLAlchemy
-from werkzeug.security import generate_password_hash, check_password_hash
-from datetime import datetime, timedelta
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy.pool import QueuePool
+from werkzeug.security import generate_password_hash
+from datetime import date, datetime, timedelta, timezone
+from functools import wraps
+from itertools import islice
+import hashlib
+import hmac
 import os
 import json
+import random
+import sys
+import time
 import pymysql
 from dotenv import load_dotenv
+import search_index
+import pagination
+import scheduler
+import data_export
+import password_pool
+import data_import
+import isbn
+import notification_hub
+import replica_routing
+import metrics
+import query_profiler
 
 # Load environment variables
 load_dotenv(override=True)
@@ -22,20 +43,32 @@ DB_PORT = os.getenv('DB_PORT', '3306')
 DB_USER = os.getenv('DB_USER', 'root')
 DB_PASSWORD = os.getenv('DB_PASSWORD', '')
 DB_NAME = os.getenv('DB_NAME', 'library_management')
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '5'))  # connections kept open per process
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '10'))  # extra connections opened under load
+DB_POOL_TIMEOUT = int(os.getenv('DB_POOL_TIMEOUT', '30'))  # seconds a request waits for a free connection
 
 # Debug: Print connection info (comment out for production)
 # print(f"Database Config - Host: {DB_HOST}, User: {DB_USER}, Database: {DB_NAME}")
 # print(f"Password provided: {'Yes' if DB_PASSWORD else 'No'}")
 
-# Construct MySQL connection string
-app.config['SQLALCHEMY_DATABASE_URI'] = f'mysql+pymysql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}'
+# Construct MySQL connection string (DATABASE_URL replaces it, e.g. a SQLite file for the tests)
+app.config['SQLALCHEMY_DATABASE_URI'] = (
+    os.getenv('DATABASE_URL') or f'mysql+pymysql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}'
+)
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
     'pool_pre_ping': True,
     'pool_recycle': 300,
+    'pool_size': DB_POOL_SIZE,
+    'max_overflow': DB_MAX_OVERFLOW,
+    'pool_timeout': DB_POOL_TIMEOUT,
+    'poolclass': metrics.TimedQueuePool,
+    'pool_logging_name': 'primary',
 }
+# Read replicas (DB_REPLICA_URLS, comma-separated) become the binds replica_0, replica_1, ...
+app.config['SQLALCHEMY_BINDS'] = replica_routing.bind_config(app.config['SQLALCHEMY_ENGINE_OPTIONS'])
 
-db = SQLAlchemy(app)
+db = SQLAlchemy(app, session_options={'class_': replica_routing.RoutingSession})
 
 # Database Models
 class User(db.Model):
@@ -50,6 +83,7 @@ class User(db.Model):
     phone = db.Column(db.String(20))
     status = db.Column(db.String(20), default='active')  # active, suspended, inactive
     max_books = db.Column(db.Integer, default=5)  # maximum books user can borrow
+    active_loans = db.Column(db.Integer, default=0, nullable=False)  # books currently borrowed, kept in step with Borrowing
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # Relationships
@@ -59,11 +93,12 @@ class User(db.Model):
 
 class Book(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    title = db.Column(db.String(200), nullable=False)
+    title = db.Column(db.String(200), nullable=False, index=True)
     author = db.Column(db.String(100), nullable=False)
     isbn = db.Column(db.String(20), unique=True)
+    isbn13 = db.Column(db.String(13), unique=True, index=True)  # canonical form of isbn, the de-duplication key
     subject = db.Column(db.String(100))
-    description = db.Column(db.Text)
+    description = db.deferred(db.Column(db.Text))  # large; loaded only where it is shown or indexed
     total_copies = db.Column(db.Integer, default=1)
     available_copies = db.Column(db.Integer, default=1)
     shelf_location = db.Column(db.String(50))
@@ -74,6 +109,40 @@ class Book(db.Model):
     # Relationships
     borrowings = db.relationship('Borrowing', backref='book', lazy=True)
     reservations = db.relationship('Reservation', backref='book', lazy=True)
+    subjects = db.relationship('Subject', secondary='book_subject', backref='books', lazy=True)
+    
+    @db.validates('isbn')
+    def normalize_isbn13(self, key, value):
+        self.isbn13 = isbn.normalize_isbn(value)
+        return value
+
+# Book <-> Subject link; the PK serves book lookups, the extra index serves subject lookups and counts
+book_subject = db.Table(
+    'book_subject',
+    db.Column('book_id', db.Integer, db.ForeignKey('book.id'), primary_key=True),
+    db.Column('subject_id', db.Integer, db.ForeignKey('subject.id'), primary_key=True),
+    db.Index('ix_book_subject_subject_id_book_id', 'subject_id', 'book_id'),
+)
+
+class Subject(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    slug = db.Column(db.String(100), unique=True, nullable=False)  # lowercase, hyphenated name
+    book_count = db.Column(db.Integer, default=0, nullable=False)  # maintained with book_subject
+
+class BookCopy(db.Model):
+    # One physical copy; its current loan is the open Borrowing carrying its id
+    id = db.Column(db.Integer, primary_key=True)
+    book_id = db.Column(db.Integer, db.ForeignKey('book.id'), nullable=False)
+    copy_number = db.Column(db.Integer, nullable=False)
+    barcode = db.Column(db.String(32), unique=True, nullable=False, index=True)  # desk scans look copies up by this
+    shelf_position = db.Column(db.String(50))
+    condition = db.Column(db.String(20), nullable=False, default='good')  # good, damaged, lost, withdrawn
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_book_copy_book_id_copy_number', 'book_id', 'copy_number', unique=True),
+    )
 
 class Borrowing(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -85,9 +154,23 @@ class Borrowing(db.Model):
     renewal_count = db.Column(db.Integer, default=0)
     max_renewals = db.Column(db.Integer, default=2)
     status = db.Column(db.String(20), default='borrowed')  # borrowed, returned, overdue, lost
+    last_notice = db.Column(db.String(20))  # due_soon, overdue: last reminder the sweeper sent
+    last_renewed_at = db.Column(db.DateTime)
+    copy_id = db.Column(db.Integer, db.ForeignKey('book_copy.id'))  # the physical copy on loan
     
     # Relationships
     fines = db.relationship('Fine', backref='borrowing', lazy=True)
+    
+    # Secondary indexes for the hot access paths (shipped to live databases by migrate.py)
+    __table_args__ = (
+        db.Index('ix_borrowing_user_id_status', 'user_id', 'status'),
+        db.Index('ix_borrowing_book_id_status', 'book_id', 'status'),
+        db.Index('ix_borrowing_status_due_date', 'status', 'due_date'),
+        db.Index('ix_borrowing_borrowed_date', 'borrowed_date'),
+        db.Index('ix_borrowing_returned_date', 'returned_date'),
+        db.Index('ix_borrowing_last_renewed_at', 'last_renewed_at'),
+        db.Index('ix_borrowing_copy_id_status', 'copy_id', 'status'),
+    )
 
 class Reservation(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -95,8 +178,14 @@ class Reservation(db.Model):
     book_id = db.Column(db.Integer, db.ForeignKey('book.id'), nullable=False)
     reserved_date = db.Column(db.DateTime, default=datetime.utcnow)
     expiry_date = db.Column(db.DateTime, nullable=False)
-    status = db.Column(db.String(20), default='active')  # active, fulfilled, expired, cancelled
-    priority = db.Column(db.Integer, default=1)  # position in waitlist
+    status = db.Column(db.String(20), default='active')  # active (queued), ready, fulfilled, expired, cancelled
+    priority = db.Column(db.Integer, default=1)  # position in waitlist, 1 = next in line; kept gap-free
+    
+    __table_args__ = (
+        db.Index('ix_reservation_book_id_status_priority', 'book_id', 'status', 'priority'),
+        db.Index('ix_reservation_user_id_status', 'user_id', 'status'),
+        db.Index('ix_reservation_status_expiry_date', 'status', 'expiry_date'),
+    )
 
 class Fine(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -107,6 +196,10 @@ class Fine(db.Model):
     status = db.Column(db.String(20), default='pending')  # pending, paid, waived
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     paid_at = db.Column(db.DateTime)
+    
+    __table_args__ = (
+        db.Index('ix_fine_status_user_id', 'status', 'user_id'),
+    )
 
 class Admin(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -124,129 +217,1231 @@ class Notification(db.Model):
     type = db.Column(db.String(20), default='info')  # info, warning, error, success
     read = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_notification_user_id_read_created_at', 'user_id', 'read', 'created_at'),
+    )
+
+class StatCounter(db.Model):
+    # Each counter is spread over STAT_COUNTER_SLOTS rows so concurrent updates rarely wait on one row lock
+    name = db.Column(db.String(50), primary_key=True)
+    slot = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    value = db.Column(db.Integer, nullable=False, default=0)
+
+class DataVersion(db.Model):
+    # Change stamps behind HTTP validators; slotted like StatCounter, version is the SUM over slots
+    name = db.Column(db.String(50), primary_key=True)  # catalog, circulation, users
+    slot = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+class BookSearchTerm(db.Model):
+    # Inverted index: (term, book_id) is the clustered key, so term lookups are range scans
+    term = db.Column(db.String(search_index.MAX_TERM_LENGTH), primary_key=True)
+    book_id = db.Column(db.Integer, db.ForeignKey('book.id'), primary_key=True, index=True)
+    weight = db.Column(db.Float, nullable=False)
+
+class ImportJob(db.Model):
+    # Progress of a bulk import; records_done is committed with each batch, so a rerun resumes after it
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(20), nullable=False)  # catalog
+    source = db.Column(db.String(255))
+    format = db.Column(db.String(10), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='running')  # running, completed, failed
+    records_done = db.Column(db.Integer, nullable=False, default=0)
+    inserted = db.Column(db.Integer, nullable=False, default=0)
+    merged = db.Column(db.Integer, nullable=False, default=0)
+    failed = db.Column(db.Integer, nullable=False, default=0)
+    started_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
+
+class Renewal(db.Model):
+    # One row per renewal; a loan itself only keeps its latest renewal time (last_renewed_at)
+    id = db.Column(db.Integer, primary_key=True)
+    borrowing_id = db.Column(db.Integer, db.ForeignKey('borrowing.id'), nullable=False, index=True)
+    renewed_at = db.Column(db.DateTime, nullable=False, index=True)
+
+class CirculationDaily(db.Model):
+    # Daily rollup of borrowing activity for closed UTC days; the current day is always counted live
+    day = db.Column(db.Date, primary_key=True)
+    borrows = db.Column(db.Integer, nullable=False, default=0)
+    returns = db.Column(db.Integer, nullable=False, default=0)
+    late_returns = db.Column(db.Integer, nullable=False, default=0)
+    renewals = db.Column(db.Integer, nullable=False, default=0)
+
+# Subjects
+def subject_slug(name):
+    """Normalize a subject name for matching: 'Computer Science' -> 'computer-science'"""
+    return '-'.join(search_index.tokenize(name))
+
+def split_subjects(text):
+    """Split a comma-joined Book.subject string into distinct subject names"""
+    names = {}
+    for name in (text or '').replace(';', ',').split(','):
+        name = ' '.join(name.split())
+        slug = subject_slug(name)
+        if slug and slug not in names:
+            names[slug] = name[:100]
+    return names
+
+def get_or_create_subjects(names):
+    """Return Subject rows for a {slug: name} mapping, creating the missing ones"""
+    if not names:
+        return []
+    subjects = {s.slug: s for s in Subject.query.filter(Subject.slug.in_(list(names))).all()}
+    for slug, name in names.items():
+        if slug in subjects:
+            continue
+        try:
+            # Savepoint so a concurrent insert of the same subject doesn't abort the caller
+            with db.session.begin_nested():
+                subject = Subject(name=name, slug=slug)
+                db.session.add(subject)
+            subjects[slug] = subject
+        except IntegrityError:
+            subjects[slug] = Subject.query.filter_by(slug=slug).one()
+    return [subjects[slug] for slug in names]
+
+def adjust_subject_counts(subject_ids, delta):
+    if subject_ids:
+        db.session.execute(
+            db.update(Subject).where(Subject.id.in_(subject_ids))
+            .values(book_count=Subject.book_count + delta),
+            execution_options={'synchronize_session': False}
+        )
+
+def sync_book_subjects(book):
+    """Point a book's subject links at the subjects named in book.subject"""
+    old_ids = {subject.id for subject in book.subjects}
+    book.subjects = get_or_create_subjects(split_subjects(book.subject))
+    new_ids = {subject.id for subject in book.subjects}
+    adjust_subject_counts(new_ids - old_ids, 1)
+    adjust_subject_counts(old_ids - new_ids, -1)
+
+def backfill_book_subjects(batch_size=500):
+    """Link every book to the subjects in its subject string, committing once per batch"""
+    linked = 0
+    last_id = 0
+    while True:
+        books = Book.query.filter(Book.id > last_id).order_by(Book.id).limit(batch_size).all()
+        if not books:
+            break
+        for book in books:
+            sync_book_subjects(book)
+        db.session.commit()
+        linked += len(books)
+        last_id = books[-1].id
+    bump_versions('catalog')
+    db.session.commit()
+    return linked
+
+def books_with_subjects(slugs):
+    """Subquery of ids of books tagged with any of the given subject slugs"""
+    return db.select(book_subject.c.book_id).join(
+        Subject, Subject.id == book_subject.c.subject_id
+    ).where(Subject.slug.in_(slugs))
+
+# Notifications
+# Streams are woken through notification_hub, but only after the rows commit:
+# send_notifications() records who to wake on the session and the commit hook publishes.
+NOTIFY_USERS_KEY = 'notify_users'
+
+def send_notifications(rows):
+    """Insert Notification rows (dicts); each user's open streams wake once the transaction commits"""
+    if not rows:
+        return
+    db.session.execute(db.insert(Notification), rows)
+    db.session.info.setdefault(NOTIFY_USERS_KEY, set()).update(row['user_id'] for row in rows)
+
+def return_notice(user_id, title, fine_amount, now):
+    """Notification row confirming a return, with the overdue fine if one applies"""
+    message = f'You returned "{title}".'
+    if fine_amount > 0:
+        message += f' An overdue fine of ${fine_amount:.2f} has been added to your account.'
+    return {
+        'user_id': user_id,
+        'title': 'Book Returned',
+        'message': message,
+        'type': 'warning' if fine_amount > 0 else 'info',
+        'created_at': now
+    }
+
+@db.event.listens_for(db.session, 'after_commit')
+def publish_committed_notifications(session):
+    user_ids = session.info.pop(NOTIFY_USERS_KEY, None)
+    if user_ids:
+        notification_hub.publish(user_ids)
+
+@db.event.listens_for(db.session, 'after_soft_rollback')
+def drop_rolled_back_notifications(session, previous_transaction):
+    # A savepoint rolling back leaves the rest of the transaction's notifications in place
+    if not previous_transaction.nested:
+        session.info.pop(NOTIFY_USERS_KEY, None)
+
+# Book Copies
+# Book.total_copies/available_copies stay the counters circulation checks; BookCopy
+# rows track which physical copy each loan took. A copy is on loan while an open
+# Borrowing points at it, so returns never need to touch the copy row.
+LENDABLE_COPY_CONDITIONS = ('good', 'damaged')
+
+def copy_barcode(book_id, copy_number):
+    """Barcode assigned to a new copy: zero-padded book id and copy number"""
+    return f'{book_id:08d}{copy_number:04d}'
+
+def add_book_copies(counts, now):
+    """Create copies for {book_id: n}, numbered after each book's existing copies"""
+    counts = {book_id: n for book_id, n in counts.items() if n > 0}
+    if not counts:
+        return
+    last = dict(db.session.query(BookCopy.book_id, db.func.max(BookCopy.copy_number)).filter(
+        BookCopy.book_id.in_(list(counts))
+    ).group_by(BookCopy.book_id))
+    shelves = dict(db.session.query(Book.id, Book.shelf_location).filter(Book.id.in_(list(counts))))
+    db.session.execute(db.insert(BookCopy), [{
+        'book_id': book_id,
+        'copy_number': number,
+        'barcode': copy_barcode(book_id, number),
+        'shelf_position': shelves.get(book_id),
+        'condition': 'good',
+        'created_at': now
+    } for book_id, n in counts.items() for number in range(last.get(book_id, 0) + 1, last.get(book_id, 0) + n + 1)])
+
+def copy_on_loan():
+    """EXISTS clause: the copy in the outer query is out on an open loan"""
+    return db.select(Borrowing.id).where(
+        Borrowing.copy_id == BookCopy.id,
+        Borrowing.status.in_(ACTIVE_LOAN_STATUSES)
+    ).exists()
+
+def sync_book_copies(book, now):
+    """Add or withdraw copies so the copies in service match book.total_copies"""
+    in_service = BookCopy.query.filter(BookCopy.book_id == book.id, BookCopy.condition != 'withdrawn').count()
+    if (book.total_copies or 0) > in_service:
+        add_book_copies({book.id: book.total_copies - in_service}, now)
+    elif (book.total_copies or 0) < in_service:
+        # Withdraw the highest-numbered copies that are on the shelf
+        surplus = db.session.execute(
+            db.select(BookCopy.id).where(
+                BookCopy.book_id == book.id,
+                BookCopy.condition != 'withdrawn',
+                ~copy_on_loan()
+            ).order_by(BookCopy.copy_number.desc()).limit(in_service - book.total_copies)
+        ).scalars().all()
+        db.session.execute(
+            db.update(BookCopy).where(BookCopy.id.in_(surplus)).values(condition='withdrawn'),
+            execution_options={'synchronize_session': False}
+        )
+
+def checkout_copies(loans):
+    """Put a free copy on each new loan [(borrowing_id, book_id)]; returns {borrowing_id: copy_id}.
+
+    Free copies are claimed with SKIP LOCKED, so concurrent checkouts of one
+    title take different copies. A loan finds no copy only when the book has no
+    free copy records, and then keeps a NULL copy_id.
+    """
+    by_book = {}
+    for borrowing_id, book_id in loans:
+        by_book.setdefault(book_id, []).append(borrowing_id)
+    assigned = {}
+    for book_id in sorted(by_book):
+        free = db.session.execute(
+            db.select(BookCopy.id).where(
+                BookCopy.book_id == book_id,
+                BookCopy.condition.in_(LENDABLE_COPY_CONDITIONS),
+                ~copy_on_loan()
+            ).order_by(BookCopy.copy_number).limit(len(by_book[book_id]))
+            .with_for_update(of=BookCopy, skip_locked=True)
+        ).scalars().all()
+        assigned.update(zip(by_book[book_id], free))
+    if assigned:
+        db.session.execute(
+            db.update(Borrowing).where(Borrowing.id.in_(list(assigned)))
+            .values(copy_id=db.case(assigned, value=Borrowing.id)),
+            execution_options={'synchronize_session': False}
+        )
+    return assigned
+
+def backfill_book_copies(batch_size=500):
+    """Create copy records for books that have none and put their open loans on them; returns books done"""
+    done = 0
+    last_id = 0
+    now = datetime.utcnow()
+    while True:
+        books = db.session.query(Book.id, Book.total_copies).filter(
+            Book.id > last_id,
+            ~db.select(BookCopy.id).where(BookCopy.book_id == Book.id).exists()
+        ).order_by(Book.id).limit(batch_size).all()
+        if not books:
+            break
+        last_id = books[-1].id
+        open_loans = db.session.query(Borrowing.id, Borrowing.book_id).filter(
+            Borrowing.book_id.in_([book.id for book in books]),
+            Borrowing.status.in_(ACTIVE_LOAN_STATUSES),
+            Borrowing.copy_id.is_(None)
+        ).all()
+        # Never fewer copies than are out on loan
+        loans_per_book = {}
+        for loan in open_loans:
+            loans_per_book[loan.book_id] = loans_per_book.get(loan.book_id, 0) + 1
+        add_book_copies({
+            book.id: max(book.total_copies or 0, loans_per_book.get(book.id, 0)) for book in books
+        }, now)
+        checkout_copies([(loan.id, loan.book_id) for loan in open_loans])
+        db.session.commit()
+        done += len(books)
+    return done
+
+# Circulation
+LOAN_PERIOD_DAYS = 14       # 2 weeks loan period
+RENEWAL_PERIOD_DAYS = 14    # each renewal extends the due date by 2 weeks
+FINE_PER_DAY = 0.50         # $0.50 per day overdue
+MAX_BATCH_ITEMS = 500       # items accepted by one bulk circulation request
+ACTIVE_LOAN_STATUSES = ('borrowed', 'overdue')  # open loans; the sweeper moves past-due ones to overdue
+DUE_SOON_DAYS = 2           # due-soon reminders go out this many days ahead
+OVERDUE_SWEEP_INTERVAL = int(os.getenv('OVERDUE_SWEEP_INTERVAL', '3600'))  # seconds, 0 disables
+
+def overdue_fine(due_date, now):
+    """Return (days_overdue, fine_amount) for a loan returned at `now`"""
+    if now <= due_date:
+        return 0, 0
+    days_overdue = (now - due_date).days
+    return days_overdue, days_overdue * FINE_PER_DAY
+
+def recount_active_loans():
+    """Reset every user's active_loans counter from their open borrowings"""
+    open_loans = db.select(db.func.count(Borrowing.id)).where(
+        Borrowing.user_id == User.id,
+        Borrowing.status.in_(ACTIVE_LOAN_STATUSES)
+    ).scalar_subquery()
+    updated = db.session.execute(db.update(User).values(active_loans=open_loans)).rowcount
+    db.session.commit()
+    return updated
+
+def extend_loan(borrowing, now):
+    """Renew a locked loan; an overdue loan whose new due date is ahead goes back to 'borrowed'"""
+    borrowing.due_date += timedelta(days=RENEWAL_PERIOD_DAYS)
+    borrowing.renewal_count += 1
+    borrowing.last_renewed_at = now
+    db.session.add(Renewal(borrowing_id=borrowing.id, renewed_at=now))
+    borrowing.last_notice = None
+    if borrowing.status == 'overdue' and borrowing.due_date > now:
+        borrowing.status = 'borrowed'
+        bump_counter('overdue', -1)
+
+# Statistics
+# Dashboard counters, kept in step by the code paths that change them and
+# periodically recomputed from the base tables to correct drift
+STAT_COUNTER_SLOTS = 8
+STAT_COUNTERS = (
+    'total_books', 'total_users', 'active_users', 'borrowed', 'overdue',
+    'returned', 'paid_fine_users', 'unpaid_fine_users',
+)
+STATS_RECONCILE_INTERVAL = int(os.getenv('STATS_RECONCILE_INTERVAL', '3600'))  # seconds, 0 disables
+
+def bump_counter(name, delta=1):
+    """Add delta to a counter inside the caller's transaction"""
+    if not delta:
+        return
+    slot = random.randrange(STAT_COUNTER_SLOTS)
+    updated = db.session.execute(
+        db.update(StatCounter).where(StatCounter.name == name, StatCounter.slot == slot)
+        .values(value=StatCounter.value + delta),
+        execution_options={'synchronize_session': False}
+    ).rowcount
+    if updated:
+        return
+    try:
+        with db.session.begin_nested():
+            db.session.add(StatCounter(name=name, slot=slot, value=delta))
+    except IntegrityError:
+        # Another transaction created the slot first
+        db.session.execute(
+            db.update(StatCounter).where(StatCounter.name == name, StatCounter.slot == slot)
+            .values(value=StatCounter.value + delta),
+            execution_options={'synchronize_session': False}
+        )
+
+def read_counters():
+    """Return {name: value} for all counters in one small aggregate"""
+    rows = db.session.query(StatCounter.name, db.func.sum(StatCounter.value)).group_by(StatCounter.name).all()
+    return {name: int(value or 0) for name, value in rows}
+
+def fine_users_with(status, user_ids):
+    """Return the subset of user_ids that have at least one fine in the given status"""
+    if not user_ids:
+        return set()
+    rows = db.session.query(Fine.user_id).filter(
+        Fine.status == status,
+        Fine.user_id.in_(list(user_ids))
+    ).distinct().all()
+    return {user_id for user_id, in rows}
+
+def fine_user_snapshot(user_ids):
+    """Which of these users currently have pending and paid fines"""
+    return fine_users_with('pending', user_ids), fine_users_with('paid', user_ids)
+
+def bump_fine_user_counters(user_ids, before):
+    """Adjust the fine-user counters after fines for these users changed (caller has flushed)"""
+    pending_before, paid_before = before
+    pending_after, paid_after = fine_user_snapshot(user_ids)
+    bump_counter('unpaid_fine_users', len(pending_after - pending_before) - len(pending_before - pending_after))
+    bump_counter('paid_fine_users', len(paid_after - paid_before) - len(paid_before - paid_after))
+
+def compute_counters():
+    """Recompute every counter from the base tables"""
+    return {
+        'total_books': Book.query.count(),
+        'total_users': User.query.count(),
+        'active_users': User.query.filter_by(status='active').count(),
+        'borrowed': Borrowing.query.filter(Borrowing.status.in_(ACTIVE_LOAN_STATUSES)).count(),
+        'overdue': Borrowing.query.filter_by(status='overdue').count(),
+        'returned': Borrowing.query.filter_by(status='returned').count(),
+        'paid_fine_users': db.session.query(Fine.user_id).filter(Fine.status == 'paid').distinct().count(),
+        'unpaid_fine_users': db.session.query(Fine.user_id).filter(Fine.status == 'pending').distinct().count(),
+    }
+
+def reconcile_stat_counters():
+    """Rewrite all counters (and subject book counts) from the base tables; returns the fresh values"""
+    replica_routing.use_primary()
+    values = compute_counters()
+    for name, value in values.items():
+        db.session.query(StatCounter).filter(StatCounter.name == name).delete(synchronize_session=False)
+        db.session.add_all([
+            StatCounter(name=name, slot=slot, value=value if slot == 0 else 0)
+            for slot in range(STAT_COUNTER_SLOTS)
+        ])
+    
+    linked = db.select(db.func.count()).where(book_subject.c.subject_id == Subject.id).scalar_subquery()
+    db.session.execute(db.update(Subject).values(book_count=linked), execution_options={'synchronize_session': False})
+    bump_versions('catalog', 'circulation', 'users')
+    db.session.commit()
+    return values
+
+def reconcile_stat_counters_job():
+    with app.app_context():
+        reconcile_stat_counters()
+
+# Overdue Sweeper
+# Moves past-due loans to 'overdue', accrues their fines and sends reminders,
+# one short transaction per batch so returns and renewals never wait long
+def accrue_overdue_fines(loans, now):
+    """Bring the overdue fines of (borrowing_id, user_id, due_date) loans up to date.
+
+    Paid and waived overdue fines count toward what is owed; the remainder is
+    carried by a single pending fine per loan, raised in place as days pass.
+    Returns the number of fines created or raised.
+    """
+    owed = {}
+    for borrowing_id, user_id, due_date in loans:
+        _, amount = overdue_fine(due_date, now)
+        if amount > 0:
+            owed[borrowing_id] = (user_id, amount)
+    if not owed:
+        return 0
+
+    # Locking read, so a concurrent sweep or return sees the latest fines
+    settled, pending = {}, {}
+    for fine_id, borrowing_id, amount, status in db.session.query(
+        Fine.id, Fine.borrowing_id, Fine.amount, Fine.status
+    ).filter(Fine.borrowing_id.in_(list(owed)), Fine.reason == 'overdue').with_for_update():
+        if status == 'pending':
+            pending[borrowing_id] = (fine_id, amount)
+        else:
+            settled[borrowing_id] = settled.get(borrowing_id, 0) + amount
+
+    raised, created = [], []
+    for borrowing_id, (user_id, amount) in owed.items():
+        outstanding = round(amount - settled.get(borrowing_id, 0), 2)
+        if borrowing_id in pending:
+            fine_id, current = pending[borrowing_id]
+            if outstanding > current:
+                raised.append({'id': fine_id, 'amount': outstanding})
+        elif outstanding > 0:
+            created.append({
+                'user_id': user_id,
+                'borrowing_id': borrowing_id,
+                'amount': outstanding,
+                'reason': 'overdue',
+                'status': 'pending',
+                'created_at': now
+            })
+
+    if raised:
+        db.session.execute(db.update(Fine), raised, execution_options={'synchronize_session': False})
+    if created:
+        fined_users = {fine['user_id'] for fine in created}
+        before = fine_user_snapshot(fined_users)
+        db.session.execute(db.insert(Fine), created)
+        bump_fine_user_counters(fined_users, before)
+    return len(raised) + len(created)
+
+def loan_batches(filters, batch_size):
+    """Yield locked batches of matching loans, walking the (status, due_date) index.
+
+    Rows another transaction holds (a return in progress) are skipped until the next run.
+    """
+    last_key = None
+    while True:
+        query = db.session.query(
+            Borrowing.id, Borrowing.user_id, Borrowing.due_date, Borrowing.status,
+            Borrowing.last_notice, Book.title
+        ).join(Book, Book.id == Borrowing.book_id).filter(*filters)
+        if last_key:
+            query = query.filter(pagination.after_key((Borrowing.due_date, Borrowing.id), last_key))
+        rows = query.order_by(Borrowing.due_date, Borrowing.id).limit(batch_size).with_for_update(
+            of=Borrowing, skip_locked=True
+        ).all()
+        if not rows:
+            return
+        yield rows
+        last_key = (rows[-1].due_date, rows[-1].id)
+        if len(rows) < batch_size:
+            return
+
+def sweep_overdue_loans(batch_size=1000):
+    """Mark past-due loans overdue, accrue fines and send reminders; returns per-step totals"""
+    now = datetime.utcnow()
+    totals = {'marked_overdue': 0, 'fined': 0, 'overdue_notices': 0, 'due_soon_notices': 0}
+
+    # Already-overdue loans first, so loans marked in this run aren't walked twice
+    for status in ('overdue', 'borrowed'):
+        for rows in loan_batches([Borrowing.status == status, Borrowing.due_date < now], batch_size):
+            if status == 'borrowed':
+                marked = db.session.execute(
+                    db.update(Borrowing).where(
+                        Borrowing.id.in_([row.id for row in rows]),
+                        Borrowing.status == 'borrowed'
+                    ).values(status='overdue'),
+                    execution_options={'synchronize_session': False}
+                ).rowcount
+                bump_counter('overdue', marked)
+                totals['marked_overdue'] += marked
+
+            totals['fined'] += accrue_overdue_fines([(row.id, row.user_id, row.due_date) for row in rows], now)
+
+            unnotified = [row for row in rows if row.last_notice != 'overdue']
+            if unnotified:
+                send_notifications([{
+                    'user_id': row.user_id,
+                    'title': 'Book Overdue',
+                    'message': f'"{row.title}" was due on {row.due_date.strftime("%B %d, %Y")}. '
+                               f'A fine of ${FINE_PER_DAY:.2f} per day applies until it is returned.',
+                    'type': 'warning',
+                    'created_at': now
+                } for row in unnotified])
+                db.session.execute(
+                    db.update(Borrowing).where(Borrowing.id.in_([row.id for row in unnotified]))
+                    .values(last_notice='overdue'),
+                    execution_options={'synchronize_session': False}
+                )
+                totals['overdue_notices'] += len(unnotified)
+
+            bump_versions('circulation')
+            db.session.commit()
+
+    due_soon = [
+        Borrowing.status == 'borrowed',
+        Borrowing.due_date >= now,
+        Borrowing.due_date < now + timedelta(days=DUE_SOON_DAYS),
+        Borrowing.last_notice.is_(None),
+    ]
+    for rows in loan_batches(due_soon, batch_size):
+        send_notifications([{
+            'user_id': row.user_id,
+            'title': 'Book Due Soon',
+            'message': f'"{row.title}" is due on {row.due_date.strftime("%B %d, %Y")}. '
+                       f'Return or renew it to avoid a fine.',
+            'type': 'info',
+            'created_at': now
+        } for row in rows])
+        db.session.execute(
+            db.update(Borrowing).where(Borrowing.id.in_([row.id for row in rows]))
+            .values(last_notice='due_soon'),
+            execution_options={'synchronize_session': False}
+        )
+        totals['due_soon_notices'] += len(rows)
+        bump_versions('circulation')
+        db.session.commit()
+
+    return totals
+
+def sweep_overdue_loans_job():
+    with app.app_context():
+        sweep_overdue_loans()
+
+# Hold Queue
+# Per-book waitlist. Every queue change locks the book row first, so positions are
+# assigned and compacted without races, and a returned copy goes to the head of the
+# queue in the returning transaction instead of back on the shelf.
+OPEN_HOLD_STATUSES = ('active', 'ready')  # queued, or a copy is held at the desk
+HOLD_QUEUE_DAYS = 30        # a queued hold lapses if it isn't reached within this time
+HOLD_PICKUP_DAYS = 7        # a ready hold keeps its copy this long
+HOLD_EXPIRY_INTERVAL = int(os.getenv('HOLD_EXPIRY_INTERVAL', '3600'))  # seconds, 0 disables
+
+def lock_book(book_id):
+    """Take the book row lock that serializes its queue; returns the title, or None if missing"""
+    return db.session.execute(
+        db.select(Book.title).where(Book.id == book_id).with_for_update()
+    ).scalar()
+
+def close_queue_gaps(book_id, positions):
+    """Move later holds up after queued holds at these positions left the queue"""
+    for position in sorted(positions, reverse=True):
+        db.session.execute(
+            db.update(Reservation).where(
+                Reservation.book_id == book_id,
+                Reservation.status == 'active',
+                Reservation.priority > position
+            ).values(priority=Reservation.priority - 1),
+            execution_options={'synchronize_session': False}
+        )
+
+def release_copies(book_id, title, count, now):
+    """Give freed copies of a locked book to the head of its queue; the rest go back on the shelf"""
+    heads = db.session.query(Reservation.id, Reservation.user_id).filter(
+        Reservation.book_id == book_id,
+        Reservation.status == 'active'
+    ).order_by(Reservation.priority).limit(count).all()
+    if heads:
+        pickup_by = now + timedelta(days=HOLD_PICKUP_DAYS)
+        db.session.execute(
+            db.update(Reservation).where(Reservation.id.in_([hold.id for hold in heads]))
+            .values(status='ready', priority=0, expiry_date=pickup_by),
+            execution_options={'synchronize_session': False}
+        )
+        # Heads held positions 1..n, so everyone behind moves up by n
+        db.session.execute(
+            db.update(Reservation).where(
+                Reservation.book_id == book_id,
+                Reservation.status == 'active'
+            ).values(priority=Reservation.priority - len(heads)),
+            execution_options={'synchronize_session': False}
+        )
+        send_notifications([{
+            'user_id': hold.user_id,
+            'title': 'Reserved Book Ready',
+            'message': f'"{title}" is waiting for you at the circulation desk until {pickup_by.strftime("%B %d, %Y")}.',
+            'type': 'success',
+            'created_at': now
+        } for hold in heads])
+    shelved = count - len(heads)
+    if shelved:
+        db.session.execute(
+            db.update(Book).where(Book.id == book_id)
+            .values(available_copies=Book.available_copies + shelved),
+            execution_options={'synchronize_session': False}
+        )
+    return len(heads)
+
+def close_holds(book_id, title, holds, status, now):
+    """Close open holds of a locked book; queued ones leave a gap, ready ones free their copy"""
+    if not holds:
+        return
+    db.session.execute(
+        db.update(Reservation).where(Reservation.id.in_([hold.id for hold in holds]))
+        .values(status=status),
+        execution_options={'synchronize_session': False}
+    )
+    close_queue_gaps(book_id, [hold.priority for hold in holds if hold.status == 'active'])
+    ready = sum(1 for hold in holds if hold.status == 'ready')
+    if ready:
+        release_copies(book_id, title, ready, now)
+
+def open_holds(filters):
+    """Locking read of open holds, so decisions use the state under the book lock"""
+    return db.session.query(
+        Reservation.id, Reservation.user_id, Reservation.status, Reservation.priority
+    ).filter(Reservation.status.in_(OPEN_HOLD_STATUSES), *filters).with_for_update().all()
+
+def expire_holds(batch_size=500):
+    """Expire lapsed queued holds and uncollected ready holds; returns how many expired"""
+    now = datetime.utcnow()
+    expired = 0
+    while True:
+        batch = db.session.query(Reservation.id, Reservation.book_id).filter(
+            Reservation.status.in_(OPEN_HOLD_STATUSES),
+            Reservation.expiry_date < now
+        ).limit(batch_size).all()
+        if not batch:
+            return expired
+
+        by_book = {}
+        for hold in batch:
+            by_book.setdefault(hold.book_id, []).append(hold.id)
+        notices = []
+        # Book locks in id order, the same order every batch takes them
+        for book_id in sorted(by_book):
+            title = lock_book(book_id)
+            holds = open_holds([Reservation.id.in_(by_book[book_id]), Reservation.expiry_date < now])
+            close_holds(book_id, title, holds, 'expired', now)
+            notices.extend({
+                'user_id': hold.user_id,
+                'title': 'Reservation Expired',
+                'message': f'Your reservation for "{title}" has expired.',
+                'type': 'warning',
+                'created_at': now
+            } for hold in holds)
+        if notices:
+            send_notifications(notices)
+        expired += len(notices)
+        bump_versions('circulation')
+        db.session.commit()
+        if len(batch) < batch_size:
+            return expired
+
+def expire_holds_job():
+    with app.app_context():
+        expire_holds()
+
+def renumber_hold_queues():
+    """Rewrite every queue's positions as 1..n in (priority, reserved_date) order; returns books touched"""
+    book_ids = [book_id for book_id, in db.session.query(Reservation.book_id).filter(
+        Reservation.status == 'active'
+    ).distinct().order_by(Reservation.book_id)]
+    for book_id in book_ids:
+        lock_book(book_id)
+        queue = db.session.query(Reservation.id, Reservation.priority).filter(
+            Reservation.book_id == book_id,
+            Reservation.status == 'active'
+        ).order_by(Reservation.priority, Reservation.reserved_date, Reservation.id).all()
+        moved = [{'id': hold.id, 'priority': position}
+                 for position, hold in enumerate(queue, start=1) if hold.priority != position]
+        if moved:
+            db.session.execute(db.update(Reservation), moved, execution_options={'synchronize_session': False})
+        db.session.commit()
+    return len(book_ids)
+
+# Circulation Rollup
+# Closed days are counted once into circulation_daily, so reports read a few
+# hundred small rows instead of scanning a year of borrowings
+CIRCULATION_SERIES = ('borrows', 'returns', 'late_returns', 'renewals')
+ROLLUP_BATCH_DAYS = 31
+CIRCULATION_ROLLUP_INTERVAL = int(os.getenv('CIRCULATION_ROLLUP_INTERVAL', '3600'))  # seconds, 0 disables
+
+def day_start(day):
+    return datetime.combine(day, datetime.min.time())
+
+def daily_circulation(start, end):
+    """Count circulation events per UTC day in [start, end) with grouped SQL; returns {date: counts}"""
+    days = {}
+
+    def count_by_day(name, column, *filters):
+        day = db.func.date(column)
+        for value, count in db.session.query(day, db.func.count()).filter(
+            column >= start, column < end, *filters
+        ).group_by(day):
+            if isinstance(value, str):
+                value = date.fromisoformat(value)
+            days.setdefault(value, dict.fromkeys(CIRCULATION_SERIES, 0))[name] = count
+
+    count_by_day('borrows', Borrowing.borrowed_date)
+    count_by_day('returns', Borrowing.returned_date)
+    count_by_day('late_returns', Borrowing.returned_date, Borrowing.returned_date > Borrowing.due_date)
+    count_by_day('renewals', Renewal.renewed_at)
+    return days
+
+def rollup_rows(start, end):
+    """CirculationDaily rows for every day in [start, end), quiet days included"""
+    counts = daily_circulation(day_start(start), day_start(end))
+    return [
+        {'day': start + timedelta(days=offset),
+         **counts.get(start + timedelta(days=offset), dict.fromkeys(CIRCULATION_SERIES, 0))}
+        for offset in range((end - start).days)
+    ]
+
+def insert_rollup_rows(rows):
+    """Insert rollup days, skipping any another rollup (the job in another process, a rebuild) wrote first"""
+    db.session.execute(
+        db.insert(CirculationDaily).prefix_with('IGNORE', dialect='mysql').prefix_with('OR IGNORE', dialect='sqlite'),
+        rows
+    )
+
+def first_circulation_day():
+    first_borrowing = db.session.query(db.func.min(Borrowing.borrowed_date)).scalar()
+    return first_borrowing.date() if first_borrowing else None
+
+def rollup_circulation(batch_days=ROLLUP_BATCH_DAYS):
+    """Roll closed days into circulation_daily, continuing after the last rolled-up day; returns days written"""
+    replica_routing.use_primary()  # progress is read where the rows are written
+    today = datetime.utcnow().date()
+    last_day = db.session.query(db.func.max(CirculationDaily.day)).scalar()
+    start = last_day + timedelta(days=1) if last_day else first_circulation_day()
+    if start is None:
+        return 0
+
+    written = 0
+    while start < today:
+        end = min(start + timedelta(days=batch_days), today)
+        # Every day gets a row, even a quiet one, so the last row marks progress
+        insert_rollup_rows(rollup_rows(start, end))
+        db.session.commit()
+        written += (end - start).days
+        start = end
+    return written
+
+def rebuild_circulation_rollup(batch_days=ROLLUP_BATCH_DAYS):
+    """Recompute the whole rollup, e.g. after loans were imported with past dates; returns days written.
+
+    One transaction: reports keep reading the old rows until the new ones commit.
+    """
+    replica_routing.use_primary()
+    today = datetime.utcnow().date()
+    db.session.query(CirculationDaily).delete()
+    start = first_circulation_day()
+    written = 0
+    while start is not None and start < today:
+        end = min(start + timedelta(days=batch_days), today)
+        insert_rollup_rows(rollup_rows(start, end))
+        written += (end - start).days
+        start = end
+    db.session.commit()
+    return written
+
+def rollup_circulation_job():
+    with app.app_context():
+        rollup_circulation()
+
+# HTTP Caching
+# Read endpoints answer conditional GETs from data version stamps, before running their queries
+API_CACHE_MAX_AGE = int(os.getenv('API_CACHE_MAX_AGE', '0'))
+PAGE_CACHE_MAX_AGE = int(os.getenv('PAGE_CACHE_MAX_AGE', '300'))
+
+def bump_versions(*names):
+    """Mark data scopes as changed inside the caller's transaction"""
+    now = datetime.utcnow()
+    for name in names:
+        slot = random.randrange(STAT_COUNTER_SLOTS)
+        updated = db.session.execute(
+            db.update(DataVersion).where(DataVersion.name == name, DataVersion.slot == slot)
+            .values(version=DataVersion.version + 1, updated_at=now),
+            execution_options={'synchronize_session': False}
+        ).rowcount
+        if updated:
+            continue
+        try:
+            with db.session.begin_nested():
+                db.session.add(DataVersion(name=name, slot=slot, version=1, updated_at=now))
+        except IntegrityError:
+            db.session.execute(
+                db.update(DataVersion).where(DataVersion.name == name, DataVersion.slot == slot)
+                .values(version=DataVersion.version + 1, updated_at=now),
+                execution_options={'synchronize_session': False}
+            )
+
+def read_versions(names):
+    """Return (version tag, last modified) for a set of data scopes"""
+    rows = db.session.query(
+        DataVersion.name,
+        db.func.sum(DataVersion.version),
+        db.func.max(DataVersion.updated_at)
+    ).filter(DataVersion.name.in_(names)).group_by(DataVersion.name).all()
+    versions = {name: (int(version), updated_at) for name, version, updated_at in rows}
+    tag = '.'.join(f'{name}{versions.get(name, (0, None))[0]}' for name in names)
+    stamps = [updated_at for _, updated_at in versions.values() if updated_at]
+    return tag, max(stamps) if stamps else None
+
+def not_modified(etag, last_modified):
+    """True if the request's validators match the current representation"""
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if request.if_modified_since and last_modified:
+        return last_modified.replace(microsecond=0, tzinfo=timezone.utc) <= request.if_modified_since
+    return False
+
+def cacheable(response, etag, last_modified, max_age):
+    response.set_etag(etag, weak=True)
+    if last_modified:
+        response.last_modified = last_modified.replace(tzinfo=timezone.utc)
+    response.cache_control.public = True
+    response.cache_control.max_age = max_age
+    response.cache_control.must_revalidate = True
+    return response
+
+def conditional(*scopes, max_age=None, daily=False):
+    """Serve 304 Not Modified when none of the data scopes changed since the client's copy.
+    
+    `daily` folds today's date into the validator for views that count "today" activity.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            tag, last_modified = read_versions(scopes)
+            parts = [request.full_path, tag]
+            if daily:
+                parts.append(datetime.utcnow().date().isoformat())
+            etag = hashlib.sha1('|'.join(parts).encode('utf-8')).hexdigest()
+            age = API_CACHE_MAX_AGE if max_age is None else max_age
+            
+            if not_modified(etag, last_modified):
+                return cacheable(app.response_class(status=304), etag, last_modified, age)
+            
+            response = make_response(view(*args, **kwargs))
+            if response.status_code == 200:
+                cacheable(response, etag, last_modified, age)
+            return response
+        return wrapper
+    return decorator
+
+def render_page(template):
+    """render_template for static pages, validated by the template file's mtime and size"""
+    path = os.path.join(app.root_path, app.template_folder, template)
+    stat = os.stat(path)
+    etag = hashlib.sha1(f'{template}|{stat.st_mtime_ns}|{stat.st_size}'.encode('utf-8')).hexdigest()
+    last_modified = datetime.utcfromtimestamp(int(stat.st_mtime))
+    
+    if not_modified(etag, last_modified):
+        return cacheable(app.response_class(status=304), etag, last_modified, PAGE_CACHE_MAX_AGE)
+    return cacheable(make_response(render_template(template)), etag, last_modified, PAGE_CACHE_MAX_AGE)
+
+# Read Replicas
+# Views marked @read_only query a replica when one is healthy. A client that just
+# wrote (session cookie) or a user something was just done for (a notification
+# committed for them) reads from the primary until the replicas have caught up.
+PRIMARY_UNTIL_KEY = 'db_primary_until'
+
+def recently_notified(user_id):
+    """True if a notification was committed for the user within the sticky window.
+
+    Asked of the primary, so every worker process gives the same answer.
+    """
+    since = datetime.utcnow() - timedelta(seconds=replica_routing.STICKY_SECONDS)
+    return db.session.query(Notification.id).filter(
+        Notification.user_id == user_id,
+        Notification.read.in_((False, True)),  # lets the (user_id, read, created_at) index range over created_at
+        Notification.created_at > since
+    ).first() is not None
+
+def reads_own_writes():
+    if session.get(PRIMARY_UNTIL_KEY, 0) > time.time():
+        return True
+    return 'user_id' in session and recently_notified(session['user_id'])
+
+def read_only(view):
+    """Serve a view from a read replica, falling back to the primary if the replica fails mid-request"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not replica_routing.BIND_KEYS or reads_own_writes():
+            return view(*args, **kwargs)
+        replica = g.db_replica = replica_routing.choose_replica(db.engines)
+        try:
+            return view(*args, **kwargs)
+        except OperationalError:
+            if replica is None or g.get('db_replica') != replica:
+                raise
+            replica_routing.mark_down(replica)
+            db.session.rollback()
+            g.db_replica = None
+            return view(*args, **kwargs)
+        finally:
+            g.db_replica = None
+    return wrapper
+
+@app.after_request
+def stick_writer_to_primary(response):
+    if replica_routing.BIND_KEYS and request.method not in ('GET', 'HEAD', 'OPTIONS') and response.status_code < 400:
+        session[PRIMARY_UNTIL_KEY] = time.time() + replica_routing.STICKY_SECONDS
+    return response
+
+# Metrics
+# Request hooks time every response and count its queries per endpoint; pool gauges
+# are read when scraped and business counters are bumped once their writes commit.
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')  # when set, GET /metrics needs "Authorization: Bearer <token>"
+METRIC_METHODS = {'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'}
+
+REQUEST_LATENCY = metrics.Histogram(
+    'library_http_request_duration_seconds', 'Time to produce a response', ('endpoint', 'method')
+)
+REQUEST_STATUS = metrics.Counter(
+    'library_http_responses_total', 'Responses sent', ('endpoint', 'method', 'status')
+)
+REQUEST_QUERIES = metrics.Histogram(
+    'library_http_request_queries', 'Database queries run per request', ('endpoint',), buckets=metrics.COUNT_BUCKETS
+)
+BORROWS = metrics.Counter('library_borrows_total', 'Books checked out', ('channel',))
+RETURNS = metrics.Counter('library_returns_total', 'Books returned', ('channel',))
+RENEWALS = metrics.Counter('library_renewals_total', 'Loans renewed', ('channel',))
+LOGINS = metrics.Counter('library_logins_total', 'Login attempts', ('role', 'outcome'))
+
+def connection_pools():
+    return {
+        (key or 'primary',): engine.pool
+        for key, engine in db.engines.items() if isinstance(engine.pool, QueuePool)
+    }
+
+metrics.Gauge(
+    'library_db_pool_size', 'Connections a pool keeps open', ('pool',),
+    collect=lambda: {labels: pool.size() for labels, pool in connection_pools().items()}
+)
+metrics.Gauge(
+    'library_db_pool_connections', 'Open pooled connections by state', ('pool', 'state'),
+    collect=lambda: {
+        labels + (state,): count
+        for labels, pool in connection_pools().items()
+        for state, count in (('in_use', pool.checkedout()), ('idle', pool.checkedin()))
+    }
+)
+metrics.Gauge(
+    'library_db_pool_overflow', 'Connections open beyond the pool size', ('pool',),
+    collect=lambda: {labels: max(pool.overflow(), 0) for labels, pool in connection_pools().items()}
+)
+
+@app.before_request
+def start_request_metrics():
+    g.request_started = time.perf_counter()
+    g.db_queries = 0
+
+@db.event.listens_for(Engine, 'before_cursor_execute')
+def count_query(*args):
+    try:
+        g.db_queries += 1
+    except (AttributeError, RuntimeError):  # not in a request
+        pass
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.get('request_started')
+    if started is not None:
+        endpoint = request.endpoint or 'unmatched'
+        method = request.method if request.method in METRIC_METHODS else 'other'
+        REQUEST_LATENCY.observe(time.perf_counter() - started, endpoint, method)
+        REQUEST_STATUS.inc(endpoint, method, response.status_code)
+        REQUEST_QUERIES.observe(g.db_queries, endpoint)
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    if METRICS_TOKEN and not hmac.compare_digest(
+        request.headers.get('Authorization', ''), f'Bearer {METRICS_TOKEN}'
+    ):
+        return jsonify({'error': 'Unauthorized'}), 401
+    return app.response_class(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+# Query Profiler
+# Opt-in (QUERY_PROFILER=1): each request's statements are recorded and grouped by
+# fingerprint, likely N+1 loads are logged and the query count and time go out in a
+# Server-Timing header. Slow statements are logged whenever the profiler is installed.
+if query_profiler.ENABLED or query_profiler.SLOW_QUERY_LOG:
+    query_profiler.install()
+
+@app.before_request
+def start_query_profile():
+    if query_profiler.ENABLED:
+        g.query_profile, g.query_profile_token = query_profiler.start(f'{request.method} {request.path} ({request.endpoint})')
+
+@app.after_request
+def report_query_profile(response):
+    profile = g.get('query_profile')
+    if profile is not None:
+        query_profiler.log_profile(profile)
+        response.headers.add('Server-Timing', f'db;dur={profile.total_seconds * 1000:.1f};desc="{len(profile.statements)} queries"')
+    return response
+
+@app.teardown_request
+def finish_query_profile(exc):
+    token = g.pop('query_profile_token', None)
+    if token is not None:
+        query_profiler.finish(token)
+
+@app.route('/api/admin/query-profiles', methods=['GET'])
+def query_profiles():
+    if 'admin_id' not in session:
+        return jsonify({'error': 'Admin not logged in'}), 401
+    if not query_profiler.ENABLED:
+        return jsonify({'error': 'Query profiler is disabled (set QUERY_PROFILER=1)'}), 404
+    
+    profiles = list(query_profiler.recent)
+    if request.args.get('n_plus_one') == '1':
+        profiles = [profile for profile in profiles if profile['n_plus_one']]
+    return jsonify({'profiles': profiles[::-1]})
+
+# Search Index
+def index_book(book):
+    """Replace the search postings for a book (the caller commits)"""
+    BookSearchTerm.query.filter_by(book_id=book.id).delete(synchronize_session=False)
+    terms = search_index.book_terms({
+        'title': book.title,
+        'author': book.author,
+        'isbn': book.isbn,
+        'subject': book.subject,
+        'description': book.description,
+    })
+    db.session.add_all([
+        BookSearchTerm(term=term, book_id=book.id, weight=weight)
+        for term, weight in terms.items()
+    ])
+
+def unindex_book(book_id):
+    """Remove the search postings for a book (the caller commits)"""
+    BookSearchTerm.query.filter_by(book_id=book_id).delete(synchronize_session=False)
+
+def search_scores(search):
+    """Return a (book_id, score) subquery of books matching every search token, or None"""
+    tokens = search_index.parse_query(search)
+    if not tokens:
+        return None
+    
+    conditions = []
+    for token in tokens:
+        if len(token) >= search_index.MIN_PREFIX_LENGTH:
+            # Tokens are plain [a-z0-9], so no LIKE escaping is needed
+            conditions.append(BookSearchTerm.term.like(f'{token}%'))
+        else:
+            conditions.append(BookSearchTerm.term == token)
+    
+    exact = db.or_(*[BookSearchTerm.term == token for token in tokens])
+    score = db.func.sum(BookSearchTerm.weight * db.case((exact, 1.0), else_=search_index.PREFIX_MATCH_FACTOR))
+    tokens_matched = sum(db.func.max(db.case((condition, 1), else_=0)) for condition in conditions)
+    
+    return db.session.query(
+        BookSearchTerm.book_id.label('book_id'),
+        score.label('score')
+    ).filter(db.or_(*conditions)).group_by(BookSearchTerm.book_id).having(
+        tokens_matched == len(conditions)
+    ).subquery()
+
+def rebuild_search_index(batch_size=500):
+    """Re-index every book in id order, committing once per batch"""
+    indexed = 0
+    last_id = 0
+    while True:
+        books = Book.query.options(db.undefer(Book.description)).filter(
+            Book.id > last_id
+        ).order_by(Book.id).limit(batch_size).all()
+        if not books:
+            break
+        for book in books:
+            index_book(book)
+        db.session.commit()
+        indexed += len(books)
+        last_id = books[-1].id
+    bump_versions('catalog')
+    db.session.commit()
+    return indexed
 
 # Routes
 @app.route('/')
 def index():
-    return render_template('index.html')
+    return render_page('index.html')
 
 @app.route('/about')
 @app.route('/about.html')
 def about():
-    return render_template('about.html')
+    return render_page('about.html')
 
 @app.route('/contact')
 @app.route('/contact.html')
 def contact():
-    return render_template('contact.html')
+    return render_page('contact.html')
 
 @app.route('/catalog')
 @app.route('/catalog.html')
 def catalog():
-    return render_template('catalog.html')
+    return render_page('catalog.html')
 
 @app.route('/book-details')
 @app.route('/book-details.html')
 def book_details():
-    return render_template('book-details.html')
+    return render_page('book-details.html')
 
 @app.route('/user-login')
 @app.route('/user-login.html')
 def user_login():
-    return render_template('user-login.html')
+    return render_page('user-login.html')
 
 @app.route('/user-signup')
 @app.route('/user-signup.html')
 def user_signup():
-    return render_template('user-signup.html')
+    return render_page('user-signup.html')
 
 @app.route('/user-dashboard')
 @app.route('/user-dashboard.html')
 def user_dashboard_page():
-    return render_template('user-dashboard.html')
+    return render_page('user-dashboard.html')
 
 @app.route('/user-profile')
 @app.route('/user-profile.html')
 def user_profile():
-    return render_template('user-profile.html')
+    return render_page('user-profile.html')
 
 @app.route('/user-manage')
 @app.route('/user-manage.html')
 def user_manage():
-    return render_template('user-manage.html')
+    return render_page('user-manage.html')
 
 @app.route('/admin-login')
 @app.route('/admin-login.html')
 def admin_login_page():
-    return render_template('admin-login.html')
+    return render_page('admin-login.html')
 
 @app.route('/admin-dashboard')
 @app.route('/admin-dashboard.html')
 def admin_dashboard_page():
-    return render_template('admin-dashboard.html')
+    return render_page('admin-dashboard.html')
 
 @app.route('/admin-dashboard-modern')
 @app.route('/admin-dashboard-modern.html')
 def admin_dashboard_modern():
-    return render_template('admin-dashboard-modern.html')
+    return render_page('admin-dashboard-modern.html')
 
 @app.route('/database-viewer')
 @app.route('/database-viewer.html')
 def database_viewer():
-    return render_template('database-viewer.html')
+    return render_page('database-viewer.html')
 
 @app.route('/admin-login-test')
 @app.route('/admin-login-test.html')
 def admin_login_test():
-    return render_template('admin-login-test.html')
+    return render_page('admin-login-test.html')
 
 @app.route('/login-debug')
 @app.route('/login-debug.html')
 def login_debug():
-    return render_template('login-debug.html')
+    return render_page('login-debug.html')
 
 @app.route('/simple-admin-login')
 @app.route('/simple-admin-login.html')
 def simple_admin_login():
-    return render_template('simple-admin-login.html')
+    return render_page('simple-admin-login.html')
 
 
 # Dashboard API
 @app.route('/api/dashboard/stats', methods=['GET'])
+@read_only
+@conditional('catalog', 'circulation', 'users', daily=True)
 def dashboard_stats():
-    try:
-        # Get statistics from database
-        total_books = Book.query.count()
-        total_users = User.query.count()
-        
-        # Get today's transactions
-        from datetime import date
-        today = date.today()
-        
-        # Count borrowings and returns for today (simplified)
-        borrowed_today = Borrowing.query.filter(
-            db.func.date(Borrowing.borrow_date) == today
-        ).count()
-        
-        returned_today = Borrowing.query.filter(
-            db.func.date(Borrowing.return_date) == today
-        ).count()
-        
-        return jsonify({
-            'totalBooks': total_books,
-            'totalStudents': total_users,
-            'borrowedToday': borrowed_today,
-            'returnedToday': returned_today
-        })
-    except Exception as e:
-        return jsonify({
-            'totalBooks': 4,
-            'totalStudents': 9,
-            'borrowedToday': 5,
-            'returnedToday': 2
-        })
+    counters = read_counters() or reconcile_stat_counters()
+    
+    # Today's transactions, as index-friendly ranges rather than DATE() of every row
+    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    borrowed_today = Borrowing.query.filter(Borrowing.borrowed_date >= today).count()
+    returned_today = Borrowing.query.filter(Borrowing.returned_date >= today).count()
+    
+    return jsonify({
+        'totalBooks': counters.get('total_books', 0),
+        'totalStudents': counters.get('total_users', 0),
+        'borrowedToday': borrowed_today,
+        'returnedToday': returned_today
+    })
 
 # User Authentication & Management
+@app.errorhandler(password_pool.PoolBusy)
+def password_pool_busy(e):
+    # Shed the auth burst quickly; the client retries instead of tying up a worker
+    response = jsonify({'error': 'Server is busy, please try again shortly'})
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
+def upgrade_password_hash(model, account, new_hash):
+    """Store a re-hashed password unless it was changed meanwhile"""
+    if new_hash:
+        db.session.execute(
+            db.update(model).where(model.id == account.id, model.password_hash == account.password_hash)
+            .values(password_hash=new_hash),
+            execution_options={'synchronize_session': False}
+        )
+        db.session.commit()
+
 @app.route('/api/register', methods=['POST'])
 def register():
     data = request.get_json()
@@ -258,7 +1453,7 @@ def register():
     # Create new user
     user = User(
         email=data['email'],
-        password_hash=generate_password_hash(data['password']),
+        password_hash=password_pool.hash_password(data['password']),
         first_name=data['firstName'],
         last_name=data['lastName'],
         user_type=data['userType'],
@@ -268,6 +1463,9 @@ def register():
     )
     
     db.session.add(user)
+    bump_counter('total_users')
+    bump_counter('active_users')
+    bump_versions('users')
     db.session.commit()
     
     return jsonify({'message': 'User registered successfully'}), 201
@@ -277,12 +1475,16 @@ def login():
     data = request.get_json()
     user = User.query.filter_by(email=data['email']).first()
     
-    if user and check_password_hash(user.password_hash, data['password']):
+    matches, new_hash = password_pool.verify_password(user.password_hash, data['password']) if user else (False, None)
+    if matches:
+        upgrade_password_hash(User, user, new_hash)
         if user.status != 'active':
+            LOGINS.inc('user', 'inactive')
             return jsonify({'error': 'Account is suspended or inactive'}), 403
         
         session['user_id'] = user.id
         session['user_type'] = user.user_type
+        LOGINS.inc('user', 'success')
         
         return jsonify({
             'message': 'Login successful',
@@ -296,6 +1498,7 @@ def login():
             }
         })
     
+    LOGINS.inc('user', 'failure')
     return jsonify({'error': 'Invalid credentials'}), 401
 
 @app.route('/api/admin/login', methods=['POST'])
@@ -303,109 +1506,362 @@ def admin_login():
     data = request.get_json()
     admin = Admin.query.filter_by(username=data['username']).first()
     
-    if admin and check_password_hash(admin.password_hash, data['password']):
+    matches, new_hash = password_pool.verify_password(admin.password_hash, data['password']) if admin else (False, None)
+    if matches:
+        upgrade_password_hash(Admin, admin, new_hash)
         session['admin_id'] = admin.id
         session['admin_role'] = admin.role
+        LOGINS.inc('admin', 'success')
         return jsonify({'message': 'Admin login successful', 'role': admin.role})
     
+    LOGINS.inc('admin', 'failure')
     return jsonify({'error': 'Invalid admin credentials'}), 401
 
+# Sparse Fieldsets
+# `?fields=a,b` trims a payload to those keys; views also use the list to skip
+# loading the columns and running the queries behind fields nobody asked for.
+def requested_fields(available, default=None):
+    """Parse ?fields= against the available names; returns (fields in canonical order, error message)"""
+    raw = request.args.get('fields')
+    if raw is None:
+        return list(default or available), None
+    fields = {field.strip() for field in raw.split(',') if field.strip()}
+    unknown = sorted(fields.difference(available))
+    if unknown:
+        return None, f'Unknown fields: {", ".join(unknown)}'
+    if not fields:
+        return None, 'fields must name at least one field'
+    return [field for field in available if field in fields], None
+
 # Book Management
+# Keyset sort orders for cursor pagination: name -> indexed key columns
+BOOK_CURSOR_SORTS = {
+    'id': (Book.id,),
+    'title': (Book.title, Book.id),
+}
+MAX_CURSOR_PAGE_SIZE = 100
+COUNT_ESTIMATE_LIMIT = 10000  # bounded counts stop here and report a lower bound
+
+# List views return these by default; the extra fields (description above all) only on request
+BOOK_SUMMARY_FIELDS = (
+    'id', 'title', 'author', 'isbn', 'subject', 'total_copies', 'available_copies',
+    'shelf_location', 'condition'
+)
+BOOK_LIST_FIELDS = BOOK_SUMMARY_FIELDS + ('publication_year', 'description')
+
+def serialize_book_summary(book, fields=BOOK_SUMMARY_FIELDS):
+    return {field: getattr(book, field) for field in fields}
+
+def load_book_fields(query, fields, *extra_columns):
+    """Restrict a Book query's SELECT list to the requested fields (plus e.g. sort keys)"""
+    return query.options(db.load_only(Book.id, *[getattr(Book, field) for field in fields], *extra_columns))
+
+def filter_books(query, search='', subject='', status=''):
+    """Apply the catalog filters; returns the query and the search score subquery (or None)"""
+    scores = None
+    if search:
+        scores = search_scores(search)
+        if scores is None:
+            query = query.filter(db.false())
+        else:
+            query = query.join(scores, Book.id == scores.c.book_id)
+    
+    if subject:
+        query = query.filter(Book.id.in_(books_with_subjects([subject_slug(subject)])))
+    
+    if status == 'available':
+        query = query.filter(Book.available_copies > 0)
+    elif status == 'borrowed':
+        query = query.filter(Book.available_copies < Book.total_copies)
+    
+    return query, scores
+
+def estimate_count(query, filtered):
+    """Cheap row count: table statistics when unfiltered, otherwise a bounded COUNT"""
+    if not filtered and db.engine.dialect.name == 'mysql':
+        rows = db.session.execute(db.text(
+            "SELECT TABLE_ROWS FROM information_schema.TABLES "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table"
+        ).columns(db.column('TABLE_ROWS')), {'table': Book.__tablename__}).scalar()
+        if rows is not None:
+            return int(rows), False
+    
+    capped = query.with_entities(Book.id).order_by(None).limit(COUNT_ESTIMATE_LIMIT + 1).subquery()
+    count = db.session.query(db.func.count()).select_from(capped).scalar()
+    return min(count, COUNT_ESTIMATE_LIMIT), count > COUNT_ESTIMATE_LIMIT
+
 @app.route('/api/books', methods=['GET'])
+@read_only
+@conditional('catalog', 'circulation')
 def get_books():
+    fields, error = requested_fields(BOOK_LIST_FIELDS, BOOK_SUMMARY_FIELDS)
+    if error:
+        return jsonify({'error': error}), 400
     page = request.args.get('page', 1, type=int)
     per_page = request.args.get('per_page', 12, type=int)
     search = request.args.get('search', '')
     subject = request.args.get('subject', '')
     status = request.args.get('status', '')
     
-    query = Book.query
+    query, scores = filter_books(Book.query, search, subject, status)
     
-    if search:
-        query = query.filter(
-            db.or_(
-                Book.title.ilike(f'%{search}%'),
-                Book.author.ilike(f'%{search}%'),
-                Book.isbn.ilike(f'%{search}%')
-            )
-        )
+    # Passing `cursor` (empty for the first page) switches to keyset pagination
+    if 'cursor' in request.args:
+        return get_books_by_cursor(query, bool(search or subject or status), fields)
     
-    if subject:
-        query = query.filter(Book.subject == subject)
+    if scores is not None:
+        query = query.order_by(scores.c.score.desc(), Book.id)
     
-    if status == 'available':
-        query = query.filter(Book.available_copies > 0)
-    elif status == 'borrowed':
-        query = query.filter(Book.available_copies < Book.total_copies)
-    
-    books = query.paginate(page=page, per_page=per_page, error_out=False)
+    # Count over ids alone, so the COUNT subquery doesn't carry every book column
+    books = load_book_fields(query, fields).paginate(page=page, per_page=per_page, error_out=False, count=False)
+    total = query.with_entities(Book.id).order_by(None).count()
     
     return jsonify({
-        'books': [{
-            'id': book.id,
-            'title': book.title,
-            'author': book.author,
-            'isbn': book.isbn,
-            'subject': book.subject,
-            'total_copies': book.total_copies,
-            'available_copies': book.available_copies,
-            'shelf_location': book.shelf_location,
-            'condition': book.condition
-        } for book in books.items],
-        'total': books.total,
-        'pages': books.pages,
+        'books': [serialize_book_summary(book, fields) for book in books.items],
+        'total': total,
+        'pages': -(-total // books.per_page),
         'current_page': page
     })
 
-@app.route('/api/books/<int:book_id>', methods=['GET'])
-def get_book(book_id):
-    book = Book.query.get_or_404(book_id)
-    
-    # Get borrowing information
-    borrowed_copies = Borrowing.query.filter_by(
-        book_id=book_id, 
-        status='borrowed'
-    ).count()
+def get_books_by_cursor(query, filtered, fields=BOOK_SUMMARY_FIELDS):
+    """Cursor mode of /api/books: constant cost per page at any depth, no OFFSET"""
+    sort = request.args.get('sort', 'id')
+    if sort not in BOOK_CURSOR_SORTS:
+        return jsonify({'error': f'Unsupported sort for cursor pagination: {sort}'}), 400
+    per_page = max(1, min(request.args.get('per_page', 12, type=int), MAX_CURSOR_PAGE_SIZE))
+    count_mode = request.args.get('count', 'none')
+    if count_mode not in ('none', 'estimate', 'exact'):
+        return jsonify({'error': f'Unsupported count mode: {count_mode}'}), 400
+    
+    columns = BOOK_CURSOR_SORTS[sort]
+    page_query = query
+    cursor = request.args.get('cursor', '')
+    if cursor:
+        try:
+            values = pagination.decode_cursor(cursor, sort, len(columns))
+        except pagination.InvalidCursor as e:
+            return jsonify({'error': str(e)}), 400
+        page_query = page_query.filter(pagination.after_key(columns, values))
+    
+    # Fetch one extra row to learn whether another page exists
+    books = load_book_fields(page_query, fields, *columns).order_by(*columns).limit(per_page + 1).all()
+    has_more = len(books) > per_page
+    books = books[:per_page]
+    
+    next_cursor = None
+    if has_more:
+        last = books[-1]
+        next_cursor = pagination.encode_cursor(sort, [getattr(last, column.key) for column in columns])
+    
+    response = {
+        'books': [serialize_book_summary(book, fields) for book in books],
+        'next_cursor': next_cursor,
+        'sort': sort
+    }
+    if count_mode == 'exact':
+        response['total'] = query.with_entities(Book.id).order_by(None).count()
+        response['total_is_estimate'] = False
+    elif count_mode == 'estimate':
+        total, lower_bound = estimate_count(query, filtered)
+        response['total'] = total
+        response['total_is_estimate'] = True
+        response['total_is_lower_bound'] = lower_bound
+    
+    return jsonify(response)
+
+# Faceted Catalog Search
+# Facet name -> grouped expression; filters on a facet are `expression IN (values)`.
+# Subjects are many-to-many, so that facet is counted through book_subject instead.
+CATALOG_FACETS = {
+    'subject': Subject.name,
+    'availability': db.case((Book.available_copies > 0, 'available'), else_='borrowed'),
+    'decade': Book.publication_year - Book.publication_year % 10,
+    'condition': Book.condition,
+}
+CATALOG_SORTS = {
+    'title': (Book.title, Book.id),
+    'author': (Book.author, Book.id),
+    'year': (Book.publication_year.desc(), Book.id),
+    'newest': (Book.created_at.desc(), Book.id),
+    'popularity': ((Book.total_copies - Book.available_copies).desc(), Book.id),
+}
+MAX_CATALOG_PAGE_SIZE = 48
+FACET_VALUE_LIMIT = 30
+
+def catalog_facet_filters(args):
+    """Return {facet: condition} for every facet the client filtered on"""
+    conditions = {}
+    for name, expression in CATALOG_FACETS.items():
+        values = [value for value in args.getlist(name) if value]
+        if name == 'decade':
+            values = [int(value) for value in values if value.lstrip('-').isdigit()]
+        if not values:
+            continue
+        if name == 'subject':
+            conditions[name] = Book.id.in_(books_with_subjects([subject_slug(value) for value in values]))
+        else:
+            conditions[name] = expression.in_(values)
+    return conditions
+
+def catalog_facet_counts(scores, conditions):
+    """Count every facet value plus the filtered total in one UNION ALL statement.
+    
+    Each facet is counted with all filters except its own, so the client can
+    show how many results picking another value of that facet would give.
+    """
+    def counted(facet, value, where):
+        stmt = db.select(
+            db.literal(facet).label('facet'),
+            value.label('value'),
+            db.func.count().label('count')
+        ).select_from(Book)
+        if facet == 'subject':
+            stmt = stmt.join(book_subject, book_subject.c.book_id == Book.id).join(
+                Subject, Subject.id == book_subject.c.subject_id
+            )
+        if scores is not None:
+            stmt = stmt.join(scores, Book.id == scores.c.book_id)
+        return stmt.where(*where)
+    
+    branches = [counted('_total', db.cast(db.null(), db.String(100)), conditions.values())]
+    for name, expression in CATALOG_FACETS.items():
+        value = db.cast(expression, db.String(100))
+        others = [condition for facet, condition in conditions.items() if facet != name]
+        branches.append(counted(name, value, others).group_by(value))
+    
+    total = 0
+    facets = {name: [] for name in CATALOG_FACETS}
+    for row in db.session.execute(db.union_all(*branches)):
+        if row.facet == '_total':
+            total = row.count
+        elif row.value is not None:
+            value = int(float(row.value)) if row.facet == 'decade' else row.value
+            facets[row.facet].append({'value': value, 'count': row.count})
+    
+    for name, values in facets.items():
+        if name == 'decade':
+            values.sort(key=lambda v: v['value'])
+        else:
+            values.sort(key=lambda v: (-v['count'], str(v['value'])))
+        facets[name] = values[:FACET_VALUE_LIMIT]
+    return total, facets
+
+@app.route('/api/catalog/search', methods=['GET'])
+@read_only
+@conditional('catalog', 'circulation')
+def catalog_search():
+    search = request.args.get('q', '')
+    sort = request.args.get('sort', 'relevance' if search else 'title')
+    page = max(1, request.args.get('page', 1, type=int))
+    per_page = max(1, min(request.args.get('per_page', 12, type=int), MAX_CATALOG_PAGE_SIZE))
+    if sort != 'relevance' and sort not in CATALOG_SORTS:
+        return jsonify({'error': f'Unsupported sort: {sort}'}), 400
+    
+    query, scores = filter_books(Book.query, search=search)
+    conditions = catalog_facet_filters(request.args)
+    query = query.filter(*conditions.values())
+    
+    if sort == 'relevance' and scores is not None:
+        query = query.order_by(scores.c.score.desc(), Book.id)
+    else:
+        query = query.order_by(*CATALOG_SORTS.get(sort, CATALOG_SORTS['title']))
     
-    # Calculate availability status
-    status = 'available' if book.available_copies > 0 else 'borrowed'
-    
-    # Get copy details (simulate individual copies)
-    copies = []
-    for i in range(1, book.total_copies + 1):
-        is_available = i <= book.available_copies
-        copy_status = 'available' if is_available else 'borrowed'
-        copies.append({
-            'id': f'copy{i}',
-            'copy_number': i,
-            'location': f'Shelf {book.shelf_location}, Row {(i-1)//3 + 1}',
-            'condition': book.condition.title(),
-            'status': copy_status,
-            'due_date': None if is_available else (datetime.utcnow() + timedelta(days=7)).strftime('%b %d, %Y')
-        })
+    books = query.offset((page - 1) * per_page).limit(per_page).all()
+    total, facets = catalog_facet_counts(scores, conditions)
     
     return jsonify({
-        'id': book.id,
-        'title': book.title,
-        'author': book.author,
-        'isbn': book.isbn,
-        'subject': book.subject,
-        'description': book.description or 'No description available for this book.',
-        'total_copies': book.total_copies,
-        'available_copies': book.available_copies,
-        'borrowed_copies': borrowed_copies,
-        'shelf_location': book.shelf_location,
-        'condition': book.condition,
-        'publication_year': book.publication_year,
-        'status': status,
+        'books': [serialize_book_summary(book) for book in books],
+        'total': total,
+        'pages': (total + per_page - 1) // per_page,
+        'current_page': page,
+        'per_page': per_page,
+        'sort': sort,
+        'facets': facets
+    })
+
+# Detail fields in response order; derived ones name the columns they are computed from
+BOOK_DETAIL_FIELDS = (
+    'id', 'title', 'author', 'isbn', 'subject', 'description', 'total_copies', 'available_copies',
+    'borrowed_copies', 'shelf_location', 'condition', 'publication_year', 'status', 'copies',
+    'publisher', 'pages', 'language', 'format', 'rating', 'rating_count', 'tags'
+)
+BOOK_DETAIL_COLUMNS = {
+    'status': ('available_copies',),
+    'copies': ('available_copies',),
+}
+BOOK_DETAIL_DEFAULTS = {
+    'publisher': 'Academic Press',
+    'pages': 250,
+    'language': 'English',
+    'format': 'Hardcover',
+    'rating': 4.2,
+    'rating_count': 156,
+}
+
+@app.route('/api/books/<int:book_id>', methods=['GET'])
+@read_only
+@conditional('catalog', 'circulation')
+def get_book(book_id):
+    fields, error = requested_fields(BOOK_DETAIL_FIELDS)
+    if error:
+        return jsonify({'error': error}), 400
+    
+    columns = {
+        column for field in fields
+        for column in BOOK_DETAIL_COLUMNS.get(field, (field,) if field in Book.__table__.c else ())
+    }
+    book = load_book_fields(Book.query, sorted(columns)).filter(Book.id == book_id).first_or_404()
+    
+    # Every copy with its open loan, if any, in one indexed join
+    copy_rows = []
+    if 'copies' in fields or 'borrowed_copies' in fields:
+        copy_rows = db.session.query(
+            BookCopy, Borrowing.status.label('loan_status'), Borrowing.due_date
+        ).outerjoin(Borrowing, db.and_(
+            Borrowing.copy_id == BookCopy.id,
+            Borrowing.status.in_(ACTIVE_LOAN_STATUSES)
+        )).filter(
+            BookCopy.book_id == book_id,
+            BookCopy.condition != 'withdrawn'
+        ).order_by(BookCopy.copy_number).all()
+    
+    def copies():
+        # Shelved copies beyond available_copies are not lendable now (e.g. set aside for ready holds)
+        copies, shelved = [], book.available_copies
+        for row in copy_rows:
+            copy = row.BookCopy
+            if row.loan_status:
+                status = row.loan_status
+            elif copy.condition not in LENDABLE_COPY_CONDITIONS:
+                status = copy.condition
+            elif shelved > 0:
+                status, shelved = 'available', shelved - 1
+            else:
+                status = 'unavailable'
+            copies.append({
+                'id': copy.id,
+                'barcode': copy.barcode,
+                'copy_number': copy.copy_number,
+                'location': copy.shelf_position,
+                'condition': copy.condition.title(),
+                'status': status,
+                'due_date': row.due_date.strftime('%b %d, %Y') if row.due_date else None
+            })
+        return copies
+    
+    # Only the requested fields are computed, so unrequested columns and queries are skipped
+    derived = {
+        'description': lambda: book.description or 'No description available for this book.',
+        'borrowed_copies': lambda: sum(1 for row in copy_rows if row.loan_status),
+        'status': lambda: 'available' if book.available_copies > 0 else 'borrowed',
         'copies': copies,
-        'publisher': 'Academic Press',  # Default publisher
-        'pages': 250,  # Default page count
-        'language': 'English',  # Default language
-        'format': 'Hardcover',  # Default format
-        'rating': 4.2,  # Default rating
-        'rating_count': 156,  # Default rating count
-        'tags': book.subject.split(', ') if book.subject else ['General']
+        'tags': lambda: [subject.name for subject in book.subjects] or ['General'],
+    }
+    return jsonify({
+        field: derived[field]() if field in derived
+        else BOOK_DETAIL_DEFAULTS[field] if field in BOOK_DETAIL_DEFAULTS
+        else getattr(book, field)
+        for field in fields
     })
 
 @app.route('/api/admin/books', methods=['POST'])
@@ -416,6 +1872,12 @@ def add_book():
     data = request.get_json()
     book = Book(**data)
     db.session.add(book)
+    sync_book_subjects(book)
+    db.session.flush()
+    index_book(book)
+    add_book_copies({book.id: book.total_copies}, datetime.utcnow())
+    bump_counter('total_books')
+    bump_versions('catalog')
     db.session.commit()
     
     return jsonify({'message': 'Book added successfully', 'book_id': book.id})
@@ -432,6 +1894,12 @@ def update_book(book_id):
         if hasattr(book, key):
             setattr(book, key, value)
     
+    if 'subject' in data:
+        sync_book_subjects(book)
+    if 'total_copies' in data:
+        sync_book_copies(book, datetime.utcnow())
+    index_book(book)
+    bump_versions('catalog')
     db.session.commit()
     return jsonify({'message': 'Book updated successfully'})
 
@@ -441,7 +1909,12 @@ def delete_book(book_id):
         return jsonify({'error': 'Admin not logged in'}), 401
     
     book = Book.query.get_or_404(book_id)
+    unindex_book(book.id)
+    adjust_subject_counts([subject.id for subject in book.subjects], -1)
+    BookCopy.query.filter_by(book_id=book.id).delete(synchronize_session=False)
+    bump_counter('total_books', -1)
     db.session.delete(book)
+    bump_versions('catalog')
     db.session.commit()
     
     return jsonify({'message': 'Book deleted successfully'})
@@ -453,48 +1926,83 @@ def borrow_book():
         return jsonify({'error': 'User not logged in'}), 401
     
     data = request.get_json()
-    user = User.query.get(session['user_id'])
+    user_id = session['user_id']
     book = Book.query.get_or_404(data['book_id'])
     
-    # Check if user can borrow more books
-    current_borrowings = Borrowing.query.filter_by(user_id=session['user_id'], status='borrowed').count()
-    if current_borrowings >= user.max_books:
+    # Claim a quota slot; the conditional update locks the user row, so
+    # concurrent checkouts by the same user queue here instead of overshooting
+    claimed = db.session.execute(
+        db.update(User).where(
+            User.id == user_id,
+            User.active_loans < db.func.coalesce(User.max_books, 5)
+        ).values(active_loans=User.active_loans + 1)
+    ).rowcount
+    if not claimed:
+        db.session.rollback()
+        user = User.query.get(user_id)
         return jsonify({'error': f'You can only borrow up to {user.max_books} books at a time'}), 400
     
-    # Check if book is available
-    if book.available_copies <= 0:
-        return jsonify({'error': 'No copies available'}), 400
-    
-    # Check if user already has this book
-    existing_borrowing = Borrowing.query.filter_by(
-        user_id=session['user_id'],
-        book_id=book.id,
-        status='borrowed'
+    # Check if user already has this book (safe: we hold the user row lock)
+    existing_borrowing = Borrowing.query.filter(
+        Borrowing.user_id == user_id,
+        Borrowing.book_id == book.id,
+        Borrowing.status.in_(ACTIVE_LOAN_STATUSES)
     ).first()
     
     if existing_borrowing:
+        db.session.rollback()
         return jsonify({'error': 'You already have this book borrowed'}), 400
     
+    # A copy held for this user at the desk is theirs; otherwise take one off the
+    # shelf if one is left. Done last so the book row lock is held briefly
+    now = datetime.utcnow()
+    taken = db.session.execute(
+        db.update(Reservation).where(
+            Reservation.user_id == user_id,
+            Reservation.book_id == book.id,
+            Reservation.status == 'ready'
+        ).values(status='fulfilled'),
+        execution_options={'synchronize_session': False}
+    ).rowcount
+    if not taken:
+        taken = db.session.execute(
+            db.update(Book).where(
+                Book.id == book.id,
+                Book.available_copies > 0
+            ).values(available_copies=Book.available_copies - 1)
+        ).rowcount
+        if not taken:
+            db.session.rollback()
+            return jsonify({'error': 'No copies available'}), 400
+        # The update holds the book lock, so the queue can be touched safely
+        close_holds(book.id, book.title, open_holds([
+            Reservation.user_id == user_id,
+            Reservation.book_id == book.id
+        ]), 'fulfilled', now)
+    
     # Create borrowing record
     borrowing = Borrowing(
-        user_id=session['user_id'],
+        user_id=user_id,
         book_id=book.id,
-        due_date=datetime.utcnow() + timedelta(days=14)  # 2 weeks loan period
+        borrowed_date=now,
+        due_date=now + timedelta(days=LOAN_PERIOD_DAYS)
     )
-    
-    book.available_copies -= 1
     db.session.add(borrowing)
-    db.session.commit()
+    db.session.flush()
+    checkout_copies([(borrowing.id, book.id)])
     
     # Create notification
-    notification = Notification(
-        user_id=session['user_id'],
-        title='Book Borrowed Successfully',
-        message=f'You have borrowed "{book.title}" by {book.author}. Due date: {borrowing.due_date.strftime("%B %d, %Y")}',
-        type='success'
-    )
-    db.session.add(notification)
+    send_notifications([{
+        'user_id': user_id,
+        'title': 'Book Borrowed Successfully',
+        'message': f'You have borrowed "{book.title}" by {book.author}. Due date: {borrowing.due_date.strftime("%B %d, %Y")}',
+        'type': 'success',
+        'created_at': now
+    }])
+    bump_counter('borrowed')
+    bump_versions('circulation')
     db.session.commit()
+    BORROWS.inc('self')
     
     return jsonify({'message': 'Book borrowed successfully', 'due_date': borrowing.due_date.isoformat()})
 
@@ -504,40 +2012,59 @@ def return_book():
         return jsonify({'error': 'Admin not logged in'}), 401
     
     data = request.get_json()
-    borrowing = Borrowing.query.filter_by(
-        user_id=data['user_id'],
-        book_id=data['book_id'],
-        status='borrowed'
-    ).first()
+    # Desk scans identify the loan by the copy's barcode instead of user and book
+    if data.get('barcode'):
+        loan_filters = [Borrowing.copy_id == db.select(BookCopy.id).where(
+            BookCopy.barcode == str(data['barcode'])
+        ).scalar_subquery()]
+    else:
+        loan_filters = [Borrowing.user_id == data['user_id'], Borrowing.book_id == data['book_id']]
+    # Lock the loan so its status (and the overdue counter) can't change under us
+    borrowing = Borrowing.query.filter(
+        *loan_filters,
+        Borrowing.status.in_(ACTIVE_LOAN_STATUSES)
+    ).with_for_update().first()
     
     if not borrowing:
         return jsonify({'error': 'Borrowing record not found'}), 404
     
     # Calculate fine if overdue
-    fine_amount = 0
-    if datetime.utcnow() > borrowing.due_date:
-        days_overdue = (datetime.utcnow() - borrowing.due_date).days
-        fine_amount = days_overdue * 0.50  # $0.50 per day
+    now = datetime.utcnow()
+    days_overdue, fine_amount = overdue_fine(borrowing.due_date, now)
+    was_overdue = borrowing.status == 'overdue'
+    
+    # Close the loan only if no concurrent return got there first
+    closed = db.session.execute(
+        db.update(Borrowing).where(
+            Borrowing.id == borrowing.id,
+            Borrowing.status.in_(ACTIVE_LOAN_STATUSES)
+        ).values(status='returned', returned_date=now)
+    ).rowcount
+    if not closed:
+        db.session.rollback()
+        return jsonify({'error': 'Borrowing record not found'}), 404
     
-    # Update borrowing record
-    borrowing.returned_date = datetime.utcnow()
-    borrowing.status = 'returned'
+    # The user's loan counter, then the book: the user-before-book lock order of borrow_book.
+    # The copy goes to the next hold in line, or back on the shelf
+    db.session.execute(
+        db.update(User).where(User.id == borrowing.user_id, User.active_loans > 0)
+        .values(active_loans=User.active_loans - 1)
+    )
+    title = lock_book(borrowing.book_id)
+    release_copies(borrowing.book_id, title, 1, now)
     
-    # Update book availability
-    book = Book.query.get(borrowing.book_id)
-    book.available_copies += 1
+    bump_counter('borrowed', -1)
+    bump_counter('returned')
+    if was_overdue:
+        bump_counter('overdue', -1)
     
-    # Create fine record if applicable
-    if fine_amount > 0:
-        fine = Fine(
-            user_id=borrowing.user_id,
-            borrowing_id=borrowing.id,
-            amount=fine_amount,
-            reason='overdue'
-        )
-        db.session.add(fine)
+    # Settle the fine the sweeper has been accruing (or create it)
+    accrue_overdue_fines([(borrowing.id, borrowing.user_id, borrowing.due_date)], now)
+    send_notifications([return_notice(borrowing.user_id, title, fine_amount, now)])
     
+    bump_versions('circulation')
     db.session.commit()
+    RETURNS.inc('desk')
     
     return jsonify({
         'message': 'Book returned successfully',
@@ -551,11 +2078,11 @@ def renew_book():
         return jsonify({'error': 'User not logged in'}), 401
     
     data = request.get_json()
-    borrowing = Borrowing.query.filter_by(
-        user_id=session['user_id'],
-        book_id=data['book_id'],
-        status='borrowed'
-    ).first()
+    borrowing = Borrowing.query.filter(
+        Borrowing.user_id == session['user_id'],
+        Borrowing.book_id == data['book_id'],
+        Borrowing.status.in_(ACTIVE_LOAN_STATUSES)
+    ).with_for_update().first()
     
     if not borrowing:
         return jsonify({'error': 'Borrowing record not found'}), 404
@@ -565,10 +2092,11 @@ def renew_book():
         return jsonify({'error': 'Maximum renewals reached for this book'}), 400
     
     # Extend due date by 2 weeks
-    borrowing.due_date += timedelta(days=14)
-    borrowing.renewal_count += 1
+    extend_loan(borrowing, datetime.utcnow())
     
+    bump_versions('circulation')
     db.session.commit()
+    RENEWALS.inc('self')
     
     return jsonify({
         'message': 'Book renewed successfully',
@@ -582,193 +2110,838 @@ def reserve_book():
         return jsonify({'error': 'User not logged in'}), 401
     
     data = request.get_json()
-    book = Book.query.get_or_404(data['book_id'])
-    
-    # Check if user already has an active reservation
-    existing_reservation = Reservation.query.filter_by(
-        user_id=session['user_id'],
-        book_id=book.id,
-        status='active'
+    user_id = session['user_id']
+    now = datetime.utcnow()
+    
+    # The book row lock makes the position check-and-insert atomic
+    title = lock_book(data['book_id'])
+    if title is None:
+        return jsonify({'error': 'Book not found'}), 404
+    book_id = data['book_id']
+    
+    # Check if user already has an open reservation or the book itself
+    existing_reservation = Reservation.query.filter(
+        Reservation.user_id == user_id,
+        Reservation.book_id == book_id,
+        Reservation.status.in_(OPEN_HOLD_STATUSES)
     ).first()
     
     if existing_reservation:
+        db.session.rollback()
         return jsonify({'error': 'Book already reserved'}), 400
     
-    # Get current reservation count for priority
-    current_reservations = Reservation.query.filter_by(
-        book_id=book.id,
-        status='active'
-    ).count()
+    if Borrowing.query.filter(
+        Borrowing.user_id == user_id,
+        Borrowing.book_id == book_id,
+        Borrowing.status.in_(ACTIVE_LOAN_STATUSES)
+    ).first():
+        db.session.rollback()
+        return jsonify({'error': 'You already have this book borrowed'}), 400
+    
+    # Next position is one past the tail of the queue (an index lookup)
+    position = (db.session.query(db.func.max(Reservation.priority)).filter(
+        Reservation.book_id == book_id,
+        Reservation.status == 'active'
+    ).scalar() or 0) + 1
+    
+    # Nobody waiting and a copy on the shelf: hold it at the desk right away
+    held = position == 1 and db.session.execute(
+        db.update(Book).where(
+            Book.id == book_id,
+            Book.available_copies > 0
+        ).values(available_copies=Book.available_copies - 1),
+        execution_options={'synchronize_session': False}
+    ).rowcount
     
     # Create reservation
     reservation = Reservation(
-        user_id=session['user_id'],
-        book_id=book.id,
-        expiry_date=datetime.utcnow() + timedelta(days=7),  # 1 week reservation
-        priority=current_reservations + 1
+        user_id=user_id,
+        book_id=book_id,
+        reserved_date=now,
+        status='ready' if held else 'active',
+        priority=0 if held else position,
+        expiry_date=now + timedelta(days=HOLD_PICKUP_DAYS if held else HOLD_QUEUE_DAYS)
     )
     
     db.session.add(reservation)
+    bump_versions('circulation')
     db.session.commit()
     
     return jsonify({
         'message': 'Book reserved successfully',
+        'id': reservation.id,
+        'status': reservation.status,
         'priority': reservation.priority,
         'expiry_date': reservation.expiry_date.isoformat()
     })
 
+def serialize_hold(reservation):
+    queue_length = Reservation.query.filter(
+        Reservation.book_id == reservation.book_id,
+        Reservation.status == 'active'
+    ).count()
+    return {
+        'id': reservation.id,
+        'book_id': reservation.book_id,
+        'status': reservation.status,
+        'position': reservation.priority if reservation.status == 'active' else None,
+        'queue_length': queue_length,
+        'reserved_date': reservation.reserved_date.isoformat(),
+        'expiry_date': reservation.expiry_date.isoformat()
+    }
+
+def visible_reservation(reservation_id):
+    """The reservation if the session's user owns it (admins see all), else None"""
+    reservation = db.session.get(Reservation, reservation_id)
+    if reservation and ('admin_id' in session or reservation.user_id == session.get('user_id')):
+        return reservation
+    return None
+
+@app.route('/api/reservations/<int:reservation_id>', methods=['GET'])
+def get_reservation(reservation_id):
+    if 'user_id' not in session and 'admin_id' not in session:
+        return jsonify({'error': 'Not logged in'}), 401
+    
+    reservation = visible_reservation(reservation_id)
+    if not reservation:
+        return jsonify({'error': 'Reservation not found'}), 404
+    
+    return jsonify(serialize_hold(reservation))
+
+@app.route('/api/reservations/<int:reservation_id>/cancel', methods=['POST'])
+def cancel_reservation(reservation_id):
+    if 'user_id' not in session and 'admin_id' not in session:
+        return jsonify({'error': 'Not logged in'}), 401
+    
+    reservation = visible_reservation(reservation_id)
+    if not reservation:
+        return jsonify({'error': 'Reservation not found'}), 404
+    
+    # Re-read the hold under the book lock before changing the queue
+    now = datetime.utcnow()
+    title = lock_book(reservation.book_id)
+    holds = open_holds([Reservation.id == reservation.id])
+    if not holds:
+        db.session.rollback()
+        return jsonify({'error': 'Reservation is no longer active'}), 400
+    
+    close_holds(reservation.book_id, title, holds, 'cancelled', now)
+    bump_versions('circulation')
+    db.session.commit()
+    
+    return jsonify({'message': 'Reservation cancelled successfully'})
+
+# Bulk Circulation
+def parse_circulation_items(data):
+    """Validate a bulk request body; returns (items, error_message)"""
+    items = (data or {}).get('items')
+    if not isinstance(items, list) or not items:
+        return None, 'items must be a non-empty list of {user_id, book_id}'
+    if len(items) > MAX_BATCH_ITEMS:
+        return None, f'At most {MAX_BATCH_ITEMS} items per request'
+    parsed = []
+    for item in items:
+        try:
+            parsed.append((int(item['user_id']), int(item['book_id'])))
+        except (TypeError, KeyError, ValueError):
+            parsed.append(None)
+    return parsed, None
+
+def circulation_result(index, item, error=None, **fields):
+    result = {'index': index, 'status': 'error' if error else 'ok'}
+    if item:
+        result.update(user_id=item[0], book_id=item[1])
+    if error:
+        result['error'] = error
+    result.update(fields)
+    return result
+
+def active_borrowings_for(items, lock=False):
+    """Load the open borrowings for a set of (user_id, book_id) pairs in one query"""
+    pairs = {item for item in items if item}
+    if not pairs:
+        return {}
+    query = Borrowing.query.filter(
+        Borrowing.user_id.in_({user_id for user_id, _ in pairs}),
+        Borrowing.book_id.in_({book_id for _, book_id in pairs}),
+        Borrowing.status.in_(ACTIVE_LOAN_STATUSES)
+    ).order_by(Borrowing.id)
+    if lock:
+        query = query.with_for_update()
+    return {
+        (b.user_id, b.book_id): b for b in query.all()
+        if (b.user_id, b.book_id) in pairs
+    }
+
+def bulk_response(results):
+    failed = sum(1 for r in results if r['status'] == 'error')
+    return jsonify({'results': results, 'succeeded': len(results) - failed, 'failed': failed})
+
+@app.route('/api/admin/circulation/borrow', methods=['POST'])
+def bulk_borrow():
+    if 'admin_id' not in session:
+        return jsonify({'error': 'Admin not logged in'}), 401
+    
+    items, error = parse_circulation_items(request.get_json())
+    if error:
+        return jsonify({'error': error}), 400
+    
+    # Lock users, then books, each in id order (the same order as borrow_book) to avoid deadlocks
+    user_ids = sorted({item[0] for item in items if item})
+    book_ids = sorted({item[1] for item in items if item})
+    users = {u.id: u for u in User.query.filter(User.id.in_(user_ids)).order_by(User.id).with_for_update().all()}
+    books = {b.id: b for b in Book.query.filter(Book.id.in_(book_ids)).order_by(Book.id).with_for_update().all()}
+    already_borrowed = set(active_borrowings_for(items))
+    holds = {
+        (h.user_id, h.book_id): h for h in Reservation.query.filter(
+            Reservation.user_id.in_(user_ids),
+            Reservation.book_id.in_(book_ids),
+            Reservation.status.in_(OPEN_HOLD_STATUSES)
+        ).with_for_update().all()
+    }
+    
+    now = datetime.utcnow()
+    due_date = now + timedelta(days=LOAN_PERIOD_DAYS)
+    results, borrowings, notifications, served_from_queue = [], [], [], {}
+    for index, item in enumerate(items):
+        if not item:
+            results.append(circulation_result(index, item, 'user_id and book_id must be integers'))
+            continue
+        user, book = users.get(item[0]), books.get(item[1])
+        hold = holds.get(item)
+        held_for_user = hold is not None and hold.status == 'ready'
+        if not user:
+            error = 'User not found'
+        elif user.status != 'active':
+            error = 'Account is suspended or inactive'
+        elif not book:
+            error = 'Book not found'
+        elif item in already_borrowed:
+            error = 'User already has this book borrowed'
+        elif user.active_loans >= (user.max_books or 5):
+            error = f'User can only borrow up to {user.max_books} books at a time'
+        elif not held_for_user and book.available_copies <= 0:
+            error = 'No copies available'
+        else:
+            error = None
+        if error:
+            results.append(circulation_result(index, item, error))
+            continue
+        
+        # Rows are locked, so in-memory counters are authoritative for the rest of the batch
+        user.active_loans += 1
+        if held_for_user:
+            hold.status = 'fulfilled'
+        else:
+            book.available_copies -= 1
+            if hold:
+                served_from_queue.setdefault(book.id, []).append(hold)
+        already_borrowed.add(item)
+        borrowings.append({'user_id': user.id, 'book_id': book.id, 'borrowed_date': now, 'due_date': due_date})
+        notifications.append({
+            'user_id': user.id,
+            'title': 'Book Borrowed Successfully',
+            'message': f'You have borrowed "{book.title}" by {book.author}. Due date: {due_date.strftime("%B %d, %Y")}',
+            'type': 'success',
+            'created_at': now
+        })
+        results.append(circulation_result(index, item, due_date=due_date.isoformat()))
+    
+    if borrowings:
+        db.session.execute(db.insert(Borrowing), borrowings)
+        new_loans = active_borrowings_for([(row['user_id'], row['book_id']) for row in borrowings])
+        checkout_copies([(loan.id, loan.book_id) for loan in new_loans.values()])
+        send_notifications(notifications)
+        for book_id, queued in served_from_queue.items():
+            close_holds(book_id, books[book_id].title, queued, 'fulfilled', now)
+        bump_counter('borrowed', len(borrowings))
+        bump_versions('circulation')
+    db.session.commit()
+    BORROWS.inc('desk', amount=sum(1 for r in results if r['status'] == 'ok'))
+    
+    return bulk_response(results)
+
+@app.route('/api/admin/circulation/return', methods=['POST'])
+def bulk_return():
+    if 'admin_id' not in session:
+        return jsonify({'error': 'Admin not logged in'}), 401
+    
+    items, error = parse_circulation_items(request.get_json())
+    if error:
+        return jsonify({'error': error}), 400
+    
+    open_loans = active_borrowings_for(items, lock=True)
+    
+    now = datetime.utcnow()
+    results, closed, receipts, was_overdue = [], [], [], 0
+    returned_per_book, returned_per_user = {}, {}
+    for index, item in enumerate(items):
+        if not item:
+            results.append(circulation_result(index, item, 'user_id and book_id must be integers'))
+            continue
+        borrowing = open_loans.pop(item, None)
+        if not borrowing:
+            results.append(circulation_result(index, item, 'Borrowing record not found'))
+            continue
+        
+        days_overdue, fine_amount = overdue_fine(borrowing.due_date, now)
+        closed.append((borrowing.id, borrowing.user_id, borrowing.due_date))
+        receipts.append((borrowing.user_id, borrowing.book_id, fine_amount))
+        was_overdue += borrowing.status == 'overdue'
+        returned_per_book[borrowing.book_id] = returned_per_book.get(borrowing.book_id, 0) + 1
+        returned_per_user[borrowing.user_id] = returned_per_user.get(borrowing.user_id, 0) + 1
+        results.append(circulation_result(index, item, fine_amount=fine_amount, days_overdue=days_overdue))
+    
+    if closed:
+        db.session.execute(
+            db.update(Borrowing).where(Borrowing.id.in_([loan[0] for loan in closed]))
+            .values(status='returned', returned_date=now),
+            execution_options={'synchronize_session': False}
+        )
+        # Users, then books, each in id order (the same order as borrow_book and bulk_borrow)
+        db.session.execute(
+            db.select(User.id).where(User.id.in_(returned_per_user)).order_by(User.id).with_for_update()
+        )
+        db.session.execute(
+            db.update(User).where(User.id.in_(returned_per_user))
+            .values(active_loans=User.active_loans - db.case(returned_per_user, value=User.id, else_=0)),
+            execution_options={'synchronize_session': False}
+        )
+        titles = {}
+        for book_id in sorted(returned_per_book):
+            titles[book_id] = lock_book(book_id)
+            release_copies(book_id, titles[book_id], returned_per_book[book_id], now)
+        bump_counter('borrowed', -len(closed))
+        bump_counter('returned', len(closed))
+        bump_counter('overdue', -was_overdue)
+        accrue_overdue_fines(closed, now)
+        send_notifications([
+            return_notice(user_id, titles[book_id], fine_amount, now)
+            for user_id, book_id, fine_amount in receipts
+        ])
+        bump_versions('circulation')
+    db.session.commit()
+    RETURNS.inc('desk', amount=sum(1 for r in results if r['status'] == 'ok'))
+    
+    return bulk_response(results)
+
+@app.route('/api/admin/circulation/renew', methods=['POST'])
+def bulk_renew():
+    if 'admin_id' not in session:
+        return jsonify({'error': 'Admin not logged in'}), 401
+    
+    items, error = parse_circulation_items(request.get_json())
+    if error:
+        return jsonify({'error': error}), 400
+    
+    open_loans = active_borrowings_for(items, lock=True)
+    
+    now = datetime.utcnow()
+    results = []
+    for index, item in enumerate(items):
+        if not item:
+            results.append(circulation_result(index, item, 'user_id and book_id must be integers'))
+            continue
+        borrowing = open_loans.get(item)
+        if not borrowing:
+            results.append(circulation_result(index, item, 'Borrowing record not found'))
+        elif borrowing.renewal_count >= borrowing.max_renewals:
+            results.append(circulation_result(index, item, 'Maximum renewals reached for this book'))
+        else:
+            extend_loan(borrowing, now)
+            results.append(circulation_result(
+                index, item,
+                new_due_date=borrowing.due_date.isoformat(),
+                renewals_remaining=borrowing.max_renewals - borrowing.renewal_count
+            ))
+    
+    # The unit of work flushes all changed rows as one batched UPDATE
+    if any(result['status'] == 'ok' for result in results):
+        bump_versions('circulation')
+    db.session.commit()
+    RENEWALS.inc('desk', amount=sum(1 for r in results if r['status'] == 'ok'))
+    
+    return bulk_response(results)
+
+@app.route('/api/admin/copies/<barcode>', methods=['GET'])
+def lookup_copy(barcode):
+    if 'admin_id' not in session:
+        return jsonify({'error': 'Admin not logged in'}), 401
+    
+    # Desk scan: one probe of the barcode index, with the book and any open loan joined on
+    row = db.session.query(BookCopy, Book.title, Book.author, Borrowing).join(
+        Book, Book.id == BookCopy.book_id
+    ).outerjoin(Borrowing, db.and_(
+        Borrowing.copy_id == BookCopy.id,
+        Borrowing.status.in_(ACTIVE_LOAN_STATUSES)
+    )).filter(BookCopy.barcode == barcode).first()
+    if not row:
+        return jsonify({'error': 'Copy not found'}), 404
+    
+    copy, loan = row.BookCopy, row.Borrowing
+    return jsonify({
+        'id': copy.id,
+        'barcode': copy.barcode,
+        'copy_number': copy.copy_number,
+        'book_id': copy.book_id,
+        'book_title': row.title,
+        'book_author': row.author,
+        'shelf_position': copy.shelf_position,
+        'condition': copy.condition,
+        'status': loan.status if loan else 'on_shelf' if copy.condition in LENDABLE_COPY_CONDITIONS else copy.condition,
+        'loan': {
+            'id': loan.id,
+            'user_id': loan.user_id,
+            'borrowed_date': loan.borrowed_date.isoformat(),
+            'due_date': loan.due_date.isoformat(),
+            'renewal_count': loan.renewal_count
+        } if loan else None
+    })
+
 # User Dashboard
+MAX_HISTORY_PAGE_SIZE = 100
+DESCRIPTION_SNIPPET_LENGTH = 200  # active loans show a teaser, not the full TEXT column
+DASHBOARD_SECTIONS = ('user', 'stats', 'borrowings', 'history', 'reservations', 'notifications')
+
 @app.route('/api/user/dashboard', methods=['GET'])
+@read_only
 def user_dashboard():
     if 'user_id' not in session:
         return jsonify({'error': 'User not logged in'}), 401
     
-    user = User.query.get(session['user_id'])
-    
-    # Get user's borrowings (both borrowed and returned) and reservations
-    borrowings_all = Borrowing.query.filter_by(user_id=session['user_id']).order_by(Borrowing.borrowed_date.desc()).all()
-    borrowings_active = [b for b in borrowings_all if b.status == 'borrowed']
-    reservations = Reservation.query.filter_by(user_id=session['user_id'], status='active').all()
+    # `fields` picks sections; the queries behind unrequested sections are skipped
+    sections, error = requested_fields(DASHBOARD_SECTIONS)
+    if error:
+        return jsonify({'error': error}), 400
     
-    # Calculate overdue books
-    overdue_books = [b for b in borrowings_active if datetime.utcnow() > b.due_date]
-    due_soon_books = [b for b in borrowings_active if 0 <= (b.due_date - datetime.utcnow()).days <= 3]
+    user_id = session['user_id']
+    user = db.session.get(User, user_id)
+    if not user:
+        return jsonify({'error': 'User not found'}), 404
     
-    # Get notifications
-    notifications = Notification.query.filter_by(user_id=session['user_id'], read=False).order_by(Notification.created_at.desc()).limit(10).all()
+    history_per_page = max(1, min(request.args.get('history_per_page', 20, type=int), MAX_HISTORY_PAGE_SIZE))
+    history_cursor = request.args.get('history_cursor', '')
+    now = datetime.utcnow()
+    response = {}
     
-    return jsonify({
-        'user': {
+    if 'user' in sections:
+        response['user'] = {
             'id': user.id,
             'email': user.email,
             'first_name': user.first_name,
             'last_name': user.last_name,
             'user_type': user.user_type,
             'max_books': user.max_books
-        },
-        'stats': {
-            'borrowed_count': len(borrowings_active),
-            'overdue_count': len(overdue_books),
-            'due_soon_count': len(due_soon_books),
+        }
+    
+    # Active loans (bounded by max_books) with just the book columns we show;
+    # the description teaser is only read when the loans themselves are returned
+    active = []
+    if 'borrowings' in sections or 'stats' in sections:
+        columns = [Borrowing, Book.title, Book.author, Book.isbn]
+        if 'borrowings' in sections:
+            columns.append(db.func.substr(Book.description, 1, DESCRIPTION_SNIPPET_LENGTH).label('description'))
+        active = db.session.query(*columns).join(Book, Book.id == Borrowing.book_id).filter(
+            Borrowing.user_id == user_id,
+            Borrowing.status.in_(ACTIVE_LOAN_STATUSES)
+        ).order_by(Borrowing.due_date).all()
+    
+    # One page of past loans, newest first, keyed on id so old accounts cost the same
+    history = []
+    if 'borrowings' in sections or 'history' in sections:
+        history_query = db.session.query(
+            Borrowing, Book.title, Book.author, Book.isbn
+        ).join(Book, Book.id == Borrowing.book_id).filter(
+            Borrowing.user_id == user_id,
+            Borrowing.status.not_in(ACTIVE_LOAN_STATUSES)
+        )
+        if history_cursor:
+            try:
+                before_id, = pagination.decode_cursor(history_cursor, 'history', 1)
+            except pagination.InvalidCursor as e:
+                return jsonify({'error': str(e)}), 400
+            history_query = history_query.filter(Borrowing.id < before_id)
+        history = history_query.order_by(Borrowing.id.desc()).limit(history_per_page + 1).all()
+        has_more_history = len(history) > history_per_page
+        history = history[:history_per_page]
+        if 'history' in sections:
+            response['history'] = {
+                'per_page': history_per_page,
+                'next_cursor': pagination.encode_cursor('history', [history[-1].Borrowing.id]) if has_more_history else None
+            }
+    
+    reservations = []
+    if 'reservations' in sections or 'stats' in sections:
+        reservations = db.session.query(Reservation, Book.title, Book.author).join(
+            Book, Book.id == Reservation.book_id
+        ).filter(Reservation.user_id == user_id, Reservation.status.in_(OPEN_HOLD_STATUSES)).all()
+    
+    if 'stats' in sections:
+        response['stats'] = {
+            'borrowed_count': len(active),
+            'overdue_count': sum(1 for row in active if row.Borrowing.status == 'overdue'),
+            'due_soon_count': sum(1 for row in active if 0 <= (row.Borrowing.due_date - now).days <= 3),
             'reserved_count': len(reservations)
-        },
-        'borrowings': [{
+        }
+    
+    def serialize_loan(row, description=None):
+        b = row.Borrowing
+        loan = {
             'id': b.id,
-            'book_title': b.book.title,
-            'book_author': b.book.author,
-            'book_isbn': b.book.isbn,
-            'book_description': b.book.description,
+            'book_title': row.title,
+            'book_author': row.author,
+            'book_isbn': row.isbn,
             'borrowed_date': b.borrowed_date.isoformat() if b.borrowed_date else None,
             'due_date': b.due_date.isoformat() if b.due_date else None,
             'returned_date': b.returned_date.isoformat() if b.returned_date else None,
             'status': b.status,
             'renewal_count': b.renewal_count,
             'max_renewals': b.max_renewals,
-            'is_overdue': (datetime.utcnow() > b.due_date) if b.due_date else False,
-            'days_overdue': max(0, (datetime.utcnow() - b.due_date).days) if (b.due_date and datetime.utcnow() > b.due_date) else 0
-        } for b in borrowings_all],
-        'reservations': [{
-            'id': r.id,
-            'book_title': r.book.title,
-            'book_author': r.book.author,
-            'reserved_date': r.reserved_date.isoformat(),
-            'expiry_date': r.expiry_date.isoformat(),
-            'priority': r.priority
-        } for r in reservations],
-        'notifications': [{
-            'id': n.id,
-            'title': n.title,
-            'message': n.message,
-            'type': n.type,
-            'created_at': n.created_at.isoformat()
-        } for n in notifications]
+            'is_overdue': b.status == 'overdue',
+            'days_overdue': overdue_fine(b.due_date, now)[0] if b.status == 'overdue' else 0
+        }
+        # Past loans carry no description at all
+        if description is not None:
+            loan['book_description'] = description
+        return loan
+    
+    if 'borrowings' in sections:
+        response['borrowings'] = [serialize_loan(row, row.description or '') for row in active] + \
+                                 [serialize_loan(row) for row in history]
+    
+    if 'reservations' in sections:
+        response['reservations'] = [{
+            'id': row.Reservation.id,
+            'book_title': row.title,
+            'book_author': row.author,
+            'reserved_date': row.Reservation.reserved_date.isoformat(),
+            'expiry_date': row.Reservation.expiry_date.isoformat(),
+            'status': row.Reservation.status,
+            'priority': row.Reservation.priority
+        } for row in reservations]
+    
+    if 'notifications' in sections:
+        notifications = Notification.query.filter_by(user_id=user_id, read=False).order_by(Notification.created_at.desc()).limit(10).all()
+        response['notifications'] = [serialize_notification(n) for n in notifications]
+    
+    return jsonify(response)
+
+# Notification Stream
+# Dashboards get new notifications pushed over Server-Sent Events, or by long-polling
+# where EventSource isn't available. Either way a connection sleeps on the hub between
+# events and only queries when woken (or on the keepalive re-check).
+NOTIFICATION_BATCH = 50     # notifications read per query while catching a stream up
+LONG_POLL_MAX_SECONDS = 30
+
+def serialize_notification(n):
+    return {
+        'id': n.id,
+        'title': n.title,
+        'message': n.message,
+        'type': n.type,
+        'read': n.read,
+        'created_at': n.created_at.isoformat()
+    }
+
+def latest_notification_id(user_id):
+    return db.session.query(db.func.max(Notification.id)).filter(Notification.user_id == user_id).scalar() or 0
+
+def unread_notifications_after(user_id, after_id):
+    """Serialized unread notifications newer than after_id, oldest first.
+
+    The session is closed afterwards so a waiting stream doesn't hold a pooled connection.
+    """
+    try:
+        notifications = []
+        while True:
+            rows = Notification.query.filter(
+                Notification.user_id == user_id,
+                Notification.read == False,
+                Notification.id > after_id
+            ).order_by(Notification.id).limit(NOTIFICATION_BATCH).all()
+            notifications.extend(serialize_notification(n) for n in rows)
+            if len(rows) < NOTIFICATION_BATCH:
+                return notifications
+            after_id = rows[-1].id
+    finally:
+        db.session.close()
+
+@app.errorhandler(notification_hub.HubFull)
+def notification_hub_full(e):
+    response = jsonify({'error': 'Too many open notification streams, please try again shortly'})
+    response.headers['Retry-After'] = str(notification_hub.KEEPALIVE_SECONDS)
+    return response, 503
+
+@app.route('/api/notifications/stream', methods=['GET'])
+def notification_stream():
+    if 'user_id' not in session:
+        return jsonify({'error': 'User not logged in'}), 401
+    
+    # EventSource resends the last id it saw when it reconnects; new streams start from now
+    user_id = session['user_id']
+    after_id = request.headers.get('Last-Event-ID', type=int)
+    if after_id is None:
+        after_id = request.args.get('after', type=int)
+    if after_id is None:
+        after_id = latest_notification_id(user_id)
+        db.session.close()
+    subscription = notification_hub.subscribe(user_id)
+    
+    def events(after_id):
+        yield 'retry: 3000\n\n'
+        while True:
+            for notification in unread_notifications_after(user_id, after_id):
+                after_id = notification['id']
+                yield f'id: {after_id}\nevent: notification\ndata: {json.dumps(notification)}\n\n'
+            if not subscription.wait():
+                yield ': keepalive\n\n'
+    
+    response = app.response_class(stream_with_context(events(after_id)), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # stop nginx from buffering the stream
+    response.call_on_close(subscription.close)
+    return response
+
+@app.route('/api/notifications/poll', methods=['GET'])
+def poll_notifications():
+    if 'user_id' not in session:
+        return jsonify({'error': 'User not logged in'}), 401
+    
+    # Answers as soon as something newer than `after` exists, or after `timeout` seconds with nothing
+    user_id = session['user_id']
+    after_id = request.args.get('after', type=int)
+    if after_id is None:
+        after_id = latest_notification_id(user_id)
+    timeout = max(0, min(request.args.get('timeout', LONG_POLL_MAX_SECONDS, type=int), LONG_POLL_MAX_SECONDS))
+    
+    # Subscribe before the first read, so nothing committed in between is missed
+    with notification_hub.subscribe(user_id) as subscription:
+        notifications = unread_notifications_after(user_id, after_id)
+        if not notifications and timeout and subscription.wait(timeout):
+            notifications = unread_notifications_after(user_id, after_id)
+    
+    return jsonify({
+        'notifications': notifications,
+        'last_id': notifications[-1]['id'] if notifications else after_id
     })
 
+@app.route('/api/notifications/read', methods=['POST'])
+def mark_notifications_read():
+    if 'user_id' not in session:
+        return jsonify({'error': 'User not logged in'}), 401
+    
+    # {"ids": [...]} marks those notifications; {"all": true} marks every unread one
+    data = request.get_json(silent=True) or {}
+    filters = [Notification.user_id == session['user_id'], Notification.read == False]
+    if data.get('all') is not True:
+        ids = data.get('ids')
+        if not isinstance(ids, list) or not all(isinstance(i, int) for i in ids):
+            return jsonify({'error': 'Provide a list of notification ids or "all": true'}), 400
+        if len(ids) > MAX_BATCH_ITEMS:
+            return jsonify({'error': f'At most {MAX_BATCH_ITEMS} ids per request'}), 400
+        filters.append(Notification.id.in_(ids))
+    
+    updated = db.session.execute(
+        db.update(Notification).where(*filters).values(read=True),
+        execution_options={'synchronize_session': False}
+    ).rowcount
+    db.session.commit()
+    
+    return jsonify({'message': 'Notifications marked as read', 'updated': updated})
+
 # Admin Dashboard
 @app.route('/api/admin/dashboard', methods=['GET'])
+@read_only
 def admin_dashboard():
     if 'admin_id' not in session:
         return jsonify({'error': 'Admin not logged in'}), 401
     
-    # Get system statistics
-    total_books = Book.query.count()
-    total_users = User.query.filter_by(status='active').count()
-    borrowed_books = Borrowing.query.filter_by(status='borrowed').count()
-    overdue_books = Borrowing.query.filter(
-        Borrowing.status == 'borrowed',
-        Borrowing.due_date < datetime.utcnow()
-    ).count()
-    returned_count = Borrowing.query.filter_by(status='returned').count()
-    # Users with paid fines
-    paid_fine_users = db.session.query(Fine.user_id).filter(Fine.status == 'paid').distinct().count()
-    unpaid_fine_users = db.session.query(Fine.user_id).filter(Fine.status == 'pending').distinct().count()
-    # Books by subject breakdown
-    books_by_subject = db.session.query(Book.subject, db.func.count(Book.id)).group_by(Book.subject).all()
+    # System statistics come from maintained counters, not table scans
+    counters = read_counters() or reconcile_stat_counters()
+    books_by_subject = db.session.query(Subject.name, Subject.book_count).filter(
+        Subject.book_count > 0
+    ).order_by(Subject.book_count.desc(), Subject.name).all()
     
     # Get recent transactions
-    recent_transactions = Borrowing.query.order_by(Borrowing.borrowed_date.desc()).limit(10).all()
+    recent_transactions = db.session.query(Borrowing, User, Book).join(User).join(Book).order_by(
+        Borrowing.borrowed_date.desc()
+    ).limit(10).all()
     
     # Get overdue books details
+    # Oldest first, straight off the (status, due_date) index
+    now = datetime.utcnow()
     overdue_details = db.session.query(Borrowing, User, Book).join(User).join(Book).filter(
-        Borrowing.status == 'borrowed',
-        Borrowing.due_date < datetime.utcnow()
-    ).limit(10).all()
+        Borrowing.status == 'overdue'
+    ).order_by(Borrowing.due_date).limit(10).all()
     
     return jsonify({
         'stats': {
-            'total_books': total_books,
-            'total_users': total_users,
-            'borrowed_books': borrowed_books,
-            'overdue_books': overdue_books,
-            'returned_books': returned_count,
-            'paid_fine_users': paid_fine_users,
-            'unpaid_fine_users': unpaid_fine_users,
+            'total_books': counters.get('total_books', 0),
+            'total_users': counters.get('active_users', 0),
+            'borrowed_books': counters.get('borrowed', 0),
+            'overdue_books': counters.get('overdue', 0),
+            'returned_books': counters.get('returned', 0),
+            'paid_fine_users': counters.get('paid_fine_users', 0),
+            'unpaid_fine_users': counters.get('unpaid_fine_users', 0),
             'books_by_subject': [{ 'subject': s or 'Unknown', 'count': c } for s, c in books_by_subject]
         },
         'recent_transactions': [{
-            'id': t.id,
-            'user_name': f"{t.user.first_name} {t.user.last_name}",
-            'book_title': t.book.title,
-            'borrowed_date': t.borrowed_date.isoformat(),
-            'due_date': t.due_date.isoformat()
+            'id': t.Borrowing.id,
+            'user_name': f"{t.User.first_name} {t.User.last_name}",
+            'book_title': t.Book.title,
+            'borrowed_date': t.Borrowing.borrowed_date.isoformat(),
+            'due_date': t.Borrowing.due_date.isoformat()
         } for t in recent_transactions],
         'overdue_books': [{
             'id': t.Borrowing.id,
             'user_name': f"{t.User.first_name} {t.User.last_name}",
             'user_email': t.User.email,
             'book_title': t.Book.title,
-            'days_overdue': (datetime.utcnow() - t.Borrowing.due_date).days
+            'days_overdue': overdue_fine(t.Borrowing.due_date, now)[0]
         } for t in overdue_details]
     })
 
 # Fine Management
+MAX_FINES_PAGE_SIZE = 200
+
 @app.route('/api/admin/fines', methods=['GET'])
+@read_only
 def get_fines():
     if 'admin_id' not in session:
         return jsonify({'error': 'Admin not logged in'}), 401
     
-    fines = Fine.query.filter_by(status='pending').all()
+    status = request.args.get('status', 'pending')
+    user_id = request.args.get('user_id', type=int)
+    per_page = max(1, min(request.args.get('per_page', 50, type=int), MAX_FINES_PAGE_SIZE))
+    cursor = request.args.get('cursor', '')
+    
+    filters = [Fine.status == status]
+    if user_id:
+        filters.append(Fine.user_id == user_id)
+    
+    # One joined query for the page instead of three lazy loads per fine
+    query = db.session.query(
+        Fine, User.first_name, User.last_name, User.email, Book.title
+    ).join(User, User.id == Fine.user_id).join(
+        Borrowing, Borrowing.id == Fine.borrowing_id
+    ).join(Book, Book.id == Borrowing.book_id).filter(*filters)
+    if cursor:
+        try:
+            after_id, = pagination.decode_cursor(cursor, 'fines', 1)
+        except pagination.InvalidCursor as e:
+            return jsonify({'error': str(e)}), 400
+        query = query.filter(Fine.id > after_id)
+    rows = query.order_by(Fine.id).limit(per_page + 1).all()
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    
+    total_count, total_amount = db.session.query(
+        db.func.count(Fine.id), db.func.coalesce(db.func.sum(Fine.amount), 0)
+    ).filter(*filters).one()
     
     return jsonify({
         'fines': [{
-            'id': f.id,
-            'user_name': f"{f.user.first_name} {f.user.last_name}",
-            'user_email': f.user.email,
-            'book_title': f.borrowing.book.title,
-            'amount': f.amount,
-            'reason': f.reason,
-            'created_at': f.created_at.isoformat()
-        } for f in fines]
+            'id': row.Fine.id,
+            'user_id': row.Fine.user_id,
+            'user_name': f"{row.first_name} {row.last_name}",
+            'user_email': row.email,
+            'book_title': row.title,
+            'amount': row.Fine.amount,
+            'reason': row.Fine.reason,
+            'status': row.Fine.status,
+            'created_at': row.Fine.created_at.isoformat()
+        } for row in rows],
+        'next_cursor': pagination.encode_cursor('fines', [rows[-1].Fine.id]) if has_more else None,
+        'total_count': total_count,
+        'total_amount': round(float(total_amount), 2)
     })
 
-@app.route('/api/admin/fines/<int:fine_id>/waive', methods=['POST'])
-def waive_fine(fine_id):
+@app.route('/api/admin/fines/summary', methods=['GET'])
+@read_only
+def fines_summary():
     if 'admin_id' not in session:
         return jsonify({'error': 'Admin not logged in'}), 401
     
+    status = request.args.get('status', 'pending')
+    sort = request.args.get('sort', 'total')
+    page = max(1, request.args.get('page', 1, type=int))
+    per_page = max(1, min(request.args.get('per_page', 50, type=int), MAX_FINES_PAGE_SIZE))
+    
+    # Aggregate per user in SQL, then join names onto just this page of users
+    per_user = db.session.query(
+        Fine.user_id.label('user_id'),
+        db.func.sum(Fine.amount).label('total'),
+        db.func.count(Fine.id).label('count'),
+        db.func.min(Fine.created_at).label('oldest')
+    ).filter(Fine.status == status).group_by(Fine.user_id).subquery()
+    
+    orderings = {
+        'total': (per_user.c.total.desc(), per_user.c.user_id),
+        'count': (per_user.c.count.desc(), per_user.c.user_id),
+        'oldest': (per_user.c.oldest, per_user.c.user_id),
+    }
+    if sort not in orderings:
+        return jsonify({'error': f'Unsupported sort: {sort}'}), 400
+    
+    rows = db.session.query(
+        per_user, User.first_name, User.last_name, User.email
+    ).join(User, User.id == per_user.c.user_id).order_by(
+        *orderings[sort]
+    ).offset((page - 1) * per_page).limit(per_page).all()
+    users_with_fines = db.session.query(db.func.count()).select_from(per_user).scalar()
+    
+    return jsonify({
+        'users': [{
+            'user_id': row.user_id,
+            'user_name': f"{row.first_name} {row.last_name}",
+            'user_email': row.email,
+            'total_amount': round(float(row.total), 2),
+            'fine_count': row.count,
+            'oldest_fine': row.oldest.isoformat() if row.oldest else None
+        } for row in rows],
+        'total_users': users_with_fines,
+        'pages': (users_with_fines + per_page - 1) // per_page,
+        'current_page': page
+    })
+
+def fine_notice(fine, title, outcome):
+    """Notification row telling a user what happened to one of their fines"""
+    return {
+        'user_id': fine.user_id,
+        'title': title,
+        'message': f'Your fine of ${fine.amount:.2f} {outcome}.',
+        'type': 'success',
+        'created_at': datetime.utcnow()
+    }
+
+def settle_fine(fine_id, status, title, outcome, **values):
+    """Move a pending fine to `status` and notify its user; returns an error response, or None"""
     fine = Fine.query.get_or_404(fine_id)
-    fine.status = 'waived'
+    if fine.status != 'pending':
+        return jsonify({'error': f'Fine is already {fine.status}'}), 409
+    
+    before = fine_user_snapshot({fine.user_id})
+    # Conditional on the status, so of two concurrent calls only the first settles the fine
+    updated = db.session.execute(
+        db.update(Fine).where(Fine.id == fine_id, Fine.status == 'pending').values(status=status, **values),
+        execution_options={'synchronize_session': False}
+    ).rowcount
+    if not updated:
+        db.session.rollback()
+        return jsonify({'error': 'Fine is no longer pending'}), 409
+    bump_fine_user_counters({fine.user_id}, before)
+    send_notifications([fine_notice(fine, title, outcome)])
     db.session.commit()
+    return None
+
+@app.route('/api/admin/fines/<int:fine_id>/waive', methods=['POST'])
+def waive_fine(fine_id):
+    if 'admin_id' not in session:
+        return jsonify({'error': 'Admin not logged in'}), 401
+    
+    error = settle_fine(fine_id, 'waived', 'Fine Waived', 'has been waived')
+    if error:
+        return error
     
     return jsonify({'message': 'Fine waived successfully'})
 
@@ -777,41 +2950,64 @@ def pay_fine(fine_id):
     if 'admin_id' not in session:
         return jsonify({'error': 'Admin not logged in'}), 401
     
-    fine = Fine.query.get_or_404(fine_id)
-    fine.status = 'paid'
-    fine.paid_at = datetime.utcnow()
-    db.session.commit()
+    error = settle_fine(fine_id, 'paid', 'Fine Paid', 'has been paid', paid_at=datetime.utcnow())
+    if error:
+        return error
     
     return jsonify({'message': 'Fine marked as paid'})
 
 # Reports & Analytics
+REPORT_PERIODS = {'week': 7, 'month': 30, 'quarter': 90, 'year': 365}
+REPORT_BUCKETS = {'week': 'day', 'month': 'day', 'quarter': 'week', 'year': 'month'}  # period -> default bucket
+
+def bucket_start(day, bucket):
+    """First day of the day/week (Monday)/month bucket containing `day`"""
+    if bucket == 'week':
+        return day - timedelta(days=day.weekday())
+    if bucket == 'month':
+        return day.replace(day=1)
+    return day
+
+def overdue_rate(counts):
+    """Share of returns that came back after their due date"""
+    return round(counts['late_returns'] / counts['returns'], 4) if counts['returns'] else 0
+
 @app.route('/api/admin/reports/circulation', methods=['GET'])
+@read_only
 def circulation_report():
     if 'admin_id' not in session:
         return jsonify({'error': 'Admin not logged in'}), 401
     
     period = request.args.get('period', 'month')
-    
-    # Calculate date range
-    if period == 'week':
-        start_date = datetime.utcnow() - timedelta(days=7)
-    elif period == 'month':
-        start_date = datetime.utcnow() - timedelta(days=30)
-    elif period == 'quarter':
-        start_date = datetime.utcnow() - timedelta(days=90)
-    elif period == 'year':
-        start_date = datetime.utcnow() - timedelta(days=365)
-    else:
-        start_date = datetime.utcnow() - timedelta(days=30)
-    
-    # Get circulation data
-    borrowings = Borrowing.query.filter(
-        Borrowing.borrowed_date >= start_date
-    ).all()
-    
-    returns = Borrowing.query.filter(
-        Borrowing.returned_date >= start_date
-    ).all()
+    if period not in REPORT_PERIODS:
+        period = 'month'
+    bucket = request.args.get('bucket', REPORT_BUCKETS[period])
+    if bucket not in ('day', 'week', 'month'):
+        return jsonify({'error': 'bucket must be day, week or month'}), 400
+    
+    # Calculate date range: whole UTC days, ending with today
+    now = datetime.utcnow()
+    today = now.date()
+    first_day = today - timedelta(days=REPORT_PERIODS[period])
+    start_date = day_start(first_day)
+    
+    # Rolled-up days come from the rollup; days after it (the job may be behind) and today are counted live
+    days = {
+        row.day: {name: getattr(row, name) for name in CIRCULATION_SERIES}
+        for row in CirculationDaily.query.filter(CirculationDaily.day >= first_day, CirculationDaily.day < today)
+    }
+    live_from = max([first_day] + [day + timedelta(days=1) for day in days])
+    days.update(daily_circulation(day_start(live_from), day_start(today + timedelta(days=1))))
+    
+    series, totals = {}, dict.fromkeys(CIRCULATION_SERIES, 0)
+    for offset in range((today - first_day).days + 1):
+        day = first_day + timedelta(days=offset)
+        counts = days.get(day)
+        bucket_counts = series.setdefault(bucket_start(day, bucket), dict.fromkeys(CIRCULATION_SERIES, 0))
+        if counts:
+            for name in CIRCULATION_SERIES:
+                bucket_counts[name] += counts[name]
+                totals[name] += counts[name]
     
     # Get popular books
     popular_books = db.session.query(
@@ -824,9 +3020,16 @@ def circulation_report():
     
     return jsonify({
         'period': period,
+        'bucket': bucket,
         'start_date': start_date.isoformat(),
-        'total_borrowings': len(borrowings),
-        'total_returns': len(returns),
+        'total_borrowings': totals['borrows'],
+        'total_returns': totals['returns'],
+        'total_renewals': totals['renewals'],
+        'overdue_rate': overdue_rate(totals),
+        'series': [
+            dict(start=start.isoformat(), overdue_rate=overdue_rate(counts), **counts)
+            for start, counts in sorted(series.items())
+        ],
         'popular_books': [{
             'title': book.title,
             'author': book.author,
@@ -834,14 +3037,500 @@ def circulation_report():
         } for book in popular_books]
     })
 
+# User Import
+# Rosters are read as a stream and handled in batches: one set-based duplicate
+# check, one parallel hashing pass and one multi-row INSERT per batch
+USER_IMPORT_BATCH_SIZE = 1000
+USER_IMPORT_REQUIRED = ('email', 'password', 'first_name', 'last_name', 'user_type')
+USER_TYPES = ('student', 'faculty')
+MAX_REPORTED_IMPORT_ERRORS = 1000
+
+def clean_user_record(record):
+    """Validate one roster record; returns (row values, error message)"""
+    if isinstance(record, data_import.RecordError):
+        return None, str(record)
+    missing = [field for field in USER_IMPORT_REQUIRED if not str(record.get(field) or '').strip()]
+    if missing:
+        return None, f'Missing {", ".join(missing)}'
+    user_type = str(record['user_type']).strip().lower()
+    if user_type not in USER_TYPES:
+        return None, f'user_type must be one of: {", ".join(USER_TYPES)}'
+    try:
+        max_books = int(record.get('max_books') or (10 if user_type == 'faculty' else 5))
+    except (TypeError, ValueError):
+        return None, 'max_books must be an integer'
+    values = {
+        'email': str(record['email']).strip(),
+        'password': str(record['password']),
+        'first_name': str(record['first_name']).strip(),
+        'last_name': str(record['last_name']).strip(),
+        'user_type': user_type,
+        'student_id': str(record.get('student_id') or '').strip() or None,
+        'department': str(record.get('department') or '').strip() or None,
+        'phone': str(record.get('phone') or '').strip() or None,
+        'max_books': max_books,
+    }
+    if '@' not in values['email'] or len(values['email']) > 120:
+        return None, 'Invalid email'
+    return values, None
+
+def insert_user_rows(rows):
+    """Insert user rows in one statement; on a race with another insert, fall back to row by row.
+
+    Returns the ids of rows that failed.
+    """
+    try:
+        with db.session.begin_nested():
+            db.session.execute(db.insert(User), rows)
+        return set()
+    except IntegrityError:
+        failed = set()
+        for row in rows:
+            try:
+                with db.session.begin_nested():
+                    db.session.execute(db.insert(User), [row])
+            except IntegrityError:
+                failed.add(row['email'])
+        return failed
+
+def import_users(records, batch_size=USER_IMPORT_BATCH_SIZE):
+    """Import (line_number, record) pairs; returns counts and per-row errors"""
+    report = {'processed': 0, 'imported': 0, 'failed': 0, 'errors': []}
+    seen_emails, seen_student_ids = set(), set()
+
+    def reject(line, error):
+        report['failed'] += 1
+        if len(report['errors']) < MAX_REPORTED_IMPORT_ERRORS:
+            report['errors'].append({'line': line, 'error': error})
+
+    for batch in data_import.batched(records, batch_size):
+        report['processed'] += len(batch)
+        candidates = []
+        for line, record in batch:
+            values, error = clean_user_record(record)
+            if error:
+                reject(line, error)
+            elif values['email'] in seen_emails:
+                reject(line, 'Duplicate email in file')
+            elif values['student_id'] and values['student_id'] in seen_student_ids:
+                reject(line, 'Duplicate student_id in file')
+            else:
+                seen_emails.add(values['email'])
+                if values['student_id']:
+                    seen_student_ids.add(values['student_id'])
+                candidates.append((line, values))
+        if not candidates:
+            continue
+
+        # One lookup per key for the whole batch
+        taken_emails = {email for email, in db.session.query(User.email).filter(
+            User.email.in_([values['email'] for _, values in candidates])
+        )}
+        student_ids = [values['student_id'] for _, values in candidates if values['student_id']]
+        taken_student_ids = {student_id for student_id, in db.session.query(User.student_id).filter(
+            User.student_id.in_(student_ids)
+        )} if student_ids else set()
+        accepted = []
+        for line, values in candidates:
+            if values['email'] in taken_emails:
+                reject(line, 'Email already registered')
+            elif values['student_id'] in taken_student_ids:
+                reject(line, 'Student ID already registered')
+            else:
+                accepted.append((line, values))
+        if not accepted:
+            continue
+
+        now = datetime.utcnow()
+        hashes = password_pool.hash_passwords([values.pop('password') for _, values in accepted])
+        rows = [
+            dict(values, password_hash=password_hash, status='active', active_loans=0, created_at=now)
+            for (_, values), password_hash in zip(accepted, hashes)
+        ]
+        failed = insert_user_rows(rows)
+        for line, values in accepted:
+            if values['email'] in failed:
+                reject(line, 'Email already registered')
+        inserted = len(rows) - len(failed)
+        report['imported'] += inserted
+        bump_counter('total_users', inserted)
+        bump_counter('active_users', inserted)
+        bump_versions('users')
+        db.session.commit()
+    report['errors'].sort(key=lambda error: error['line'])
+    return report
+
+@app.route('/api/admin/users/import', methods=['POST'])
+def import_users_endpoint():
+    if 'admin_id' not in session:
+        return jsonify({'error': 'Admin not logged in'}), 401
+    
+    # Either a multipart upload ('file') or the raw request body
+    upload = request.files.get('file')
+    filename = upload.filename if upload else ''
+    fmt = request.args.get('format') or data_import.detect_format(filename)
+    if fmt not in ('csv', 'jsonl'):
+        return jsonify({'error': 'format must be csv or jsonl'}), 400
+    
+    stream = data_import.text_stream(upload.stream if upload else request.stream)
+    report = import_users(data_import.read_records(stream, fmt))
+    return jsonify(report)
+
+# Catalog Import
+# Vendor dumps are streamed in batches. Records are keyed on the canonical ISBN-13:
+# repeats within a batch and books already on file get their copy counts merged,
+# everything else is one multi-row INSERT with its subject links and search
+# postings written in bulk. The job row's checkpoint commits with each batch.
+CATALOG_IMPORT_BATCH_SIZE = 1000
+
+def clean_book_record(record):
+    """Validate one catalog record; returns (book values with 'copies', error message)"""
+    if isinstance(record, data_import.RecordError):
+        return None, str(record)
+
+    def text(field, limit):
+        value = record.get(field)
+        value = ' '.join(str(value).split()) if value is not None else ''
+        return value[:limit] or None
+
+    values = {
+        'title': text('title', 200),
+        'author': text('author', 100),
+        'isbn': text('isbn', 20),
+        'subject': text('subject', 100),
+        'description': str(record.get('description') or '').strip() or None,
+        'shelf_location': text('shelf_location', 50),
+        'condition': (text('condition', 20) or 'good').lower(),
+    }
+    if not values['title'] or not values['author']:
+        return None, 'title and author are required'
+    values['isbn13'] = isbn.normalize_isbn(values['isbn'])
+    if values['isbn'] and not values['isbn13']:
+        return None, f'Invalid ISBN: {values["isbn"]}'
+    try:
+        values['copies'] = int(record.get('copies') or record.get('total_copies') or 1)
+        year = record.get('publication_year')
+        values['publication_year'] = int(year) if year not in (None, '') else None
+    except (TypeError, ValueError):
+        return None, 'copies and publication_year must be integers'
+    if values['copies'] < 1:
+        return None, 'copies must be at least 1'
+    return values, None
+
+def shelve_new_copies(added, now):
+    """Put copies added to existing books ({book_id: n}) on the shelf, or to the head of their hold queues"""
+    if not added:
+        return
+    queued = {book_id for book_id, in db.session.query(Reservation.book_id).filter(
+        Reservation.book_id.in_(list(added)),
+        Reservation.status == 'active'
+    ).distinct()}
+    db.session.execute(
+        db.update(Book).where(Book.id.in_(list(added)))
+        .values(total_copies=Book.total_copies + db.case(added, value=Book.id, else_=0)),
+        execution_options={'synchronize_session': False}
+    )
+    shelved = {book_id: n for book_id, n in added.items() if book_id not in queued}
+    if shelved:
+        db.session.execute(
+            db.update(Book).where(Book.id.in_(list(shelved)))
+            .values(available_copies=Book.available_copies + db.case(shelved, value=Book.id, else_=0)),
+            execution_options={'synchronize_session': False}
+        )
+    for book_id in sorted(queued):
+        release_copies(book_id, lock_book(book_id), added[book_id], now)
+
+def link_and_index_new_books(books):
+    """Write subject links, subject counts and search postings for freshly inserted {id: values}"""
+    names = {}
+    for values in books.values():
+        names.update(split_subjects(values['subject']))
+    subject_ids = {subject.slug: subject.id for subject in get_or_create_subjects(names)}
+
+    links, per_subject, postings = [], {}, []
+    for book_id, values in books.items():
+        for slug in split_subjects(values['subject']):
+            links.append({'book_id': book_id, 'subject_id': subject_ids[slug]})
+            per_subject[subject_ids[slug]] = per_subject.get(subject_ids[slug], 0) + 1
+        postings.extend(
+            {'term': term, 'book_id': book_id, 'weight': weight}
+            for term, weight in search_index.book_terms(values).items()
+        )
+    if links:
+        db.session.execute(book_subject.insert(), links)
+        db.session.execute(
+            db.update(Subject).where(Subject.id.in_(list(per_subject)))
+            .values(book_count=Subject.book_count + db.case(per_subject, value=Subject.id, else_=0)),
+            execution_options={'synchronize_session': False}
+        )
+    if postings:
+        db.session.execute(db.insert(BookSearchTerm), postings)
+
+def insert_new_books(rows):
+    """Insert new book rows; returns ({id: values}, {isbn13: copies} that turned out to exist already)"""
+    keyed = [row for row in rows if row['isbn13']]
+    inserted, raced = {}, {}
+    try:
+        with db.session.begin_nested():
+            if keyed:
+                db.session.execute(db.insert(Book), keyed)
+    except IntegrityError:
+        # Another import added some of these ISBNs meanwhile: retry one by one
+        keyed, retry = [], keyed
+        for row in retry:
+            try:
+                with db.session.begin_nested():
+                    db.session.execute(db.insert(Book), [row])
+                keyed.append(row)
+            except IntegrityError:
+                raced[row['isbn13']] = row['total_copies']
+    if keyed:
+        by_isbn = {row['isbn13']: row for row in keyed}
+        for book_id, isbn13 in db.session.query(Book.id, Book.isbn13).filter(Book.isbn13.in_(list(by_isbn))):
+            inserted[book_id] = by_isbn[isbn13]
+    # Without an ISBN there is no key to read the id back by, so these go one at a time
+    for row in rows:
+        if not row['isbn13']:
+            book_id = db.session.execute(db.insert(Book).values(**row)).inserted_primary_key[0]
+            inserted[book_id] = row
+    return inserted, raced
+
+def import_catalog(records, job, batch_size=CATALOG_IMPORT_BATCH_SIZE):
+    """Import (line_number, record) pairs for an ImportJob, skipping records it already committed"""
+    started = datetime.utcnow()
+    errors = []
+    skip = job.records_done
+    for batch in data_import.batched(islice(records, skip, None), batch_size):
+        now = datetime.utcnow()
+
+        # Clean, then fold repeats of an ISBN within the batch into one row
+        rows, by_isbn, failed = [], {}, 0
+        for line, record in batch:
+            values, error = clean_book_record(record)
+            if error:
+                failed += 1
+                if len(errors) < MAX_REPORTED_IMPORT_ERRORS:
+                    errors.append({'line': line, 'error': error})
+                continue
+            key = values['isbn13']
+            if key and key in by_isbn:
+                by_isbn[key]['total_copies'] += values['copies']
+                continue
+            copies = values.pop('copies')
+            row = dict(values, total_copies=copies, available_copies=copies, created_at=now)
+            rows.append(row)
+            if key:
+                by_isbn[key] = row
+
+        # One lookup finds the ISBNs already on file; those only gain copies
+        existing = dict(db.session.query(Book.isbn13, Book.id).filter(
+            Book.isbn13.in_(list(by_isbn))
+        )) if by_isbn else {}
+        added = {existing[key]: row['total_copies'] for key, row in by_isbn.items() if key in existing}
+        new_rows = [row for row in rows if row['isbn13'] not in existing]
+        for row in new_rows:
+            row['available_copies'] = row['total_copies']
+
+        inserted, raced = insert_new_books(new_rows)
+        if raced:
+            for book_id, isbn13 in db.session.query(Book.id, Book.isbn13).filter(Book.isbn13.in_(list(raced))):
+                added[book_id] = added.get(book_id, 0) + raced[isbn13]
+        shelve_new_copies(added, now)
+        add_book_copies({**added, **{book_id: row['total_copies'] for book_id, row in inserted.items()}}, now)
+        link_and_index_new_books(inserted)
+
+        if inserted:
+            bump_counter('total_books', len(inserted))
+        bump_versions('catalog')
+        job.records_done += len(batch)
+        job.inserted += len(inserted)
+        job.merged += len(batch) - failed - len(inserted)
+        job.failed += failed
+        job.updated_at = now
+        db.session.commit()
+
+    job.status = 'completed'
+    job.finished_at = datetime.utcnow()
+    db.session.commit()
+
+    elapsed = (job.finished_at - started).total_seconds()
+    processed = job.records_done - skip
+    return {
+        'job_id': job.id,
+        'status': job.status,
+        'records_done': job.records_done,
+        'inserted': job.inserted,
+        'merged': job.merged,
+        'failed': job.failed,
+        'resumed_after': skip,
+        'elapsed_seconds': round(elapsed, 3),
+        'records_per_second': round(processed / elapsed, 1) if elapsed else None,
+        'errors': sorted(errors, key=lambda error: error['line']),
+    }
+
+def backfill_isbn13(batch_size=1000):
+    """Fill Book.isbn13 from isbn for rows written before the column existed; returns rows filled.
+
+    A second book whose ISBN normalizes to a key already taken is left NULL
+    rather than failing the migration; those are the duplicates to merge by hand.
+    """
+    filled = 0
+    last_id = 0
+    while True:
+        rows = db.session.query(Book.id, Book.isbn).filter(
+            Book.id > last_id, Book.isbn.isnot(None)
+        ).order_by(Book.id).limit(batch_size).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+        keys = {}
+        for row in rows:
+            key = isbn.normalize_isbn(row.isbn)
+            if key and key not in keys.values():
+                keys[row.id] = key
+        taken = {key for key, in db.session.query(Book.isbn13).filter(Book.isbn13.in_(list(keys.values())))}
+        updates = {book_id: key for book_id, key in keys.items() if key not in taken}
+        if updates:
+            db.session.execute(
+                db.update(Book).where(Book.id.in_(list(updates)))
+                .values(isbn13=db.case(updates, value=Book.id)),
+                execution_options={'synchronize_session': False}
+            )
+        db.session.commit()
+        filled += len(updates)
+    return filled
+
+def start_import_job(kind, source, fmt, resume_id=None):
+    """Create a job, or reopen an unfinished one to resume; returns (job, error message)"""
+    if resume_id is None:
+        job = ImportJob(kind=kind, source=source, format=fmt)
+        db.session.add(job)
+        db.session.commit()
+        return job, None
+    job = db.session.get(ImportJob, resume_id)
+    if not job or job.kind != kind:
+        return None, 'Import job not found'
+    if job.status == 'completed':
+        return None, 'Import job already completed'
+    job.status = 'running'
+    db.session.commit()
+    return job, None
+
+def run_catalog_import(job, stream, batch_size=CATALOG_IMPORT_BATCH_SIZE):
+    """Run an import job to completion, marking it failed (resumable) if it stops early"""
+    try:
+        return import_catalog(data_import.read_records(stream, job.format), job, batch_size)
+    except Exception:
+        db.session.rollback()
+        job.status = 'failed'
+        job.updated_at = datetime.utcnow()
+        db.session.commit()
+        raise
+
+@app.route('/api/admin/books/import', methods=['POST'])
+def import_books_endpoint():
+    if 'admin_id' not in session:
+        return jsonify({'error': 'Admin not logged in'}), 401
+    
+    # Either a multipart upload ('file') or the raw request body; resume with ?job_id=
+    upload = request.files.get('file')
+    filename = upload.filename if upload else ''
+    fmt = request.args.get('format') or data_import.detect_format(filename)
+    if fmt not in data_import.FORMATS:
+        return jsonify({'error': 'format must be csv, jsonl or marc'}), 400
+    
+    job, error = start_import_job('catalog', filename or None, fmt, request.args.get('job_id', type=int))
+    if error:
+        return jsonify({'error': error}), 400
+    stream = data_import.text_stream(upload.stream if upload else request.stream)
+    return jsonify(run_catalog_import(job, stream))
+
+@app.route('/api/admin/books/import/<int:job_id>', methods=['GET'])
+def import_job_status(job_id):
+    if 'admin_id' not in session:
+        return jsonify({'error': 'Admin not logged in'}), 401
+    
+    job = ImportJob.query.get_or_404(job_id)
+    return jsonify({
+        'job_id': job.id,
+        'kind': job.kind,
+        'source': job.source,
+        'format': job.format,
+        'status': job.status,
+        'records_done': job.records_done,
+        'inserted': job.inserted,
+        'merged': job.merged,
+        'failed': job.failed,
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'updated_at': job.updated_at.isoformat() if job.updated_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None
+    })
+
+# Data Export
+# Each chunk is a keyset range read on its own short-lived connection through a
+# server-side cursor, and the connection is released before the chunk is sent,
+# so a slow client never keeps a transaction open
+EXPORT_CHUNK_SIZE = 5000
+EXPORT_DATASETS = {
+    'books': Book.__table__,
+    'borrowings': Borrowing.__table__,
+    'fines': Fine.__table__,
+    'users': User.__table__,
+}
+EXPORT_EXCLUDED_COLUMNS = {'password_hash'}
+
+def export_columns(dataset):
+    table = EXPORT_DATASETS[dataset]
+    return [column for column in table.columns if column.name not in EXPORT_EXCLUDED_COLUMNS]
+
+def export_chunks(engine, dataset, after_id=0, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield lists of rows in id order, one short read per chunk"""
+    columns = export_columns(dataset)
+    id_column = EXPORT_DATASETS[dataset].c.id
+    while True:
+        with engine.connect().execution_options(stream_results=True) as conn:
+            result = conn.execute(
+                db.select(*columns).where(id_column > after_id).order_by(id_column).limit(chunk_size)
+            )
+            rows = [tuple(row) for partition in result.partitions(1000) for row in partition]
+        if not rows:
+            return
+        yield rows
+        after_id = rows[-1][0]
+        if len(rows) < chunk_size:
+            return
+
+@app.route('/api/admin/export/<dataset>', methods=['GET'])
+def export_data(dataset):
+    if 'admin_id' not in session:
+        return jsonify({'error': 'Admin not logged in'}), 401
+    
+    if dataset not in EXPORT_DATASETS:
+        return jsonify({'error': f'dataset must be one of: {", ".join(sorted(EXPORT_DATASETS))}'}), 400
+    fmt = request.args.get('format', 'csv')
+    if fmt not in data_export.FORMATS:
+        return jsonify({'error': 'format must be csv or ndjson'}), 400
+    after_id = request.args.get('after', 0, type=int)
+    
+    names = [column.name for column in export_columns(dataset)]
+    body = data_export.encode(names, export_chunks(db.engine, dataset, after_id), fmt)
+    response = app.response_class(body, content_type=data_export.FORMATS[fmt])
+    response.headers['Content-Disposition'] = f'attachment; filename={dataset}.{fmt}'
+    response.headers['X-Accel-Buffering'] = 'no'  # let proxies pass chunks through
+    return response
+
 @app.route('/api/logout')
 def logout():
     session.clear()
     return jsonify({'message': 'Logged out successfully'})
 
 if __name__ == '__main__':
+    # migrate imports this module as `app`; give it the running one instead of a second copy
+    sys.modules.setdefault('app', sys.modules[__name__])
+    import migrate
+    
     with app.app_context():
-        db.create_all()
+        migrate.upgrade()
         
         # Create sample admin user
         if not Admin.query.filter_by(username='admin').first():
@@ -869,7 +3558,22 @@ if __name__ == '__main__':
             for book in sample_books:
                 db.session.add(book)
             
+            db.session.flush()
+            for book in sample_books:
+                sync_book_subjects(book)
+                index_book(book)
+            add_book_copies({book.id: book.total_copies for book in sample_books}, datetime.utcnow())
+            
             db.session.commit()
             print("Sample books created")
-    
+        
+        reconcile_stat_counters()
+    
+    # The debug reloader runs this script in a watcher process and again in the
+    # serving child (WERKZEUG_RUN_MAIN); only the process that serves runs background jobs
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        scheduler.start_periodic('reconcile-stats', STATS_RECONCILE_INTERVAL, reconcile_stat_counters_job)
+        scheduler.start_periodic('sweep-overdue', OVERDUE_SWEEP_INTERVAL, sweep_overdue_loans_job)
+        scheduler.start_periodic('expire-holds', HOLD_EXPIRY_INTERVAL, expire_holds_job)
+        scheduler.start_periodic('rollup-circulation', CIRCULATION_ROLLUP_INTERVAL, rollup_circulation_job)
     app.run(debug=True, host='0.0.0.0', port=5000)
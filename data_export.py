@@ -0,0 +1,54 @@
+"""
+Streaming encoders for bulk data exports.
+Rows arrive in bounded chunks and each chunk becomes one piece of the output,
+so memory stays flat however many rows are exported.
+"""
+
+import csv
+import io
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+def json_default(value):
+    """Serialize the column types json can't handle natively"""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f'Cannot serialize {type(value).__name__}')
+
+
+def csv_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def encode(columns, chunks, fmt):
+    """Yield the export as text pieces: a CSV header then one piece per chunk, or NDJSON lines"""
+    if fmt not in FORMATS:
+        raise ValueError(f'Unknown export format: {fmt}')
+
+    if fmt == 'csv':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(columns)
+        yield buffer.getvalue()
+        for rows in chunks:
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerows([csv_value(value) for value in row] for row in rows)
+            yield buffer.getvalue()
+    else:
+        for rows in chunks:
+            yield ''.join(
+                json.dumps(dict(zip(columns, row)), default=json_default, separators=(',', ':')) + '\n'
+                for row in rows
+            )
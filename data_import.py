@@ -0,0 +1,138 @@
+"""
+Streaming readers for bulk imports.
+Records are parsed a line at a time and handed on in fixed-size batches,
+so an import's memory use doesn't grow with the size of the file.
+"""
+
+import csv
+import io
+import json
+import os
+import re
+from itertools import islice
+
+FORMATS = ('csv', 'jsonl', 'marc')
+
+
+class RecordError(ValueError):
+    """A line of the input that could not be parsed into a record"""
+
+
+def detect_format(filename, default='csv'):
+    """Guess the format from a file name: .jsonl/.ndjson/.json are JSON Lines, .mrk is MARC text"""
+    extension = os.path.splitext(filename or '')[1].lower()
+    if extension in ('.jsonl', '.ndjson', '.json'):
+        return 'jsonl'
+    if extension in ('.mrk', '.marc'):
+        return 'marc'
+    if extension == '.csv':
+        return 'csv'
+    return default
+
+
+def text_stream(binary):
+    """Wrap an uploaded byte stream for line-by-line decoding (a UTF-8 BOM is dropped)"""
+    return io.TextIOWrapper(binary, encoding='utf-8-sig', newline='')
+
+
+def read_records(stream, fmt):
+    """Yield (line_number, record) pairs; unparseable lines yield a RecordError as the record"""
+    if fmt not in FORMATS:
+        raise ValueError(f'Unknown import format: {fmt}')
+
+    if fmt == 'marc':
+        yield from read_marc_records(stream)
+        return
+
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, {
+                key.strip(): value.strip() if isinstance(value, str) else value
+                for key, value in row.items() if key
+            }
+        return
+
+    for line_number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield line_number, RecordError(f'Invalid JSON: {e}')
+            continue
+        if not isinstance(record, dict):
+            yield line_number, RecordError('Each line must be a JSON object')
+            continue
+        yield line_number, record
+
+
+# MARC text ("mnemonic") records: one "=TAG  IIdata" line per field, subfields
+# introduced by "$", a blank line or a new =LDR between records. Only the
+# fields a catalog import needs are mapped.
+_MARC_LINE_RE = re.compile(r'^=(\w{3})  (.*)$')
+_MARC_TRAILING_PUNCTUATION = ' /:;,.='
+
+
+def marc_subfields(data):
+    """Split field data (after the two indicators) into [(code, value)]"""
+    return [(part[0], part[1:].strip()) for part in data[2:].split('$') if part]
+
+
+def marc_record(fields):
+    """Map parsed MARC fields to a flat book record"""
+    def first(tag, codes):
+        for subfields in fields.get(tag, []):
+            values = [value for code, value in subfields if code in codes]
+            if values:
+                return ' '.join(values).strip(_MARC_TRAILING_PUNCTUATION)
+        return None
+
+    year = re.search(r'\d{4}', first('264', 'c') or first('260', 'c') or '')
+    subjects = []
+    for subfields in fields.get('650', []):
+        subjects.extend(value.strip(_MARC_TRAILING_PUNCTUATION) for code, value in subfields if code == 'a')
+    return {
+        'isbn': (first('020', 'a') or '').split(' ')[0] or None,
+        'title': first('245', 'ab'),
+        'author': first('100', 'a') or first('110', 'a'),
+        'subject': ', '.join(subjects) or None,
+        'description': first('520', 'a'),
+        'publication_year': int(year.group()) if year else None,
+        'shelf_location': first('852', 'h'),
+        'copies': len(fields.get('949', [])) or 1,  # one 949 item field per physical copy
+    }
+
+
+def read_marc_records(stream):
+    """Yield (line_number, record) for MARC text records, parsed one record at a time"""
+    fields, start = {}, None
+    for line_number, line in enumerate(stream, start=1):
+        line = line.rstrip('\r\n')
+        match = _MARC_LINE_RE.match(line)
+        if not line.strip() or (match and match.group(1) == 'LDR'):
+            if fields:
+                yield start, marc_record(fields)
+            fields, start = {}, None
+            if not match:
+                continue
+        if start is None:
+            start = line_number
+        if not match:
+            yield line_number, RecordError('Not a MARC text field line')
+            continue
+        tag, data = match.groups()
+        if tag != 'LDR':
+            fields.setdefault(tag, []).append(marc_subfields(data))
+    if fields:
+        yield start, marc_record(fields)
+
+
+def batched(iterable, size):
+    """Yield lists of up to `size` items"""
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
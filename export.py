@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+"""
+Bulk data export for Library Management System
+Streams a table to a file (or stdout) as CSV or NDJSON, for example:
+
+    python export.py borrowings --format ndjson --output borrowings.ndjson
+"""
+
+import argparse
+import sys
+
+import data_export
+from app import app, db, EXPORT_DATASETS, EXPORT_CHUNK_SIZE, export_columns, export_chunks
+
+def main():
+    """Parse the command line and stream the requested dataset"""
+    parser = argparse.ArgumentParser(description='Library Management System data export')
+    parser.add_argument('dataset', choices=sorted(EXPORT_DATASETS), help='table to export')
+    parser.add_argument('--format', choices=sorted(data_export.FORMATS), default='csv', help='output format')
+    parser.add_argument('--output', help='file to write (default: stdout)')
+    parser.add_argument('--after', type=int, default=0, help='resume after this id')
+    parser.add_argument('--chunk-size', type=int, default=EXPORT_CHUNK_SIZE, help='rows read per query')
+    args = parser.parse_args()
+
+    with app.app_context():
+        names = [column.name for column in export_columns(args.dataset)]
+        chunks = export_chunks(db.engine, args.dataset, args.after, args.chunk_size)
+        out = open(args.output, 'w', newline='', encoding='utf-8') if args.output else sys.stdout
+        try:
+            for piece in data_export.encode(names, chunks, args.format):
+                out.write(piece)
+        finally:
+            if out is not sys.stdout:
+                out.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,500 @@
+#!/usr/bin/env python3
+"""
+Synthetic data generator for Library Management System
+Fills the database with a reproducible, production-sized library, for example:
+
+    python generate_data.py --scale 1            # 100k books, 50k users, 5M borrowings
+    python generate_data.py --scale 0.01 --seed 7
+
+Scale factor 1 (SF1) is 100,000 books, 50,000 users and 5,000,000 borrowings over
+three years, with reservations and fines to match. The same seed, scale and
+--as-of date always produce the same rows. Popularity is skewed: a minority of
+titles (with more copies) takes most loans, some readers borrow far more than
+others, and a minority of readers returns most of the late books. Rows are
+written with multi-row INSERTs in large batches while the secondary indexes
+are dropped, and the indexes are rebuilt after the load.
+Generated rows are appended after the existing ids, so the sample data stays.
+Every generated reader's password is GENERATED_PASSWORD.
+"""
+
+import argparse
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from itertools import accumulate
+
+from werkzeug.security import generate_password_hash
+
+import isbn
+from data_import import batched
+from app import (
+    app, db, User, Book, BookCopy, Borrowing, Reservation, Fine, Renewal,
+    book_subject, BookSearchTerm, ACTIVE_LOAN_STATUSES, LOAN_PERIOD_DAYS, RENEWAL_PERIOD_DAYS,
+    FINE_PER_DAY, HOLD_QUEUE_DAYS, copy_barcode, link_and_index_new_books, recount_active_loans,
+    reconcile_stat_counters, rebuild_circulation_rollup, bump_versions,
+)
+
+SF1 = {'books': 100_000, 'users': 50_000, 'borrowings': 5_000_000}
+HISTORY_DAYS = 3 * 365
+GENERATED_PASSWORD = 'reader123'
+LOAD_BATCH_SIZE = 10_000
+
+# Skew: weight = (1 - popularity rank share) ** curve. A title's demand is also scaled by
+# its copies (popular titles get more), so the busiest copies stay within what a copy
+# can lend in the history, and the busiest readers within their loan limits.
+BOOK_DEMAND_CURVE = 3  # the top 10% of titles take about 60% of the loans
+READER_ACTIVITY_CURVE = 2  # the most active readers borrow 3x the average
+SUBJECT_POPULARITY_CURVE = 2
+WEEKDAY_FACTORS = (1.2, 1.15, 1.1, 1.05, 1.0, 0.6, 0.5)  # Monday..Sunday
+YEARLY_GROWTH = 0.15  # circulation grows over the history
+RENEWAL_ODDS = (0.75, 0.18, 0.07)  # no renewal, one, two
+LATENESS = ((0.70, 0.04), (0.25, 0.20), (0.05, 0.55))  # (share of readers, chance a loan comes back late)
+MEAN_DAYS_LATE = 6
+RESERVATIONS_PER_BORROWING = 0.05
+HISTORICAL_HOLD_OUTCOMES = (('fulfilled', 0.6), ('expired', 0.25), ('cancelled', 0.15))
+
+SUBJECTS = (
+    'Fiction', 'Science', 'History', 'Technology', 'Mathematics', 'Philosophy', 'Art', 'Music',
+    'Biography', 'Poetry', 'Economics', 'Psychology', 'Medicine', 'Law', 'Education', 'Engineering',
+    'Computer Science', 'Physics', 'Chemistry', 'Biology', 'Geography', 'Politics', 'Religion',
+    'Sociology', 'Travel', 'Cooking', 'Sports', 'Children', 'Mystery', 'Fantasy',
+)
+DEPARTMENTS = (
+    'Computer Science', 'Mathematics', 'Physics', 'Chemistry', 'Biology', 'History', 'English',
+    'Economics', 'Philosophy', 'Engineering', 'Medicine', 'Law', 'Music', 'Art',
+)
+FIRST_NAMES = (
+    'James', 'Mary', 'John', 'Patricia', 'Robert', 'Jennifer', 'Michael', 'Linda', 'David', 'Elizabeth',
+    'Wei', 'Aisha', 'Carlos', 'Priya', 'Yuki', 'Olga', 'Ahmed', 'Fatima', 'Lucas', 'Sofia',
+    'Noah', 'Emma', 'Liam', 'Olivia', 'Mateo', 'Amara', 'Kenji', 'Ingrid', 'Tariq', 'Chloe',
+)
+LAST_NAMES = (
+    'Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Garcia', 'Miller', 'Davis', 'Rodriguez', 'Martinez',
+    'Chen', 'Wang', 'Kumar', 'Singh', 'Kim', 'Nguyen', 'Ivanova', 'Haddad', 'Okafor', 'Tanaka',
+    'Muller', 'Rossi', 'Silva', 'Novak', 'Larsen', 'Dubois', 'Cohen', 'Yilmaz', 'Mensah', 'Patel',
+)
+TITLE_WORDS = (
+    'Shadow', 'River', 'Empire', 'Garden', 'Memory', 'Silence', 'Fire', 'Winter', 'Journey', 'Light',
+    'Machine', 'Ocean', 'Mountain', 'Secret', 'City', 'Dream', 'Storm', 'Mirror', 'Stone', 'Voice',
+    'Theory', 'Principles', 'Foundations', 'History', 'Introduction', 'Elements', 'Structure', 'Nature',
+    'Language', 'Algorithms', 'Systems', 'Networks', 'Patterns', 'Design', 'Analysis', 'Practice',
+)
+TITLE_FORMS = ('The {0} of {1}', '{0} and {1}', 'A {0} in the {1}', 'The {0}', '{0} of the {1}', 'On {0}')
+DESCRIPTION_WORDS = (
+    'story', 'study', 'guide', 'account', 'survey', 'novel', 'collection', 'exploration', 'history',
+    'modern', 'classic', 'practical', 'illustrated', 'comprehensive', 'early', 'contemporary', 'essential',
+    'war', 'love', 'family', 'science', 'society', 'power', 'nature', 'design', 'data', 'mind', 'world',
+    'city', 'sea', 'machines', 'music', 'faith', 'markets', 'law', 'health', 'children', 'travel',
+)
+
+
+def popularity_ranks(rng, items):
+    """{item: share of items more popular than it}, from a seeded shuffle"""
+    ranked = list(items)
+    rng.shuffle(ranked)
+    return {item: position / len(ranked) for position, item in enumerate(ranked)}
+
+
+def sampler(rng, weights):
+    """Draw k items from {item: weight} at once"""
+    items = list(weights)
+    cumulative = list(accumulate(weights.values()))
+    return lambda k: rng.choices(items, cum_weights=cumulative, k=k)
+
+
+def pick(rng, odds):
+    """Index drawn from a tuple of probabilities"""
+    roll = rng.random()
+    for index, chance in enumerate(odds):
+        roll -= chance
+        if roll < 0:
+            return index
+    return len(odds) - 1
+
+
+def synthetic_isbn(book_id):
+    """A valid, unused ISBN-13 in the 979 range derived from the book id"""
+    first12 = f'979{book_id:09d}'
+    return first12 + isbn.isbn13_check_digit(first12)
+
+
+def daily_counts(total, days, start):
+    """Split `total` loans over `days` days by weekday and growth, summing exactly to total"""
+    weights = [
+        WEEKDAY_FACTORS[(start + timedelta(days=day)).weekday()] * (1 + YEARLY_GROWTH * day / 365)
+        for day in range(days)
+    ]
+    scale = total / sum(weights)
+    counts = [int(weight * scale) for weight in weights]
+    by_remainder = sorted(range(days), key=lambda day: weights[day] * scale - counts[day], reverse=True)
+    for day in by_remainder[:total - sum(counts)]:
+        counts[day] += 1
+    return counts
+
+
+class Generator:
+    """One generation run: ids, skew samplers and the open-loan state shared between phases"""
+
+    def __init__(self, seed, scale, as_of, batch_size):
+        self.seed = seed
+        self.as_of = as_of
+        self.batch_size = batch_size
+        self.counts = {name: max(1, round(n * scale)) for name, n in SF1.items()}
+        self.history_start = as_of - timedelta(days=HISTORY_DAYS)
+        self.copies = {}  # book_id -> total copies
+        self.demand = {}  # book_id -> borrowing weight
+        self.activity = {}  # user_id -> borrowing weight
+        self.first_copy_id = {}  # book_id -> id of its copy number 1
+        self.users = {}  # user_id -> (max_books, chance of a late return)
+        self.open_per_book = {}
+        self.open_per_user = {}
+        self.open_pairs = set()
+        self.rows = {}
+
+    def rng(self, phase):
+        return random.Random(f'{self.seed}:{phase}')
+
+    def next_id(self, model):
+        return (db.session.query(db.func.max(model.id)).scalar() or 0) + 1
+
+    def insert(self, table, rows):
+        """One executemany of the rows, handed to the driver as they are (PyMySQL sends multi-row INSERTs);
+        the values already have their column types, so SQLAlchemy's per-row parameter processing is skipped"""
+        if not rows:
+            return
+        statement = db.insert(table).compile(dialect=db.engine.dialect, column_keys=list(rows[0]))
+        if statement.positional:
+            rows = [tuple(row[key] for key in statement.positiontup) for row in rows]
+        db.session.connection().exec_driver_sql(statement.string, rows)
+        self.rows[table.name] = self.rows.get(table.name, 0) + len(rows)
+
+    def commit(self):
+        db.session.commit()
+        bulk_load_settings()
+
+    # Readers
+    def user_rows(self, first_id):
+        rng = self.rng('users')
+        password_hash = generate_password_hash(GENERATED_PASSWORD)
+        ids = range(first_id, first_id + self.counts['users'])
+        ranks = popularity_ranks(self.rng('reader-activity'), ids)
+        for user_id in ids:
+            faculty = rng.random() < 0.15
+            first_name, last_name = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+            lateness = LATENESS[pick(rng, [share for share, _ in LATENESS])][1]
+            max_books = 10 if faculty else 5
+            self.users[user_id] = (max_books, lateness)
+            self.activity[user_id] = (1 - ranks[user_id]) ** READER_ACTIVITY_CURVE
+            yield {
+                'id': user_id,
+                'email': f'reader{user_id}@scale.example.edu',
+                'password_hash': password_hash,
+                'first_name': first_name,
+                'last_name': last_name,
+                'user_type': 'faculty' if faculty else 'student',
+                'student_id': None if faculty else f'SF{user_id:07d}',
+                'department': rng.choice(DEPARTMENTS),
+                'phone': f'555-{rng.randrange(10000):04d}',
+                'status': ('active', 'suspended', 'inactive')[pick(rng, (0.95, 0.03, 0.02))],
+                'max_books': max_books,
+                'active_loans': 0,
+                'created_at': self.history_start - timedelta(days=rng.randrange(365 * 4)),
+            }
+
+    def load_users(self):
+        for batch in batched(self.user_rows(self.next_id(User)), self.batch_size):
+            self.insert(User.__table__, batch)
+            self.commit()
+
+    # Catalog: books with their copies, subject links and search postings
+    def book_rows(self, first_id):
+        rng = self.rng('books')
+        ids = range(first_id, first_id + self.counts['books'])
+        ranks = popularity_ranks(self.rng('book-popularity'), ids)
+        subject_ranks = popularity_ranks(self.rng('subject-popularity'), SUBJECTS)
+        draw_subjects = sampler(rng, {name: (1 - share) ** SUBJECT_POPULARITY_CURVE for name, share in subject_ranks.items()})
+        for book_id in ids:
+            share = ranks[book_id]
+            copies = rng.randint(4, 10) if share < 0.01 else rng.randint(2, 5) if share < 0.1 else (1, 1, 1, 2, 3)[rng.randrange(5)]
+            self.demand[book_id] = copies * (1 - share) ** BOOK_DEMAND_CURVE
+            subjects = list(dict.fromkeys(draw_subjects(rng.randint(1, 3))))
+            title = rng.choice(TITLE_FORMS).format(rng.choice(TITLE_WORDS), rng.choice(TITLE_WORDS))
+            last_name = rng.choice(LAST_NAMES)
+            isbn13 = synthetic_isbn(book_id)
+            self.copies[book_id] = copies
+            yield {
+                'id': book_id,
+                'title': title,
+                'author': f'{rng.choice(FIRST_NAMES)} {last_name}',
+                'isbn': isbn13,
+                'isbn13': isbn13,
+                'subject': ', '.join(subjects),
+                'description': f'A {" ".join(rng.sample(DESCRIPTION_WORDS, 6))} {" ".join(rng.sample(DESCRIPTION_WORDS, 8))}.',
+                'total_copies': copies,
+                'available_copies': copies,  # lowered for open loans once they are loaded
+                'shelf_location': f'{subjects[0][:3].upper()}-{last_name[:3].upper()}',
+                'condition': 'good',
+                'publication_year': 2024 - int(rng.expovariate(1 / 25)),
+                'created_at': self.history_start - timedelta(days=rng.randrange(365 * 10)),
+            }
+
+    def load_books(self):
+        copy_id = self.next_id(BookCopy)
+        for batch in batched(self.book_rows(self.next_id(Book)), self.batch_size):
+            copies = []
+            for book in batch:
+                self.first_copy_id[book['id']] = copy_id
+                for number in range(1, book['total_copies'] + 1):
+                    copies.append({
+                        'id': copy_id,
+                        'book_id': book['id'],
+                        'copy_number': number,
+                        'barcode': copy_barcode(book['id'], number),
+                        'shelf_position': book['shelf_location'],
+                        'condition': 'good',
+                        'created_at': book['created_at'],
+                    })
+                    copy_id += 1
+            self.insert(Book.__table__, batch)
+            self.insert(BookCopy.__table__, copies)
+            link_and_index_new_books({book['id']: book for book in batch})
+            self.commit()
+        self.rows['book_subject'] = db.session.query(book_subject).filter(
+            book_subject.c.book_id.in_(db.select(Book.id).where(Book.id >= min(self.copies)))
+        ).count()
+        self.rows['book_search_term'] = BookSearchTerm.query.filter(BookSearchTerm.book_id >= min(self.copies)).count()
+
+    # Circulation: loans in date order, late returns fined
+    def fine_status(self, rng, settled_by):
+        """(status, paid_at) of a fine raised at settled_by; older fines are mostly settled"""
+        age = (self.as_of - settled_by).days
+        status = ('paid', 'waived', 'pending')[pick(rng, (0.85, 0.07) if age > 60 else (0.5, 0.05))]
+        if status == 'pending':
+            return status, None
+        return status, min(settled_by + timedelta(days=rng.expovariate(1 / 10)), self.as_of)
+
+    def take_copy(self, user_id, book_id):
+        """Claim a copy for a loan still open at as_of; None if the book or reader is at their limit"""
+        taken = self.open_per_book.get(book_id, 0)
+        if (taken >= self.copies[book_id] or (user_id, book_id) in self.open_pairs
+                or self.open_per_user.get(user_id, 0) >= self.users[user_id][0]):
+            return None
+        self.open_per_book[book_id] = taken + 1
+        self.open_per_user[user_id] = self.open_per_user.get(user_id, 0) + 1
+        self.open_pairs.add((user_id, book_id))
+        return self.first_copy_id[book_id] + taken
+
+    def borrowing_rows(self, first_id, fines, renewal_log):
+        rng = self.rng('borrowings')
+        draw_users = sampler(rng, self.activity)
+        draw_books = sampler(rng, self.demand)
+        borrowing_id = first_id
+        start = self.history_start.replace(hour=0, minute=0, second=0, microsecond=0)
+        for day, count in enumerate(daily_counts(self.counts['borrowings'], HISTORY_DAYS, start)):
+            opening = start + timedelta(days=day, hours=8)
+            seconds = sorted(rng.randrange(13 * 3600) for _ in range(count))
+            for second, user_id, book_id in zip(seconds, draw_users(count), draw_books(count)):
+                borrowed = opening + timedelta(seconds=second)
+                renewals = pick(rng, RENEWAL_ODDS)
+                due = borrowed + timedelta(days=LOAN_PERIOD_DAYS + renewals * RENEWAL_PERIOD_DAYS)
+                if rng.random() < self.users[user_id][1]:
+                    returned = due + timedelta(days=1 + rng.expovariate(1 / MEAN_DAYS_LATE))
+                else:
+                    returned = borrowed + (due - borrowed) * rng.random()
+                copy_id = None
+                if returned > self.as_of:
+                    copy_id = self.take_copy(user_id, book_id)
+                    if copy_id is None:
+                        # Every copy is out (or the reader is at their limit): it came back early
+                        returned = borrowed + (self.as_of - borrowed) * rng.random()
+                if copy_id is None:
+                    status = 'returned'
+                    fine_due_at = returned
+                else:
+                    status, returned = ('overdue' if due < self.as_of else 'borrowed'), None
+                    fine_due_at = self.as_of
+                # Each renewal in the last days of the loan period it extends, if the loan was still out
+                renewed = [
+                    stamp for stamp in (
+                        borrowed + timedelta(days=LOAN_PERIOD_DAYS + k * RENEWAL_PERIOD_DAYS - rng.uniform(0, 3))
+                        for k in range(renewals)
+                    ) if stamp < (returned or self.as_of)
+                ]
+                renewal_log.extend({'borrowing_id': borrowing_id, 'renewed_at': stamp} for stamp in renewed)
+                days_late = (fine_due_at - due).days if fine_due_at > due else 0
+                if days_late > 0:
+                    fine_status, paid_at = self.fine_status(rng, fine_due_at) if returned else ('pending', None)
+                    fines.append({
+                        'user_id': user_id,
+                        'borrowing_id': borrowing_id,
+                        'amount': days_late * FINE_PER_DAY,
+                        'reason': 'overdue',
+                        'status': fine_status,
+                        'created_at': fine_due_at,
+                        'paid_at': paid_at,
+                    })
+                yield {
+                    'id': borrowing_id,
+                    'user_id': user_id,
+                    'book_id': book_id,
+                    'borrowed_date': borrowed,
+                    'due_date': due,
+                    'returned_date': returned,
+                    'renewal_count': len(renewed),
+                    'max_renewals': 2,
+                    'status': status,
+                    'last_notice': None,
+                    'last_renewed_at': renewed[-1] if renewed else None,
+                    'copy_id': copy_id,
+                }
+                borrowing_id += 1
+
+    def load_borrowings(self):
+        fines, renewal_log = [], []
+        for batch in batched(self.borrowing_rows(self.next_id(Borrowing), fines, renewal_log), self.batch_size):
+            self.insert(Borrowing.__table__, batch)
+            self.insert(Fine.__table__, fines)
+            self.insert(Renewal.__table__, renewal_log)
+            fines.clear()
+            renewal_log.clear()
+            self.commit()
+
+    # Holds: settled ones across the history, live queues on books with every copy out
+    def reservation_rows(self):
+        rng = self.rng('reservations')
+        draw_users = sampler(rng, self.activity)
+        draw_books = sampler(rng, self.demand)
+        count = round(self.counts['borrowings'] * RESERVATIONS_PER_BORROWING)
+        offsets = sorted(rng.random() * (HISTORY_DAYS - HOLD_QUEUE_DAYS) for _ in range(count))
+        for offset, user_id, book_id in zip(offsets, draw_users(count), draw_books(count)):
+            reserved = self.history_start + timedelta(days=offset)
+            yield {
+                'user_id': user_id,
+                'book_id': book_id,
+                'reserved_date': reserved,
+                'expiry_date': reserved + timedelta(days=HOLD_QUEUE_DAYS),
+                'status': HISTORICAL_HOLD_OUTCOMES[pick(rng, [share for _, share in HISTORICAL_HOLD_OUTCOMES])][0],
+                'priority': 1,
+            }
+        readers = list(self.users)
+        for book_id, taken in self.open_per_book.items():
+            if taken < self.copies[book_id] or rng.random() < 0.5:
+                continue
+            queue = []
+            for user_id in rng.sample(readers, min(len(readers), rng.randint(1, 2 * self.copies[book_id]))):
+                if (user_id, book_id) not in self.open_pairs:
+                    queue.append(user_id)
+            waited = sorted((rng.random() * (HOLD_QUEUE_DAYS - 1) for _ in queue), reverse=True)
+            for priority, (user_id, days) in enumerate(zip(queue, waited), start=1):
+                reserved = self.as_of - timedelta(days=days)
+                yield {
+                    'user_id': user_id,
+                    'book_id': book_id,
+                    'reserved_date': reserved,
+                    'expiry_date': reserved + timedelta(days=HOLD_QUEUE_DAYS),
+                    'status': 'active',
+                    'priority': priority,
+                }
+
+    def load_reservations(self):
+        for batch in batched(self.reservation_rows(), self.batch_size):
+            self.insert(Reservation.__table__, batch)
+            self.commit()
+
+    def reconcile(self):
+        """Bring the derived columns and tables in line with the loaded rows"""
+        first_book_id = min(self.copies)
+        open_loans = db.select(db.func.count(Borrowing.id)).where(
+            Borrowing.book_id == Book.id,
+            Borrowing.status.in_(ACTIVE_LOAN_STATUSES)
+        ).scalar_subquery()
+        db.session.execute(
+            db.update(Book).where(Book.id >= first_book_id).values(available_copies=Book.total_copies - open_loans),
+            execution_options={'synchronize_session': False}
+        )
+        db.session.commit()
+        recount_active_loans()
+        reconcile_stat_counters()
+        rebuild_circulation_rollup()
+        bump_versions('catalog', 'circulation', 'users')
+        db.session.commit()
+
+
+def bulk_load_settings(enabled=True):
+    """On MySQL, skip unique and foreign key checks for the loading transaction (the data is valid by construction)"""
+    if db.engine.dialect.name == 'mysql':
+        value = 0 if enabled else 1
+        db.session.execute(db.text(f'SET SESSION unique_checks = {value}, foreign_key_checks = {value}'))
+
+
+def deferred_indexes():
+    """Secondary indexes dropped during the load; those leading with a foreign key column stay, as MySQL needs them"""
+    tables = (User, Book, BookCopy, Borrowing, Reservation, Fine, Renewal, BookSearchTerm)
+    indexes = [index for model in tables for index in model.__table__.indexes]
+    indexes.extend(book_subject.indexes)
+    return [index for index in indexes if not list(index.columns)[0].foreign_keys]
+
+
+def create_indexes(indexes):
+    with db.engine.begin() as connection:
+        for index in indexes:
+            index.create(connection, checkfirst=True)
+
+
+def timed(label, step, rows=None):
+    started = time.perf_counter()
+    step()
+    seconds = time.perf_counter() - started
+    count = rows() if rows else None
+    rate = f', {count / seconds * 60:,.0f} rows/min' if count else ''
+    print(f'{label}: {seconds:.1f}s{rate}', flush=True)
+
+
+def main():
+    """Parse the command line and generate the data set"""
+    parser = argparse.ArgumentParser(description='Library Management System synthetic data generator')
+    parser.add_argument('--scale', type=float, default=0.01, help='scale factor; 1 = 100k books, 50k users, 5M borrowings')
+    parser.add_argument('--seed', type=int, default=42, help='random seed; the same seed gives the same data')
+    parser.add_argument('--as-of', type=lambda text: datetime.strptime(text, '%Y-%m-%d'),
+                        default=datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0),
+                        help='date the history ends (default: today), YYYY-MM-DD')
+    parser.add_argument('--batch-size', type=int, default=LOAD_BATCH_SIZE, help='rows per INSERT batch and transaction')
+    args = parser.parse_args()
+    if args.scale <= 0:
+        sys.exit('--scale must be positive')
+
+    generator = Generator(args.seed, args.scale, args.as_of, args.batch_size)
+    print(f"Generating SF{args.scale:g} (seed {args.seed}, as of {args.as_of:%Y-%m-%d}): "
+          f"{generator.counts['books']:,} books, {generator.counts['users']:,} users, "
+          f"{generator.counts['borrowings']:,} borrowings", flush=True)
+    started = time.perf_counter()
+    with app.app_context():
+        indexes = deferred_indexes()
+        with db.engine.begin() as connection:
+            for index in indexes:
+                index.drop(connection, checkfirst=True)
+        bulk_load_settings()
+        try:
+            timed('Readers', generator.load_users, lambda: generator.rows.get('user', 0))
+            timed('Books, copies, subjects and search terms', generator.load_books,
+                  lambda: sum(generator.rows.get(name, 0) for name in ('book', 'book_copy', 'book_subject', 'book_search_term')))
+            timed('Borrowings, fines and renewals', generator.load_borrowings,
+                  lambda: sum(generator.rows.get(name, 0) for name in ('borrowing', 'fine', 'renewal')))
+            timed('Reservations', generator.load_reservations, lambda: generator.rows.get('reservation', 0))
+        finally:
+            bulk_load_settings(enabled=False)
+            db.session.commit()
+            timed(f'Rebuilding {len(indexes)} indexes', lambda: create_indexes(indexes))
+        timed('Reconciling availability, loan counts, statistics and the circulation rollup', generator.reconcile)
+
+    for name, count in sorted(generator.rows.items()):
+        print(f'{name}: {count:,} rows')
+    total = sum(generator.rows.values())
+    seconds = time.perf_counter() - started
+    print(f'Loaded {total:,} rows in {seconds:.0f}s ({total / seconds * 60:,.0f} rows/min overall)')
+    print(f'Generated readers log in as reader<id>@scale.example.edu with password {GENERATED_PASSWORD}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Bulk data import for Library Management System
+Streams a CSV, JSON Lines or MARC text file into the database, for example:
+
+    python import_data.py users roster.csv
+    python import_data.py books vendor-feed.mrk
+    python import_data.py books vendor-feed.mrk --resume 12   # continue a stopped import
+"""
+
+import argparse
+import json
+import sys
+
+import data_import
+from app import app, import_users, start_import_job, run_catalog_import
+
+def import_books(path, fmt, batch_size, resume=None):
+    """Run a catalog import as a resumable job"""
+    job, error = start_import_job('catalog', path, fmt, resume)
+    if error:
+        sys.exit(error)
+    with open(path, encoding='utf-8-sig', newline='') as stream:
+        return run_catalog_import(job, stream, batch_size)
+
+def import_user_roster(path, fmt, batch_size, resume=None):
+    if resume is not None:
+        sys.exit('Only books imports can be resumed')
+    with open(path, encoding='utf-8-sig', newline='') as stream:
+        return import_users(data_import.read_records(stream, fmt), batch_size=batch_size)
+
+IMPORTERS = {
+    'books': import_books,
+    'users': import_user_roster,
+}
+
+def main():
+    """Parse the command line, run the import and print the report"""
+    parser = argparse.ArgumentParser(description='Library Management System bulk import')
+    parser.add_argument('dataset', choices=sorted(IMPORTERS), help='what the file contains')
+    parser.add_argument('path', help='file to import')
+    parser.add_argument('--format', choices=data_import.FORMATS, help='file format (default: from the extension)')
+    parser.add_argument('--batch-size', type=int, default=1000, help='rows per transaction')
+    parser.add_argument('--resume', type=int, metavar='JOB_ID', help='continue an unfinished books import')
+    args = parser.parse_args()
+
+    fmt = args.format or data_import.detect_format(args.path)
+    with app.app_context():
+        report = IMPORTERS[args.dataset](args.path, fmt, args.batch_size, args.resume)
+
+    for error in report.pop('errors'):
+        print(f"line {error['line']}: {error['error']}", file=sys.stderr)
+    print(json.dumps(report))
+
+if __name__ == '__main__':
+    main()
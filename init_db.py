@@ -6,9 +6,11 @@ This script creates the MySQL database and tables, and populates with sample dat
 
 import pymysql
 import os
+from datetime import datetime
 from dotenv import load_dotenv
-from app import app, db, Admin, Book, User
+from app import app, db, Admin, Book, User, index_book, sync_book_subjects, add_book_copies, reconcile_stat_counters
 from werkzeug.security import generate_password_hash
+from migrate import upgrade
 
 # Load environment variables
 load_dotenv()
@@ -53,8 +55,8 @@ def init_tables_and_data():
     """Initialize database tables and sample data"""
     try:
         with app.app_context():
-            # Create all tables
-            db.create_all()
+            # Create or upgrade the tables
+            upgrade()
             print("Database tables created successfully.")
             
             # Create sample admin user if it doesn't exist
@@ -204,10 +206,19 @@ def init_tables_and_data():
                 for book in sample_books:
                     db.session.add(book)
                 
+                db.session.flush()
+                for book in sample_books:
+                    sync_book_subjects(book)
+                    index_book(book)
+                add_book_copies({book.id: book.total_copies for book in sample_books}, datetime.utcnow())
+                
                 print("Sample books created.")
             
             # Commit all changes
             db.session.commit()
+            
+            # Seed the dashboard counters from the tables
+            reconcile_stat_counters()
             print("Database initialization completed successfully!")
             
     except Exception as e:
@@ -0,0 +1,38 @@
+"""
+ISBN normalization.
+Every valid ISBN-10 or ISBN-13, however it is punctuated, maps to one canonical
+13-digit string, which is what catalog de-duplication keys on.
+"""
+
+import re
+
+_ISBN_CHARS_RE = re.compile(r'[^0-9Xx]')
+
+
+def isbn13_check_digit(first12):
+    total = sum(int(d) * (1 if i % 2 == 0 else 3) for i, d in enumerate(first12))
+    return str((10 - total % 10) % 10)
+
+
+def isbn10_is_valid(isbn10):
+    if not re.fullmatch(r'[0-9]{9}[0-9X]', isbn10):
+        return False
+    total = sum((10 - i) * (10 if c == 'X' else int(c)) for i, c in enumerate(isbn10))
+    return total % 11 == 0
+
+
+def normalize_isbn(text):
+    """Return the canonical ISBN-13 for an ISBN-10/13 in any punctuation, or None if invalid"""
+    if not text:
+        return None
+    compact = _ISBN_CHARS_RE.sub('', str(text)).upper()
+    if len(compact) == 10:
+        if not isbn10_is_valid(compact):
+            return None
+        first12 = '978' + compact[:9]
+        return first12 + isbn13_check_digit(first12)
+    if len(compact) == 13 and compact.isdigit() and compact[:3] in ('978', '979'):
+        if compact[12] != isbn13_check_digit(compact[:12]):
+            return None
+        return compact
+    return None
@@ -239,10 +239,10 @@ function updateAvailabilityTab(book) {
                     <div class="copy-condition">${copy.condition}</div>
                 </div>
                 <div class="copy-status">
-                    <span class="status-badge ${copy.status}">${copy.status === 'available' ? 'Available' : 'Borrowed'}</span>
+                    <span class="status-badge ${copy.status}">${copyStatusLabel(copy.status)}</span>
                     ${copy.status === 'available' 
                         ? `<button class="btn btn-primary btn-sm" onclick="borrowCopy('${copy.id}')">Borrow</button>`
-                        : `<div class="return-date">Due: ${copy.due_date}</div>`
+                        : copy.due_date ? `<div class="return-date">Due: ${copy.due_date}</div>` : ''
                     }
                 </div>
             </div>
@@ -250,6 +250,17 @@ function updateAvailabilityTab(book) {
     }
 }
 
+// Badge text for a copy's status
+function copyStatusLabel(status) {
+    switch(status) {
+        case 'available': return 'Available';
+        case 'borrowed': return 'Borrowed';
+        case 'overdue': return 'Overdue';
+        case 'lost': return 'Lost';
+        default: return 'Unavailable';
+    }
+}
+
 // Update modal book information
 function updateModalBookInfo(book) {
     // This will be called when modals are created to show the correct book info
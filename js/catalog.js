@@ -1,6 +1,7 @@
 // Catalog JavaScript for Library Management System - Dynamic Version
 
 document.addEventListener('DOMContentLoaded', () => {
+    // Category ids are subject slugs; counts come from the server's facets
     const categories = [
         { id: 'fiction', name: 'Fiction' },
         { id: 'non-fiction', name: 'Non-Fiction' },
@@ -13,13 +14,19 @@ document.addEventListener('DOMContentLoaded', () => {
     // State
     let currentCategory = 'all';
     let currentSearch = '';
+    let currentAvailability = '';
+    let currentSort = '';
     let currentPage = 1;
-    let allBooks = [];
-    let filteredBooks = [];
+    let books = [];
+    let totalBooks = 0;
+    let facets = {};
+    let searchTimer = null;
+    let requestId = 0;
     const perPage = 12;
+    const searchDelay = 250;
 
     const params = new URLSearchParams(window.location.search);
-    currentSearch = params.get('q')?.toLowerCase() || '';
+    currentSearch = params.get('q') || '';
     currentCategory = params.get('category') || 'all';
 
     const categoryBar = document.getElementById('categoryBar');
@@ -34,30 +41,45 @@ document.addEventListener('DOMContentLoaded', () => {
     // Initialize catalog with API data
     async function initializeCatalog() {
         try {
-            await loadBooksFromAPI();
             renderCategories();
             setupEventListeners();
-            filterBooks();
+            await loadBooksFromAPI();
         } catch (error) {
             console.error('Failed to initialize catalog:', error);
             showError('Failed to load books. Please try again later.');
         }
     }
 
-    // Load books from API
-    async function loadBooksFromAPI() {
+    // Build the faceted search query for the current state
+    function buildSearchParams() {
+        const query = new URLSearchParams({ page: currentPage, per_page: perPage });
+        if (currentSearch) query.set('q', currentSearch);
+        if (currentCategory !== 'all') query.set('subject', currentCategory);
+        if (currentAvailability) query.set('availability', currentAvailability);
+        if (currentSort) query.set('sort', currentSort);
+        return query;
+    }
+
+    // Load one page of books (and facet counts) from the API
+    async function loadBooksFromAPI(append = false) {
+        const thisRequest = ++requestId;
         try {
-            showLoading(true);
-            const response = await fetch('/api/books');
+            if (!append) showLoading(true);
+            const response = await fetch(`/api/catalog/search?${buildSearchParams()}`);
             
             if (!response.ok) {
                 throw new Error(`HTTP error! status: ${response.status}`);
             }
             
             const data = await response.json();
-            allBooks = data.books || [];
-            filteredBooks = [...allBooks];
+            // Ignore responses that were overtaken by a newer request
+            if (thisRequest !== requestId) return;
+            
+            books = append ? books.concat(data.books || []) : (data.books || []);
+            totalBooks = data.total || 0;
+            facets = data.facets || {};
             
+            renderCategories();
             renderBooks();
             showLoading(false);
         } catch (error) {
@@ -67,6 +89,12 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     }
 
+    // Reload from the first page after a filter change
+    function filterBooks() {
+        currentPage = 1;
+        loadBooksFromAPI();
+    }
+
     // Show/hide loading state
     function showLoading(show) {
         if (loadingMessage) {
@@ -92,22 +120,42 @@ document.addEventListener('DOMContentLoaded', () => {
         const existingBooks = booksContainer.querySelectorAll('.book-item');
         existingBooks.forEach(book => book.remove());
         
-        if (filteredBooks.length === 0) {
+        const existingMore = booksContainer.querySelector('.load-more');
+        if (existingMore) existingMore.remove();
+        
+        if (books.length === 0) {
             showNoBooksMessage();
+            updateResultsCount();
             return;
         }
         
         hideMessages();
         
-        filteredBooks.forEach(book => {
+        books.forEach(book => {
             const bookElement = createBookElement(book);
             booksContainer.appendChild(bookElement);
         });
         
+        if (books.length < totalBooks) {
+            booksContainer.appendChild(createLoadMoreButton());
+        }
+        
         setupBookActions();
         updateResultsCount();
     }
 
+    // Create the button that fetches the next page
+    function createLoadMoreButton() {
+        const btn = document.createElement('button');
+        btn.className = 'btn btn-outline load-more';
+        btn.textContent = 'Load More';
+        btn.addEventListener('click', () => {
+            currentPage += 1;
+            loadBooksFromAPI(true);
+        });
+        return btn;
+    }
+
     // Create book element
     function createBookElement(book) {
         const bookItem = document.createElement('div');
@@ -158,7 +206,7 @@ document.addEventListener('DOMContentLoaded', () => {
             'philosophy': 'https://images.unsplash.com/photo-1514890547-4d3fc2968982?w=300&h=400&fit=crop'
         };
         
-        const subject = book.subject.toLowerCase();
+        const subject = (book.subject || '').toLowerCase();
         return subjectMap[subject] || 'https://images.unsplash.com/photo-1543002588-bfa74002ed7e?w=300&h=400&fit=crop';
     }
 
@@ -177,6 +225,17 @@ document.addEventListener('DOMContentLoaded', () => {
         if (noBooksMessage) noBooksMessage.style.display = 'none';
     }
 
+    // Match the server's subject slugs: 'Computer Science' -> 'computer-science'
+    function subjectSlug(name) {
+        return String(name).toLowerCase().split(/[^a-z0-9]+/).filter(Boolean).join('-');
+    }
+
+    // Number of matching books for a subject, from the last facet response
+    function categoryCount(id) {
+        const match = (facets.subject || []).find(f => subjectSlug(f.value) === id);
+        return match ? match.count : 0;
+    }
+
     // Render categories
     function renderCategories() {
         if (!categoryBar) return;
@@ -185,7 +244,8 @@ document.addEventListener('DOMContentLoaded', () => {
         if (currentCategory === 'all') allBtn.classList.add('active');
         categoryBar.appendChild(allBtn);
         categories.forEach(cat => {
-            const btn = createCategoryButton(cat.id, cat.name);
+            const count = facets.subject ? ` (${categoryCount(cat.id)})` : '';
+            const btn = createCategoryButton(cat.id, cat.name + count);
             if (currentCategory === cat.id) btn.classList.add('active');
             categoryBar.appendChild(btn);
         });
@@ -202,37 +262,11 @@ document.addEventListener('DOMContentLoaded', () => {
             document.querySelectorAll('.category-btn').forEach(b => b.classList.remove('active'));
             btn.classList.add('active');
             currentCategory = id;
-            currentPage = 1;
             filterBooks();
         });
         return btn;
     }
 
-    // Filter books based on search and category
-    function filterBooks() {
-        filteredBooks = allBooks.filter(book => {
-            let show = true;
-            
-            // Filter by category
-            if (currentCategory !== 'all') {
-                show = book.subject.toLowerCase().includes(currentCategory);
-            }
-            
-            // Filter by search
-            if (currentSearch && show) {
-                const searchLower = currentSearch.toLowerCase();
-                show = book.title.toLowerCase().includes(searchLower) || 
-                       book.author.toLowerCase().includes(searchLower) || 
-                       book.subject.toLowerCase().includes(searchLower) ||
-                       book.isbn.toLowerCase().includes(searchLower);
-            }
-            
-            return show;
-        });
-        
-        renderBooks();
-    }
-
     // Setup event listeners
     function setupEventListeners() {
         // Search input
@@ -241,18 +275,21 @@ document.addEventListener('DOMContentLoaded', () => {
         
         if (searchInput) {
             searchInput.value = currentSearch;
+            // Debounce so typing sends one request per pause, not per keystroke
             searchInput.addEventListener('input', (e) => {
-                currentSearch = e.target.value.toLowerCase();
-                currentPage = 1;
-                filterBooks();
+                clearTimeout(searchTimer);
+                searchTimer = setTimeout(() => {
+                    currentSearch = e.target.value.trim();
+                    filterBooks();
+                }, searchDelay);
             });
         }
         
         if (searchBtn) {
             searchBtn.addEventListener('click', () => {
                 if (searchInput) {
-                    currentSearch = searchInput.value.toLowerCase();
-                    currentPage = 1;
+                    clearTimeout(searchTimer);
+                    currentSearch = searchInput.value.trim();
                     filterBooks();
                 }
             });
@@ -263,7 +300,26 @@ document.addEventListener('DOMContentLoaded', () => {
         if (subjectFilter) {
             subjectFilter.addEventListener('change', () => {
                 currentCategory = subjectFilter.value || 'all';
-                currentPage = 1;
+                renderCategories();
+                filterBooks();
+            });
+        }
+
+        // Availability filter
+        const availabilityFilter = document.getElementById('availabilityFilter');
+        if (availabilityFilter) {
+            availabilityFilter.addEventListener('change', () => {
+                currentAvailability = availabilityFilter.value;
+                filterBooks();
+            });
+        }
+
+        // Sort order
+        const sortBy = document.getElementById('sortBy');
+        if (sortBy) {
+            const sortMap = { title: 'title', author: 'author', date: 'year', popularity: 'popularity' };
+            sortBy.addEventListener('change', () => {
+                currentSort = sortMap[sortBy.value] || '';
                 filterBooks();
             });
         }
@@ -326,9 +382,7 @@ document.addEventListener('DOMContentLoaded', () => {
     // Update results count
     function updateResultsCount() {
         if (resultsCount) {
-            const total = allBooks.length;
-            const showing = filteredBooks.length;
-            resultsCount.textContent = `Showing ${showing} of ${total} books`;
+            resultsCount.textContent = `Showing ${books.length} of ${totalBooks} books`;
         }
     }
 });
@@ -10,6 +10,7 @@ function initializeUserDashboard() {
     setupNotifications();
     setupUserProfile();
     loadUserDashboardData();
+    startNotificationStream();
 }
 
 // Set up event listeners
@@ -285,6 +286,69 @@ async function loadUserDashboardData() {
     }
 }
 
+// Live notifications: Server-Sent Events, falling back to long-polling.
+// New notifications pop up and refresh the dashboard; closing one marks it read.
+let lastNotificationId = null;
+let dashboardRefreshTimer = null;
+
+function startNotificationStream() {
+    if (!window.EventSource) {
+        pollNotifications();
+        return;
+    }
+    const source = new EventSource('/api/notifications/stream', { withCredentials: true });
+    let opened = false;
+    source.onopen = () => { opened = true; };
+    source.addEventListener('notification', event => {
+        lastNotificationId = Number(event.lastEventId);
+        receiveNotification(JSON.parse(event.data));
+    });
+    source.onerror = () => {
+        // EventSource reconnects by itself; if the stream never opened, switch to long-polling
+        if (!opened) {
+            source.close();
+            pollNotifications();
+        }
+    };
+}
+
+async function pollNotifications() {
+    let delay = 0;
+    while (true) {
+        if (delay) await new Promise(resolve => setTimeout(resolve, delay));
+        try {
+            const query = lastNotificationId === null ? '' : `?after=${lastNotificationId}`;
+            const res = await fetch(`/api/notifications/poll${query}`, { credentials: 'include' });
+            if (res.status === 401) return;
+            if (!res.ok) throw new Error(res.statusText);
+            const data = await res.json();
+            lastNotificationId = data.last_id;
+            data.notifications.forEach(receiveNotification);
+            delay = 0;
+        } catch (e) {
+            delay = Math.min((delay || 1000) * 2, 30000);
+        }
+    }
+}
+
+function receiveNotification(n) {
+    const toast = showNotification(`<strong>${n.title}</strong> ${n.message}`, n.type);
+    toast.querySelector('.notification-close').addEventListener('click', () => markNotificationsRead([n.id]));
+
+    // Several events often arrive together (a return and its fine); refresh once
+    clearTimeout(dashboardRefreshTimer);
+    dashboardRefreshTimer = setTimeout(loadUserDashboardData, 500);
+}
+
+function markNotificationsRead(ids) {
+    return fetch('/api/notifications/read', {
+        method: 'POST',
+        credentials: 'include',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ ids })
+    }).catch(() => {});
+}
+
 function renderBorrowedBooks(borrowings) {
     const grid = document.getElementById('borrowedBooksGrid');
     if (!grid) return;
@@ -589,6 +653,7 @@ function showNotification(message, type = 'info') {
         notification.style.animation = 'slideOut 0.3s ease';
         setTimeout(() => notification.remove(), 300);
     });
+    return notification;
 }
 
 // Get notification icon
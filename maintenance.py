@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Maintenance tasks for Library Management System
+Run a task by name, for example: python maintenance.py reindex-search
+"""
+
+import argparse
+from app import (
+    app, rebuild_search_index, backfill_book_subjects, recount_active_loans,
+    reconcile_stat_counters, sweep_overdue_loans, expire_holds, renumber_hold_queues,
+    rollup_circulation, rebuild_circulation_rollup, backfill_isbn13,
+    backfill_book_copies,
+)
+
+def reindex_search(args):
+    """Rebuild the full-text search index for every book"""
+    with app.app_context():
+        indexed = rebuild_search_index(batch_size=args.batch_size)
+        print(f"Search index rebuilt for {indexed} books.")
+
+def backfill_subjects(args):
+    """Link existing books to normalized subjects parsed from their subject strings"""
+    with app.app_context():
+        linked = backfill_book_subjects(batch_size=args.batch_size)
+        print(f"Subjects linked for {linked} books.")
+
+def recount_loans(args):
+    """Recompute each user's active loan counter from open borrowings"""
+    with app.app_context():
+        updated = recount_active_loans()
+        print(f"Active loan counters recomputed for {updated} users.")
+
+def reconcile_stats(args):
+    """Recompute the dashboard counters from the base tables"""
+    with app.app_context():
+        values = reconcile_stat_counters()
+        for name, value in sorted(values.items()):
+            print(f"{name}: {value}")
+
+def sweep_overdue(args):
+    """Mark past-due loans overdue, accrue their fines and send due-soon/overdue reminders"""
+    with app.app_context():
+        totals = sweep_overdue_loans(batch_size=args.batch_size)
+        for name, value in totals.items():
+            print(f"{name}: {value}")
+
+def expire_reservations(args):
+    """Expire lapsed and uncollected holds, passing held copies down the queue"""
+    with app.app_context():
+        expired = expire_holds(batch_size=args.batch_size)
+        print(f"{expired} reservations expired.")
+
+def renumber_holds(args):
+    """Rewrite every hold queue's positions as 1..n"""
+    with app.app_context():
+        books = renumber_hold_queues()
+        print(f"Hold queues renumbered for {books} books.")
+
+def rollup_circulation_days(args):
+    """Roll closed days into the circulation report table"""
+    with app.app_context():
+        days = rollup_circulation()
+        print(f"Circulation rolled up for {days} days.")
+
+def rebuild_circulation(args):
+    """Recompute the circulation report table from scratch"""
+    with app.app_context():
+        days = rebuild_circulation_rollup()
+        print(f"Circulation rollup rebuilt for {days} days.")
+
+def backfill_isbn_keys(args):
+    """Fill missing ISBN-13 de-duplication keys from each book's ISBN"""
+    with app.app_context():
+        filled = backfill_isbn13(batch_size=args.batch_size)
+        print(f"ISBN-13 keys filled for {filled} books.")
+
+def backfill_copies(args):
+    """Create copy records for books without any and attach their open loans"""
+    with app.app_context():
+        books = backfill_book_copies(batch_size=args.batch_size)
+        print(f"Copy records created for {books} books.")
+
+TASKS = {
+    'reindex-search': reindex_search,
+    'backfill-subjects': backfill_subjects,
+    'recount-loans': recount_loans,
+    'reconcile-stats': reconcile_stats,
+    'sweep-overdue': sweep_overdue,
+    'expire-holds': expire_reservations,
+    'renumber-holds': renumber_holds,
+    'rollup-circulation': rollup_circulation_days,
+    'rebuild-circulation': rebuild_circulation,
+    'backfill-isbn13': backfill_isbn_keys,
+    'backfill-copies': backfill_copies,
+}
+
+def main():
+    """Parse the command line and run the requested task"""
+    parser = argparse.ArgumentParser(description='Library Management System maintenance tasks')
+    parser.add_argument('task', choices=sorted(TASKS), help='task to run')
+    parser.add_argument('--batch-size', type=int, default=500, help='rows processed per transaction')
+    args = parser.parse_args()
+    TASKS[args.task](args)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+"""
+Process-local metrics, exposed in the Prometheus text exposition format.
+An update is a dict lookup and an add under the metric's lock, cheap enough to
+run on every request and query. Each worker process counts on its own, so
+scrape every process (or run one process per scrape target).
+"""
+
+import bisect
+import threading
+import time
+
+from sqlalchemy.exc import TimeoutError as PoolTimeout
+from sqlalchemy.pool import QueuePool
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+_registry = []
+
+
+class Metric:
+    kind = 'untyped'
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}  # label values -> value
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def samples(self):
+        """Yield (name suffix, ((label, value), ...), value)"""
+        with self._lock:
+            items = list(self._values.items())
+        for label_values, value in items:
+            yield '', tuple(zip(self.labels, label_values)), value
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+
+class Gauge(Metric):
+    """A value set by the code, or read at scrape time from `collect()` -> {label values: value}"""
+    kind = 'gauge'
+
+    def __init__(self, name, help, labels=(), collect=None):
+        super().__init__(name, help, labels)
+        self.collect = collect
+
+    def set(self, value, *label_values):
+        with self._lock:
+            self._values[label_values] = value
+
+    def samples(self):
+        if self.collect is None:
+            yield from super().samples()
+            return
+        for label_values, value in self.collect().items():
+            yield '', tuple(zip(self.labels, label_values)), value
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            series = self._values.get(label_values)
+            if series is None:
+                # One count per bucket plus +Inf, then the running sum
+                series = self._values[label_values] = [0] * (len(self.buckets) + 1) + [0]
+            series[bisect.bisect_left(self.buckets, value)] += 1
+            series[-1] += value
+
+    def samples(self):
+        with self._lock:
+            items = [(label_values, list(series)) for label_values, series in self._values.items()]
+        for label_values, series in items:
+            labels = tuple(zip(self.labels, label_values))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), series):
+                cumulative += count
+                yield '_bucket', labels + (('le', bound),), cumulative
+            yield '_sum', labels, series[-1]
+            yield '_count', labels, cumulative
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    pairs = []
+    for name, value in labels:
+        text = format_value(value) if isinstance(value, (int, float)) else str(value)
+        text = text.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{name}="{text}"')
+    return '{' + ','.join(pairs) + '}'
+
+
+def render():
+    """Every registered metric in the text exposition format"""
+    lines = []
+    for metric in _registry:
+        lines.append(f'# HELP {metric.name} {metric.help}')
+        lines.append(f'# TYPE {metric.name} {metric.kind}')
+        for suffix, labels, value in metric.samples():
+            lines.append(f'{metric.name}{suffix}{format_labels(labels)} {format_value(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+# Connection pools. Engines name their pool with `pool_logging_name` ('primary',
+# 'replica_0', ...); pool gauges are collected by the app, which knows its engines.
+POOL_CHECKOUT_WAIT = Histogram(
+    'library_db_pool_checkout_wait_seconds', 'Time spent waiting for a pooled connection', ('pool',),
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30)
+)
+POOL_TIMEOUTS = Counter(
+    'library_db_pool_timeouts_total', 'Checkouts that gave up waiting for a free connection', ('pool',)
+)
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited for a connection"""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        pool = self.logging_name or 'primary'
+        try:
+            return super()._do_get()
+        except PoolTimeout:
+            POOL_TIMEOUTS.inc(pool)
+            raise
+        finally:
+            POOL_CHECKOUT_WAIT.observe(time.perf_counter() - started, pool)
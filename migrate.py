@@ -0,0 +1,538 @@
+#!/usr/bin/env python3
+"""
+Schema migration tool for Library Management System
+Upgrades an existing database in place, one numbered migration at a time.
+
+    python migrate.py status    # list applied and pending migrations
+    python migrate.py upgrade   # apply pending migrations
+    python migrate.py stamp     # mark every migration applied (database built by db.create_all())
+
+Every step checks the live schema before changing it, so re-running a
+partially applied migration is safe. On MySQL, indexes are built with
+ALGORITHM=INPLACE, LOCK=NONE so reads and writes continue during the build.
+Data steps are written in SQLAlchemy Core against the columns their version
+had, never through the app's models, which may already map later columns.
+"""
+
+import argparse
+import sys
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import (
+    Column, Date, DateTime, Index, Integer, MetaData, String, Table, Text, Float,
+    bindparam, column, delete, distinct, func, insert, inspect, literal, select, table, update,
+)
+from sqlalchemy.schema import CreateColumn
+
+import isbn
+import search_index
+from app import (
+    app, db, User, Book, Borrowing, Reservation, Fine, Admin, Notification,
+    Subject, book_subject, StatCounter, DataVersion, BookSearchTerm, CirculationDaily, ImportJob,
+    BookCopy, Renewal,
+    ACTIVE_LOAN_STATUSES, STAT_COUNTER_SLOTS, CIRCULATION_SERIES, ROLLUP_BATCH_DAYS,
+    split_subjects, copy_barcode,
+)
+
+Migration = namedtuple('Migration', 'version description schema data')
+
+migration_metadata = MetaData()
+schema_migrations = Table(
+    'schema_migrations', migration_metadata,
+    Column('version', String(50), primary_key=True),
+    Column('description', String(200)),
+    Column('applied_at', DateTime, nullable=False),
+)
+
+# Indexes an applied migration created that a later one replaced; the models no longer declare them
+retired_metadata = MetaData()
+retired_reservation = Table(
+    'reservation', retired_metadata,
+    Column('book_id', Integer),
+    Column('status', String(20)),
+    Index('ix_reservation_book_id_status', 'book_id', 'status'),
+)
+
+# Schema helpers
+def quote(conn, name):
+    return conn.dialect.identifier_preparer.quote(name)
+
+def create_tables(conn, *tables):
+    """Create tables (with their indexes) that don't exist yet"""
+    for table in tables:
+        table = getattr(table, '__table__', table)
+        if not inspect(conn).has_table(table.name):
+            print(f"  creating table {table.name}")
+            table.create(bind=conn)
+
+def add_column(conn, column):
+    """Add a model column to its existing table if it is missing"""
+    table = column.table
+    existing = {c['name'] for c in inspect(conn).get_columns(table.name)}
+    if column.name in existing:
+        return
+    ddl = str(CreateColumn(column).compile(dialect=conn.dialect))
+    default = getattr(column.default, 'arg', None)
+    if default is not None and not callable(default):
+        ddl += ' DEFAULT ' + str(literal(default).compile(dialect=conn.dialect, compile_kwargs={'literal_binds': True}))
+    print(f"  adding column {table.name}.{column.name}")
+    conn.exec_driver_sql(f"ALTER TABLE {quote(conn, table.name)} ADD COLUMN {ddl}")
+
+def create_index(conn, index):
+    """Build a model index on a live table if it is missing"""
+    table = index.table
+    existing = {i['name'] for i in inspect(conn).get_indexes(table.name)}
+    if index.name in existing:
+        return
+    print(f"  creating index {index.name}")
+    if conn.dialect.name == 'mysql':
+        columns = ', '.join(quote(conn, c.name) for c in index.columns)
+        unique = 'UNIQUE ' if index.unique else ''
+        conn.exec_driver_sql(
+            f"CREATE {unique}INDEX {quote(conn, index.name)} ON {quote(conn, table.name)} ({columns}) "
+            f"ALGORITHM=INPLACE LOCK=NONE"
+        )
+    else:
+        index.create(bind=conn)
+
+def drop_index(conn, table_name, index_name):
+    """Drop an index that a later migration replaced, if it is still there"""
+    existing = {i['name'] for i in inspect(conn).get_indexes(table_name)}
+    if index_name not in existing:
+        return
+    print(f"  dropping index {index_name}")
+    if conn.dialect.name == 'mysql':
+        conn.exec_driver_sql(f"DROP INDEX {quote(conn, index_name)} ON {quote(conn, table_name)} ALGORITHM=INPLACE LOCK=NONE")
+    else:
+        conn.exec_driver_sql(f"DROP INDEX {quote(conn, index_name)}")
+
+def model_index(model_or_table, name):
+    table = getattr(model_or_table, '__table__', model_or_table)
+    return next(index for index in table.indexes if index.name == name)
+
+# Migrations
+def initial_schema(conn):
+    # book_copy first: a fresh borrowing table is created with its copy_id foreign key
+    create_tables(conn, User, Book, BookCopy, Borrowing, Reservation, Fine, Admin, Notification)
+
+def bookkeeping_tables(conn):
+    create_tables(conn, StatCounter, DataVersion)
+
+def search_index_table(conn):
+    create_tables(conn, BookSearchTerm)
+
+def subject_tables(conn):
+    create_tables(conn, Subject, book_subject)
+    add_column(conn, Subject.__table__.c.book_count)
+    create_index(conn, model_index(Book, 'ix_book_title'))
+
+def active_loans_column(conn):
+    add_column(conn, User.__table__.c.active_loans)
+
+def hot_path_indexes(conn):
+    for model, name in [
+        (Borrowing, 'ix_borrowing_user_id_status'),
+        (Borrowing, 'ix_borrowing_book_id_status'),
+        (Borrowing, 'ix_borrowing_status_due_date'),
+        (Borrowing, 'ix_borrowing_borrowed_date'),
+        (Borrowing, 'ix_borrowing_returned_date'),
+        (retired_reservation, 'ix_reservation_book_id_status'),
+        (Reservation, 'ix_reservation_user_id_status'),
+        (Notification, 'ix_notification_user_id_read_created_at'),
+        (Fine, 'ix_fine_status_user_id'),
+    ]:
+        create_index(conn, model_index(model, name))
+
+def loan_notice_column(conn):
+    add_column(conn, Borrowing.__table__.c.last_notice)
+
+def hold_queue_indexes(conn):
+    create_index(conn, model_index(Reservation, 'ix_reservation_book_id_status_priority'))
+    create_index(conn, model_index(Reservation, 'ix_reservation_status_expiry_date'))
+    drop_index(conn, 'reservation', 'ix_reservation_book_id_status')
+
+def circulation_rollup(conn):
+    add_column(conn, Borrowing.__table__.c.last_renewed_at)
+    create_index(conn, model_index(Borrowing, 'ix_borrowing_last_renewed_at'))
+    create_tables(conn, CirculationDaily)
+
+def catalog_import(conn):
+    add_column(conn, Book.__table__.c.isbn13)
+    create_index(conn, model_index(Book, 'ix_book_isbn13'))
+    create_tables(conn, ImportJob)
+
+def book_copies(conn):
+    create_tables(conn, BookCopy)
+    add_column(conn, Borrowing.__table__.c.copy_id)
+    create_index(conn, model_index(Borrowing, 'ix_borrowing_copy_id_status'))
+
+def renewal_log(conn):
+    create_tables(conn, Renewal)
+
+# Data migrations
+# Each statement names the columns it reads or writes, and a step only names
+# columns that exist once the migrations before it (and its own schema step)
+# have run; a table below lists the union, e.g. book.isbn13 is only used by 0011.
+user_rows = table(
+    'user',
+    column('id', Integer), column('status', String), column('active_loans', Integer),
+)
+book_rows = table(
+    'book',
+    column('id', Integer), column('title', String), column('author', String), column('isbn', String),
+    column('subject', String), column('description', Text), column('total_copies', Integer),
+    column('shelf_location', String), column('isbn13', String),
+)
+borrowing_rows = table(
+    'borrowing',
+    column('id', Integer), column('user_id', Integer), column('book_id', Integer),
+    column('borrowed_date', DateTime), column('due_date', DateTime), column('returned_date', DateTime),
+    column('status', String), column('last_renewed_at', DateTime), column('copy_id', Integer),
+)
+reservation_rows = table(
+    'reservation',
+    column('id', Integer), column('book_id', Integer), column('reserved_date', DateTime),
+    column('status', String), column('priority', Integer),
+)
+fine_rows = table('fine', column('user_id', Integer), column('status', String))
+subject_rows = table(
+    'subject',
+    column('id', Integer), column('name', String), column('slug', String), column('book_count', Integer),
+)
+book_subject_rows = table('book_subject', column('book_id', Integer), column('subject_id', Integer))
+search_term_rows = table('book_search_term', column('term', String), column('book_id', Integer), column('weight', Float))
+stat_counter_rows = table('stat_counter', column('name', String), column('slot', Integer), column('value', Integer))
+data_version_rows = table(
+    'data_version',
+    column('name', String), column('slot', Integer), column('version', Integer), column('updated_at', DateTime),
+)
+circulation_daily_rows = table(
+    'circulation_daily',
+    column('day', Date), *[column(name, Integer) for name in CIRCULATION_SERIES],
+)
+book_copy_rows = table(
+    'book_copy',
+    column('id', Integer), column('book_id', Integer), column('copy_number', Integer), column('barcode', String),
+    column('shelf_position', String), column('condition', String), column('created_at', DateTime),
+)
+renewal_rows = table('renewal', column('borrowing_id', Integer), column('renewed_at', DateTime))
+
+def bump_version(conn, name):
+    """Invalidate cached responses for a data scope (versions are summed over slots)"""
+    now = datetime.utcnow()
+    versions = data_version_rows.c
+    updated = conn.execute(
+        update(data_version_rows).where(versions.name == name, versions.slot == 0)
+        .values(version=versions.version + 1, updated_at=now)
+    ).rowcount
+    if not updated:
+        conn.execute(insert(data_version_rows).values(name=name, slot=0, version=1, updated_at=now))
+
+def recount_subject_books(conn):
+    linked = select(func.count()).select_from(book_subject_rows).where(
+        book_subject_rows.c.subject_id == subject_rows.c.id
+    ).scalar_subquery()
+    conn.execute(update(subject_rows).values(book_count=linked))
+
+def book_batches(engine, columns, batch_size, *filters):
+    """Yield (connection, rows) for books in id order, one transaction per batch"""
+    last_id = 0
+    while True:
+        with engine.begin() as conn:
+            rows = conn.execute(
+                select(book_rows.c.id, *columns).where(book_rows.c.id > last_id, *filters)
+                .order_by(book_rows.c.id).limit(batch_size)
+            ).all()
+            if not rows:
+                return
+            yield conn, rows
+        last_id = rows[-1].id
+
+def index_books(engine, batch_size=500):
+    """0003: search postings for every book"""
+    fields = [book_rows.c.title, book_rows.c.author, book_rows.c.isbn, book_rows.c.subject, book_rows.c.description]
+    for conn, rows in book_batches(engine, fields, batch_size):
+        conn.execute(delete(search_term_rows).where(search_term_rows.c.book_id.in_([row.id for row in rows])))
+        postings = [
+            {'term': term, 'book_id': row.id, 'weight': weight}
+            for row in rows for term, weight in search_index.book_terms(row._asdict()).items()
+        ]
+        if postings:
+            conn.execute(insert(search_term_rows), postings)
+    with engine.begin() as conn:
+        bump_version(conn, 'catalog')
+
+def subject_ids(conn, names):
+    """{slug: id} for a {slug: name} mapping, creating the missing subjects"""
+    subjects = subject_rows.c
+    ids = dict(conn.execute(select(subjects.slug, subjects.id).where(subjects.slug.in_(list(names)))).all())
+    missing = [{'name': name, 'slug': slug, 'book_count': 0} for slug, name in names.items() if slug not in ids]
+    if missing:
+        conn.execute(insert(subject_rows), missing)
+        ids.update(conn.execute(
+            select(subjects.slug, subjects.id).where(subjects.slug.in_([row['slug'] for row in missing]))
+        ).all())
+    return ids
+
+def link_book_subjects(engine, batch_size=500):
+    """0004: subject links from each book's comma-joined subject string"""
+    for conn, rows in book_batches(engine, [book_rows.c.subject], batch_size):
+        by_book = {row.id: split_subjects(row.subject) for row in rows}
+        names = {}
+        for book_names in by_book.values():
+            names.update(book_names)
+        ids = subject_ids(conn, names) if names else {}
+        conn.execute(delete(book_subject_rows).where(book_subject_rows.c.book_id.in_(list(by_book))))
+        links = [{'book_id': book_id, 'subject_id': ids[slug]} for book_id, slugs in by_book.items() for slug in slugs]
+        if links:
+            conn.execute(insert(book_subject_rows), links)
+    with engine.begin() as conn:
+        recount_subject_books(conn)
+        bump_version(conn, 'catalog')
+
+def count_active_loans(engine):
+    """0005: every user's active_loans from their open borrowings"""
+    open_loans = select(func.count()).select_from(borrowing_rows).where(
+        borrowing_rows.c.user_id == user_rows.c.id,
+        borrowing_rows.c.status.in_(ACTIVE_LOAN_STATUSES)
+    ).scalar_subquery()
+    with engine.begin() as conn:
+        conn.execute(update(user_rows).values(active_loans=open_loans))
+
+def seed_stat_counters(engine):
+    """0007: dashboard counters (and subject book counts) from the base tables"""
+    def count(from_table, *filters, of=None):
+        counted = func.count(distinct(of)) if of is not None else func.count()
+        return conn.execute(select(counted).select_from(from_table).where(*filters)).scalar()
+
+    loans, fines = borrowing_rows.c, fine_rows.c
+    with engine.begin() as conn:
+        values = {
+            'total_books': count(book_rows),
+            'total_users': count(user_rows),
+            'active_users': count(user_rows, user_rows.c.status == 'active'),
+            'borrowed': count(borrowing_rows, loans.status.in_(ACTIVE_LOAN_STATUSES)),
+            'overdue': count(borrowing_rows, loans.status == 'overdue'),
+            'returned': count(borrowing_rows, loans.status == 'returned'),
+            'paid_fine_users': count(fine_rows, fines.status == 'paid', of=fines.user_id),
+            'unpaid_fine_users': count(fine_rows, fines.status == 'pending', of=fines.user_id),
+        }
+        conn.execute(delete(stat_counter_rows).where(stat_counter_rows.c.name.in_(list(values))))
+        conn.execute(insert(stat_counter_rows), [
+            {'name': name, 'slot': slot, 'value': value if slot == 0 else 0}
+            for name, value in values.items() for slot in range(STAT_COUNTER_SLOTS)
+        ])
+        recount_subject_books(conn)
+        for name in ('catalog', 'circulation', 'users'):
+            bump_version(conn, name)
+
+def renumber_queues(engine):
+    """0009: each active hold queue's positions as 1..n in (priority, reserved_date) order"""
+    holds = reservation_rows.c
+    with engine.connect() as conn:
+        book_ids = conn.execute(
+            select(holds.book_id).where(holds.status == 'active').distinct().order_by(holds.book_id)
+        ).scalars().all()
+    for book_id in book_ids:
+        with engine.begin() as conn:
+            # The book row lock the app takes before changing a queue
+            conn.execute(select(book_rows.c.id).where(book_rows.c.id == book_id).with_for_update())
+            queue = conn.execute(
+                select(holds.id, holds.priority).where(holds.book_id == book_id, holds.status == 'active')
+                .order_by(holds.priority, holds.reserved_date, holds.id)
+            ).all()
+            moved = [{'hold_id': hold.id, 'position': position}
+                     for position, hold in enumerate(queue, start=1) if hold.priority != position]
+            if moved:
+                conn.execute(
+                    update(reservation_rows).where(holds.id == bindparam('hold_id')).values(priority=bindparam('position')),
+                    moved
+                )
+
+def roll_up_circulation(engine, batch_days=ROLLUP_BATCH_DAYS):
+    """0010: closed days into circulation_daily, continuing after the last rolled-up day"""
+    loans = borrowing_rows.c
+    today = datetime.utcnow().date()
+    with engine.connect() as conn:
+        last_day = conn.execute(select(func.max(circulation_daily_rows.c.day))).scalar()
+        first_borrowing = conn.execute(select(func.min(loans.borrowed_date))).scalar()
+    if last_day is not None:
+        start = last_day + timedelta(days=1)
+    elif first_borrowing is not None:
+        start = first_borrowing.date()
+    else:
+        return
+
+    series = [
+        ('borrows', loans.borrowed_date, ()),
+        ('returns', loans.returned_date, ()),
+        ('late_returns', loans.returned_date, (loans.returned_date > loans.due_date,)),
+        ('renewals', loans.last_renewed_at, ()),
+    ]
+    while start < today:
+        end = min(start + timedelta(days=batch_days), today)
+        days = {start + timedelta(days=offset): dict.fromkeys(CIRCULATION_SERIES, 0)
+                for offset in range((end - start).days)}
+        with engine.begin() as conn:
+            for name, when, filters in series:
+                day = func.date(when)
+                for value, count in conn.execute(
+                    select(day, func.count()).where(
+                        when >= datetime.combine(start, datetime.min.time()),
+                        when < datetime.combine(end, datetime.min.time()),
+                        *filters
+                    ).group_by(day)
+                ):
+                    if isinstance(value, str):
+                        value = date.fromisoformat(value)
+                    days[value][name] = count
+            # Every day gets a row, even a quiet one, so the last row marks progress
+            conn.execute(insert(circulation_daily_rows), [{'day': day, **counts} for day, counts in days.items()])
+        start = end
+
+def fill_isbn13(engine, batch_size=1000):
+    """0011: isbn13 keys from isbn; a key that is already taken is left NULL for a manual merge"""
+    books = book_rows.c
+    for conn, rows in book_batches(engine, [books.isbn], batch_size, books.isbn.isnot(None)):
+        keys, seen = {}, set()
+        for row in rows:
+            key = isbn.normalize_isbn(row.isbn)
+            if key and key not in seen:
+                keys[row.id] = key
+                seen.add(key)
+        taken = set(conn.execute(select(books.isbn13).where(books.isbn13.in_(list(seen)))).scalars()) if seen else set()
+        updates = [{'book_key': book_id, 'key': key} for book_id, key in keys.items() if key not in taken]
+        if updates:
+            conn.execute(update(book_rows).where(books.id == bindparam('book_key')).values(isbn13=bindparam('key')), updates)
+
+def create_book_copies(engine, batch_size=500):
+    """0012: copy records for books without any, with each open loan on its own copy"""
+    books, loans, copies = book_rows.c, borrowing_rows.c, book_copy_rows.c
+    now = datetime.utcnow()
+    has_copies = select(copies.id).where(copies.book_id == books.id).exists()
+    for conn, rows in book_batches(engine, [books.total_copies, books.shelf_location], batch_size, ~has_copies):
+        book_ids = [row.id for row in rows]
+        open_loans = {}
+        for loan in conn.execute(
+            select(loans.id, loans.book_id).where(
+                loans.book_id.in_(book_ids), loans.status.in_(ACTIVE_LOAN_STATUSES), loans.copy_id.is_(None)
+            ).order_by(loans.id)
+        ):
+            open_loans.setdefault(loan.book_id, []).append(loan.id)
+        # Never fewer copies than are out on loan
+        new_copies = [{
+            'book_id': row.id,
+            'copy_number': number,
+            'barcode': copy_barcode(row.id, number),
+            'shelf_position': row.shelf_location,
+            'condition': 'good',
+            'created_at': now
+        } for row in rows for number in range(1, max(row.total_copies or 0, len(open_loans.get(row.id, ()))) + 1)]
+        if not new_copies:
+            continue
+        conn.execute(insert(book_copy_rows), new_copies)
+        copy_ids = {(copy.book_id, copy.copy_number): copy.id for copy in conn.execute(
+            select(copies.id, copies.book_id, copies.copy_number).where(copies.book_id.in_(book_ids))
+        )}
+        assigned = [{'loan_id': loan_id, 'copy': copy_ids[book_id, number]}
+                    for book_id, loan_ids in open_loans.items() for number, loan_id in enumerate(loan_ids, start=1)]
+        if assigned:
+            conn.execute(update(borrowing_rows).where(loans.id == bindparam('loan_id')).values(copy_id=bindparam('copy')), assigned)
+
+def log_last_renewals(engine):
+    """0013: a renewal event for each loan's recorded renewal.
+
+    Loans kept only their latest renewal time, so earlier renewals of a loan
+    renewed more than once cannot be recovered.
+    """
+    loans = borrowing_rows.c
+    logged = select(renewal_rows.c.borrowing_id).where(renewal_rows.c.borrowing_id == loans.id).exists()
+    with engine.begin() as conn:
+        conn.execute(insert(renewal_rows).from_select(
+            ['borrowing_id', 'renewed_at'],
+            select(loans.id, loans.last_renewed_at).where(loans.last_renewed_at.isnot(None), ~logged)
+        ))
+
+MIGRATIONS = [
+    Migration('0001', 'initial schema', initial_schema, None),
+    Migration('0002', 'stat counters and data versions', bookkeeping_tables, None),
+    Migration('0003', 'full-text search index', search_index_table, index_books),
+    Migration('0004', 'normalized subjects', subject_tables, link_book_subjects),
+    Migration('0005', 'per-user active loan counter', active_loans_column, count_active_loans),
+    Migration('0006', 'hot-path secondary indexes', hot_path_indexes, None),
+    Migration('0007', 'seed dashboard counters', None, seed_stat_counters),
+    Migration('0008', 'overdue sweeper reminders', loan_notice_column, None),
+    Migration('0009', 'reservation hold queues', hold_queue_indexes, renumber_queues),
+    Migration('0010', 'daily circulation rollup', circulation_rollup, roll_up_circulation),
+    Migration('0011', 'catalog import with ISBN-13 keys', catalog_import, fill_isbn13),
+    Migration('0012', 'per-copy inventory', book_copies, create_book_copies),
+    Migration('0013', 'renewal log', renewal_log, log_last_renewals),
+]
+
+# Commands
+# Each takes the engine to migrate, the app's primary database by default
+def applied_versions(engine):
+    with engine.begin() as conn:
+        schema_migrations.create(bind=conn, checkfirst=True)
+        return {row.version for row in conn.execute(schema_migrations.select())}
+
+def record(engine, migration):
+    with engine.begin() as conn:
+        conn.execute(schema_migrations.insert().values(
+            version=migration.version,
+            description=migration.description,
+            applied_at=datetime.utcnow()
+        ))
+
+def upgrade(engine=None):
+    """Apply every pending migration in order; returns the number applied"""
+    engine = engine or db.engine
+    done = applied_versions(engine)
+    pending = [m for m in MIGRATIONS if m.version not in done]
+    for migration in pending:
+        print(f"Applying {migration.version}: {migration.description}")
+        if migration.schema:
+            # MySQL commits DDL implicitly; each step is idempotent instead
+            with engine.begin() as conn:
+                migration.schema(conn)
+        if migration.data:
+            migration.data(engine)
+        record(engine, migration)
+    return len(pending)
+
+def stamp(engine=None):
+    """Mark all migrations applied without running them"""
+    engine = engine or db.engine
+    done = applied_versions(engine)
+    for migration in MIGRATIONS:
+        if migration.version not in done:
+            record(engine, migration)
+
+def status(engine=None):
+    done = applied_versions(engine or db.engine)
+    for migration in MIGRATIONS:
+        state = 'applied' if migration.version in done else 'pending'
+        print(f"{migration.version}  {state:8}  {migration.description}")
+
+def main():
+    parser = argparse.ArgumentParser(description='Library Management System schema migrations')
+    parser.add_argument('command', choices=['upgrade', 'status', 'stamp'])
+    args = parser.parse_args()
+
+    with app.app_context():
+        try:
+            if args.command == 'upgrade':
+                applied = upgrade()
+                print(f"Database is up to date ({applied} migration(s) applied).")
+            elif args.command == 'stamp':
+                stamp()
+                print("All migrations marked as applied.")
+            else:
+                status()
+        except Exception as e:
+            print(f"Migration failed: {e}")
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
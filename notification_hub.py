@@ -0,0 +1,79 @@
+"""
+In-process publish/subscribe for notification streams.
+A stream subscribes for its user and sleeps until a publish for that user wakes
+it, so an idle dashboard costs no queries. The hub carries no payloads: a woken
+stream reads what is new from the database, which stays the source of truth.
+Publishes only reach streams in the same process, so streams also re-check the
+database on their keepalive interval to pick up writes made elsewhere.
+"""
+
+import os
+import threading
+
+MAX_SUBSCRIBERS = int(os.getenv('NOTIFICATION_STREAM_MAX', '500'))  # open streams (each holds a worker thread)
+KEEPALIVE_SECONDS = int(os.getenv('NOTIFICATION_KEEPALIVE', '25'))  # idle streams ping and re-check this often
+
+_subscribers = {}  # user_id -> set of Subscription
+_count = 0
+_lock = threading.Lock()
+
+
+class HubFull(RuntimeError):
+    """Raised when MAX_SUBSCRIBERS streams are already open"""
+
+
+class Subscription:
+    """One open stream's registration; close() it when the stream ends"""
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self._event = threading.Event()
+        self._closed = False
+
+    def wait(self, timeout=KEEPALIVE_SECONDS):
+        """Sleep until the user is published to or the timeout passes; True if woken.
+
+        The wakeup is cleared before returning, so a publish that lands while the
+        caller reads the database fires the next wait instead of being lost.
+        """
+        woken = self._event.wait(timeout)
+        self._event.clear()
+        return woken
+
+    def close(self):
+        global _count
+        with _lock:
+            if self._closed:
+                return
+            self._closed = True
+            subscriptions = _subscribers[self.user_id]
+            subscriptions.discard(self)
+            if not subscriptions:
+                del _subscribers[self.user_id]
+            _count -= 1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def subscribe(user_id):
+    """Register a stream for a user"""
+    global _count
+    subscription = Subscription(user_id)
+    with _lock:
+        if _count >= MAX_SUBSCRIBERS:
+            raise HubFull('Too many open notification streams')
+        _subscribers.setdefault(user_id, set()).add(subscription)
+        _count += 1
+    return subscription
+
+
+def publish(user_ids):
+    """Wake every open stream of these users"""
+    with _lock:
+        woken = [subscription for user_id in set(user_ids) for subscription in _subscribers.get(user_id, ())]
+    for subscription in woken:
+        subscription._event.set()
@@ -0,0 +1,122 @@
+"""
+Password hashing on a bounded process pool.
+PBKDF2 is CPU-bound and holds the GIL, so hashes are computed in worker processes
+and web threads only wait on the result. A cap on outstanding jobs sheds a login
+burst with PoolBusy instead of letting it queue up behind every other request.
+"""
+
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+# Hashes made with any other method (or cost) are upgraded at the next successful login
+PASSWORD_HASH_METHOD = os.getenv('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:600000')
+POOL_SIZE = int(os.getenv('PASSWORD_POOL_SIZE', str(os.cpu_count() or 2)))  # 0 hashes inline
+MAX_PENDING = int(os.getenv('PASSWORD_POOL_MAX_PENDING', str(max(POOL_SIZE, 1) * 8)))
+WAIT_TIMEOUT = float(os.getenv('PASSWORD_POOL_TIMEOUT', '10'))  # seconds a request waits for its job
+
+_executor = None
+_executor_lock = threading.Lock()
+_pending = threading.BoundedSemaphore(MAX_PENDING)
+
+
+class PoolBusy(RuntimeError):
+    """Raised when the hashing queue is full or a job took too long"""
+
+
+def _hash(password, method):
+    return generate_password_hash(password, method=method)
+
+
+def _verify(pwhash, password, method):
+    """Check a password; on success also return a fresh hash if the stored one is outdated"""
+    if not check_password_hash(pwhash, password):
+        return False, None
+    if pwhash.split('$', 1)[0] != method:
+        return True, generate_password_hash(password, method=method)
+    return True, None
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=POOL_SIZE)
+        return _executor
+
+
+def _reset_executor(broken):
+    global _executor
+    with _executor_lock:
+        if _executor is broken:
+            _executor = None
+
+
+def _submit(func, *args, wait=False):
+    """Queue a job on the pool, holding one pending slot until it finishes"""
+    acquired = _pending.acquire(timeout=WAIT_TIMEOUT) if wait else _pending.acquire(blocking=False)
+    if not acquired:
+        raise PoolBusy('Too many password operations in progress')
+    executor = _get_executor()
+    try:
+        future = executor.submit(func, *args)
+    except BaseException:
+        _pending.release()
+        raise
+    # The slot is freed when the job finishes, even if the caller stopped waiting
+    future.add_done_callback(lambda _: _pending.release())
+    return executor, future
+
+
+def _result(executor, future, timeout=WAIT_TIMEOUT):
+    try:
+        return future.result(timeout=timeout)
+    except FutureTimeout as e:
+        raise PoolBusy('Password operation timed out') from e
+    except BrokenProcessPool as e:
+        # A worker died; start a fresh pool on the next call
+        _reset_executor(executor)
+        raise PoolBusy('Password worker pool restarted') from e
+
+
+def _run(func, *args):
+    if POOL_SIZE <= 0:
+        return func(*args)
+    return _result(*_submit(func, *args))
+
+
+def _hash_many(passwords, method):
+    return [generate_password_hash(password, method=method) for password in passwords]
+
+
+def hash_password(password):
+    """Hash a new password with the current method"""
+    return _run(_hash, password, PASSWORD_HASH_METHOD)
+
+
+def hash_passwords(passwords):
+    """Hash a batch of passwords in parallel, returning hashes in order.
+
+    The batch is split into one job per worker, so a bulk import uses every core
+    while leaving most queue slots free for interactive logins.
+    """
+    passwords = list(passwords)
+    if POOL_SIZE <= 0 or not passwords:
+        return _hash_many(passwords, PASSWORD_HASH_METHOD)
+    size = -(-len(passwords) // POOL_SIZE)
+    jobs = [
+        _submit(_hash_many, passwords[i:i + size], PASSWORD_HASH_METHOD, wait=True)
+        for i in range(0, len(passwords), size)
+    ]
+    hashes = []
+    for executor, future in jobs:
+        hashes.extend(_result(executor, future, timeout=None))
+    return hashes
+
+
+def verify_password(pwhash, password):
+    """Return (matches, new_hash); new_hash is set when the stored hash should be replaced"""
+    return _run(_verify, pwhash, password, PASSWORD_HASH_METHOD)
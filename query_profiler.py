@@ -0,0 +1,175 @@
+"""
+SQL query profiling on SQLAlchemy engine events.
+While a profile is active every statement is recorded with its duration and a
+fingerprint (the SQL with literals, placeholders and IN/VALUES lists folded), so
+statements that differ only in parameters group together. A SELECT fingerprint
+repeated N_PLUS_ONE_THRESHOLD times in one profile is reported as a likely N+1.
+Statements slower than SLOW_QUERY_MS go to the slow-query log whether or not a
+profile is active. query_budget() fails a block (e.g. a test request) that runs
+more statements than allowed.
+"""
+
+import contextvars
+import logging
+import os
+import re
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+ENABLED = os.getenv('QUERY_PROFILER', '0') == '1'  # profile every request
+SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', '200'))
+SLOW_QUERY_LOG = os.getenv('SLOW_QUERY_LOG', '')  # file path; default is the library.slow_queries logger only
+N_PLUS_ONE_THRESHOLD = int(os.getenv('N_PLUS_ONE_THRESHOLD', '5'))
+HISTORY_SIZE = 50  # recent request profiles kept for inspection
+STATEMENT_PREVIEW = 500  # characters of SQL kept per statement
+
+logger = logging.getLogger('library.query_profiler')
+slow_log = logging.getLogger('library.slow_queries')
+
+_active = contextvars.ContextVar('query_profiles', default=())
+_installed = False
+recent = deque(maxlen=HISTORY_SIZE)
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDER_RE = re.compile(r'%\(\w+\)s|%s|:\w+|\?')
+_LIST_RE = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+_ROWS_RE = re.compile(r'\(\.\.\.\)(?:\s*,\s*\(\.\.\.\))+')
+_SPACE_RE = re.compile(r'\s+')
+
+
+class QueryBudgetExceeded(AssertionError):
+    """A query_budget() block ran more statements than it was allowed"""
+
+
+def fingerprint(statement):
+    """The statement with its parameters folded away, for grouping repeats"""
+    text = _STRING_RE.sub('?', statement)
+    text = _NUMBER_RE.sub('?', text)
+    text = _PLACEHOLDER_RE.sub('?', text)
+    text = _LIST_RE.sub('(...)', text)
+    text = _ROWS_RE.sub('(...), ...', text)
+    return _SPACE_RE.sub(' ', text).strip()
+
+
+class Profile:
+    """Statements run while the profile was active: (fingerprint, SQL, seconds)"""
+
+    def __init__(self, label=None):
+        self.label = label
+        self.statements = []
+
+    def record(self, statement, seconds):
+        self.statements.append((fingerprint(statement), statement, seconds))
+
+    @property
+    def total_seconds(self):
+        return sum(seconds for _, _, seconds in self.statements)
+
+    def groups(self):
+        """[(fingerprint, count, seconds)], most repeated first"""
+        counts, seconds = Counter(), Counter()
+        for key, _, duration in self.statements:
+            counts[key] += 1
+            seconds[key] += duration
+        return [(key, count, seconds[key]) for key, count in counts.most_common()]
+
+    def repeated_selects(self, threshold=N_PLUS_ONE_THRESHOLD):
+        """Groups that look like N+1 loads: the same SELECT run `threshold` or more times"""
+        return [group for group in self.groups() if group[1] >= threshold and group[0].upper().startswith('SELECT')]
+
+    def summary(self):
+        return {
+            'label': self.label,
+            'queries': len(self.statements),
+            'total_ms': round(self.total_seconds * 1000, 2),
+            'groups': [
+                {'fingerprint': key, 'count': count, 'total_ms': round(seconds * 1000, 2)}
+                for key, count, seconds in self.groups()
+            ],
+            'n_plus_one': [key for key, _, _ in self.repeated_selects()],
+            'statements': [
+                {'sql': statement[:STATEMENT_PREVIEW], 'ms': round(seconds * 1000, 2)}
+                for _, statement, seconds in self.statements
+            ],
+        }
+
+    def report(self):
+        """Readable per-fingerprint breakdown, for logs and assertion messages"""
+        lines = [f'{len(self.statements)} queries in {self.total_seconds * 1000:.1f} ms ({self.label or "unlabelled"})']
+        for key, count, seconds in self.groups():
+            lines.append(f'  {count:4d} x {seconds * 1000:8.1f} ms  {key[:STATEMENT_PREVIEW]}')
+        return '\n'.join(lines)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._profiler_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    seconds = time.perf_counter() - context._profiler_started
+    profiles = _active.get()
+    for profile in profiles:
+        profile.record(statement, seconds)
+    if seconds * 1000 >= SLOW_QUERY_MS:
+        label = profiles[0].label if profiles else None
+        slow_log.warning('%.1f ms [%s] %s', seconds * 1000, label or '-', _SPACE_RE.sub(' ', statement)[:STATEMENT_PREVIEW])
+
+
+def install():
+    """Listen to every engine's statements; idempotent"""
+    global _installed
+    if _installed:
+        return
+    event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+    if SLOW_QUERY_LOG:
+        handler = logging.FileHandler(SLOW_QUERY_LOG)
+        handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+        slow_log.addHandler(handler)
+        slow_log.setLevel(logging.WARNING)
+    _installed = True
+
+
+def start(label=None):
+    """Begin a profile in the current context; returns (profile, token for finish())"""
+    install()
+    profile = Profile(label)
+    return profile, _active.set(_active.get() + (profile,))
+
+
+def finish(token):
+    _active.reset(token)
+
+
+def log_profile(profile):
+    """Keep a finished request profile for inspection and warn about likely N+1 loads"""
+    recent.append(profile.summary())
+    for key, count, seconds in profile.repeated_selects():
+        logger.warning('Possible N+1 in %s: %d x %s (%.1f ms)', profile.label, count, key[:STATEMENT_PREVIEW], seconds * 1000)
+
+
+@contextmanager
+def profiling(label=None):
+    profile, token = start(label)
+    try:
+        yield profile
+    finally:
+        finish(token)
+
+
+@contextmanager
+def query_budget(limit, label=None):
+    """Raise QueryBudgetExceeded if the block runs more than `limit` statements.
+
+        with query_budget(6, 'user dashboard'):
+            client.get('/api/user/dashboard')
+    """
+    with profiling(label) as profile:
+        yield profile
+    if len(profile.statements) > limit:
+        raise QueryBudgetExceeded(f'Query budget of {limit} exceeded: {profile.report()}')
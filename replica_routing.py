@@ -0,0 +1,114 @@
+"""
+Read-replica routing.
+Replicas are extra SQLAlchemy binds (replica_0, replica_1, ...). A view marked
+read-only picks a healthy replica for the request and the session sends its
+plain SELECTs there; writes, locking reads and everything after the request's
+first write go to the primary. Health is a cached probe per replica: a replica
+that is unreachable or further behind its source than DB_REPLICA_MAX_LAG is
+skipped until a later probe finds it caught up.
+"""
+
+import itertools
+import os
+import threading
+import time
+
+from flask import g, has_app_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy.exc import DBAPIError
+
+REPLICA_URLS = [url.strip() for url in os.getenv('DB_REPLICA_URLS', '').split(',') if url.strip()]
+MAX_LAG_SECONDS = float(os.getenv('DB_REPLICA_MAX_LAG', '5'))  # replication delay a replica may serve reads with
+CHECK_INTERVAL = float(os.getenv('DB_REPLICA_CHECK_INTERVAL', '5'))  # seconds a health probe result is trusted
+STICKY_SECONDS = float(os.getenv('DB_REPLICA_STICKY_SECONDS', '10'))  # reads stay on the primary this long after a write
+CONNECT_TIMEOUT = 2  # seconds; a replica that is down must fail fast
+
+BIND_KEYS = [f'replica_{i}' for i in range(len(REPLICA_URLS))]
+
+_health = {}  # bind key -> (checked at, healthy)
+_probing = {key: threading.Lock() for key in BIND_KEYS}
+_rotation = itertools.count()
+
+
+def bind_config(engine_options):
+    """SQLALCHEMY_BINDS entries for the configured replicas, sharing the primary's engine options"""
+    binds = {}
+    for key, url in zip(BIND_KEYS, REPLICA_URLS):
+        options = dict(engine_options, url=url, pool_logging_name=key)
+        if url.startswith('mysql'):
+            options['connect_args'] = {'connect_timeout': CONNECT_TIMEOUT}
+        binds[key] = options
+    return binds
+
+
+class RoutingSession(Session):
+    """Sends plain SELECTs to the request's replica (g.db_replica) and everything else to the primary.
+
+    The first statement that isn't a plain SELECT clears g.db_replica, so whatever the
+    request reads after writing comes from the primary and sees its own changes.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        replica = g.get('db_replica') if bind is None and has_app_context() else None
+        if replica:
+            if (not self._flushing and clause is not None and clause.is_select
+                    and getattr(clause, '_for_update_arg', None) is None):
+                return self._db.engines[replica]
+            g.db_replica = None
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def use_primary():
+    """Send the rest of this request's reads to the primary"""
+    if has_app_context():
+        g.db_replica = None
+
+
+def replica_lag(connection):
+    """Seconds the replica is behind its source: 0 if it reports no replication, inf if replication stopped"""
+    if connection.dialect.name != 'mysql':
+        connection.exec_driver_sql('SELECT 1')
+        return 0
+    try:
+        status = connection.exec_driver_sql('SHOW REPLICA STATUS').mappings().first()
+    except DBAPIError:  # MySQL before 8.0.22
+        connection.rollback()
+        status = connection.exec_driver_sql('SHOW SLAVE STATUS').mappings().first()
+    if status is None:
+        return 0
+    lag = status.get('Seconds_Behind_Source', status.get('Seconds_Behind_Master'))
+    return float('inf') if lag is None else float(lag)
+
+
+def probe(engine):
+    """True if the replica answers and is within MAX_LAG_SECONDS of its source"""
+    try:
+        with engine.connect() as connection:
+            return replica_lag(connection) <= MAX_LAG_SECONDS
+    except DBAPIError:
+        return False
+
+
+def mark_down(key):
+    """Skip a replica that just failed until its next probe"""
+    _health[key] = (time.monotonic(), False)
+
+
+def choose_replica(engines):
+    """Bind key of a healthy replica (round robin), or None to read from the primary"""
+    healthy = []
+    for key in BIND_KEYS:
+        checked_at, ok = _health.get(key, (None, False))
+        # One request re-probes a stale replica; the others go by the last result meanwhile
+        if (checked_at is None or time.monotonic() - checked_at >= CHECK_INTERVAL) \
+                and _probing[key].acquire(blocking=False):
+            try:
+                ok = probe(engines[key])
+                _health[key] = (time.monotonic(), ok)
+            finally:
+                _probing[key].release()
+        if ok:
+            healthy.append(key)
+    if not healthy:
+        return None
+    return healthy[next(_rotation) % len(healthy)]
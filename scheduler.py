@@ -0,0 +1,44 @@
+"""
+Minimal in-process scheduler for periodic maintenance jobs.
+Each job runs on its own daemon thread; the same jobs can be run from cron via maintenance.py.
+"""
+
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class PeriodicTask:
+    """Call `func` every `interval` seconds on a daemon thread until stopped"""
+
+    def __init__(self, name, interval, func):
+        self.name = name
+        self.interval = interval
+        self.func = func
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.func()
+            except Exception:
+                # A failed run is retried on the next tick
+                logger.exception('Periodic task %s failed', self.name)
+
+
+def start_periodic(name, interval, func):
+    """Start a periodic task; an interval of 0 or less disables it"""
+    if not interval or interval <= 0:
+        return None
+    return PeriodicTask(name, interval, func).start()
@@ -0,0 +1,65 @@
+"""
+Full-text search helpers for the book catalog.
+Turns book fields into weighted index terms and search text into query tokens.
+"""
+
+import math
+import re
+import unicodedata
+from collections import defaultdict
+
+# Relative importance of each field when ranking results
+FIELD_WEIGHTS = {
+    'title': 3.0,
+    'author': 2.0,
+    'isbn': 2.0,
+    'subject': 1.5,
+    'description': 1.0,
+}
+
+MAX_TERM_LENGTH = 50     # must fit BookSearchTerm.term
+MIN_PREFIX_LENGTH = 2    # shorter query tokens only match whole terms
+MAX_QUERY_TOKENS = 8     # longer queries are truncated
+PREFIX_MATCH_FACTOR = 0.5  # prefix hits rank below exact hits
+
+_TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+
+def tokenize(text):
+    """Split text into lowercase, accent-free alphanumeric tokens"""
+    if not text:
+        return []
+    text = unicodedata.normalize('NFKD', str(text))
+    text = ''.join(c for c in text if not unicodedata.combining(c)).lower()
+    return [token[:MAX_TERM_LENGTH] for token in _TOKEN_RE.findall(text)]
+
+
+def book_terms(fields):
+    """Return a {term: weight} mapping for a book's searchable fields"""
+    frequencies = defaultdict(lambda: defaultdict(int))
+    for field, weight in FIELD_WEIGHTS.items():
+        for token in tokenize(fields.get(field)):
+            frequencies[token][field] += 1
+
+    # Index the ISBN with its punctuation removed as well
+    isbn_digits = ''.join(tokenize(fields.get('isbn')))
+    if isbn_digits:
+        frequencies[isbn_digits[:MAX_TERM_LENGTH]]['isbn'] += 1
+
+    terms = {}
+    for term, counts in frequencies.items():
+        # Dampen repeated occurrences so long descriptions don't dominate
+        terms[term] = round(sum(
+            FIELD_WEIGHTS[field] * (1 + math.log(count))
+            for field, count in counts.items()
+        ), 4)
+    return terms
+
+
+def parse_query(text):
+    """Return the distinct tokens of a search string, in order"""
+    tokens = []
+    for token in tokenize(text):
+        if token not in tokens:
+            tokens.append(token)
+    return tokens[:MAX_QUERY_TOKENS]
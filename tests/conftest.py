@@ -0,0 +1,10 @@
+"""
+Point the app at a throwaway SQLite database before any test imports it.
+"""
+
+import os
+import tempfile
+
+os.environ.setdefault(
+    'DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='library-tests-'), 'library.db')
+)
@@ -0,0 +1,211 @@
+"""
+Upgrading a database built by the original (pre-migration) schema to head.
+Runs on a throwaway SQLite file; the app's own database is never touched.
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import (
+    Boolean, Column, DateTime, Float, ForeignKey, Integer, MetaData, String, Table, Text,
+    create_engine, func, inspect, select,
+)
+
+import migrate
+
+# The tables exactly as the first release's models created them
+baseline = MetaData()
+Table(
+    'user', baseline,
+    Column('id', Integer, primary_key=True),
+    Column('email', String(120), unique=True, nullable=False),
+    Column('password_hash', String(255), nullable=False),
+    Column('first_name', String(50), nullable=False),
+    Column('last_name', String(50), nullable=False),
+    Column('user_type', String(20), nullable=False),
+    Column('student_id', String(20)),
+    Column('department', String(100)),
+    Column('phone', String(20)),
+    Column('status', String(20)),
+    Column('max_books', Integer),
+    Column('created_at', DateTime),
+)
+Table(
+    'book', baseline,
+    Column('id', Integer, primary_key=True),
+    Column('title', String(200), nullable=False),
+    Column('author', String(100), nullable=False),
+    Column('isbn', String(20), unique=True),
+    Column('subject', String(100)),
+    Column('description', Text),
+    Column('total_copies', Integer),
+    Column('available_copies', Integer),
+    Column('shelf_location', String(50)),
+    Column('condition', String(20)),
+    Column('publication_year', Integer),
+    Column('created_at', DateTime),
+)
+Table(
+    'borrowing', baseline,
+    Column('id', Integer, primary_key=True),
+    Column('user_id', Integer, ForeignKey('user.id'), nullable=False),
+    Column('book_id', Integer, ForeignKey('book.id'), nullable=False),
+    Column('borrowed_date', DateTime),
+    Column('due_date', DateTime, nullable=False),
+    Column('returned_date', DateTime),
+    Column('renewal_count', Integer),
+    Column('max_renewals', Integer),
+    Column('status', String(20)),
+)
+Table(
+    'reservation', baseline,
+    Column('id', Integer, primary_key=True),
+    Column('user_id', Integer, ForeignKey('user.id'), nullable=False),
+    Column('book_id', Integer, ForeignKey('book.id'), nullable=False),
+    Column('reserved_date', DateTime),
+    Column('expiry_date', DateTime, nullable=False),
+    Column('status', String(20)),
+    Column('priority', Integer),
+)
+Table(
+    'fine', baseline,
+    Column('id', Integer, primary_key=True),
+    Column('user_id', Integer, ForeignKey('user.id'), nullable=False),
+    Column('borrowing_id', Integer, ForeignKey('borrowing.id'), nullable=False),
+    Column('amount', Float, nullable=False),
+    Column('reason', String(100)),
+    Column('status', String(20)),
+    Column('created_at', DateTime),
+    Column('paid_at', DateTime),
+)
+Table(
+    'admin', baseline,
+    Column('id', Integer, primary_key=True),
+    Column('username', String(80), unique=True, nullable=False),
+    Column('password_hash', String(255), nullable=False),
+    Column('email', String(120), unique=True, nullable=False),
+    Column('role', String(50)),
+    Column('created_at', DateTime),
+)
+Table(
+    'notification', baseline,
+    Column('id', Integer, primary_key=True),
+    Column('user_id', Integer, ForeignKey('user.id'), nullable=False),
+    Column('title', String(100), nullable=False),
+    Column('message', Text, nullable=False),
+    Column('type', String(20)),
+    Column('read', Boolean),
+    Column('created_at', DateTime),
+)
+
+NOW = datetime.utcnow()
+
+
+def seed(conn):
+    tables = baseline.tables
+    conn.execute(tables['user'].insert(), [
+        {'id': 1, 'email': 'ada@example.edu', 'password_hash': 'x', 'first_name': 'Ada', 'last_name': 'L',
+         'user_type': 'student', 'status': 'active', 'max_books': 5},
+        {'id': 2, 'email': 'alan@example.edu', 'password_hash': 'x', 'first_name': 'Alan', 'last_name': 'T',
+         'user_type': 'faculty', 'status': 'suspended', 'max_books': 10},
+    ])
+    conn.execute(tables['book'].insert(), [
+        {'id': 1, 'title': 'The Great Gatsby', 'author': 'F. Scott Fitzgerald', 'isbn': '978-0743273565',
+         'subject': 'Fiction, Classic', 'description': 'Jazz Age novel', 'total_copies': 2,
+         'available_copies': 0, 'shelf_location': 'F-FIT'},
+        {'id': 2, 'title': 'A Brief History of Time', 'author': 'Stephen Hawking', 'isbn': '0-553-38016-8',
+         'subject': 'Science', 'description': None, 'total_copies': 1, 'available_copies': 1,
+         'shelf_location': 'S-HAW'},
+        {'id': 3, 'title': 'Lost Manuscript', 'author': 'Anonymous', 'isbn': None,
+         'subject': None, 'description': None, 'total_copies': 0, 'available_copies': 0, 'shelf_location': None},
+    ])
+    conn.execute(tables['borrowing'].insert(), [
+        {'id': 1, 'user_id': 1, 'book_id': 1, 'borrowed_date': NOW - timedelta(days=3),
+         'due_date': NOW + timedelta(days=11), 'returned_date': None, 'status': 'borrowed'},
+        {'id': 2, 'user_id': 2, 'book_id': 1, 'borrowed_date': NOW - timedelta(days=20),
+         'due_date': NOW - timedelta(days=6), 'returned_date': None, 'status': 'overdue'},
+        {'id': 3, 'user_id': 1, 'book_id': 2, 'borrowed_date': NOW - timedelta(days=40),
+         'due_date': NOW - timedelta(days=26), 'returned_date': NOW - timedelta(days=20), 'status': 'returned'},
+    ])
+    conn.execute(tables['reservation'].insert(), [
+        {'id': 1, 'user_id': 1, 'book_id': 1, 'reserved_date': NOW - timedelta(days=2),
+         'expiry_date': NOW + timedelta(days=5), 'status': 'active', 'priority': 3},
+        {'id': 2, 'user_id': 2, 'book_id': 1, 'reserved_date': NOW - timedelta(days=1),
+         'expiry_date': NOW + timedelta(days=6), 'status': 'active', 'priority': 7},
+    ])
+    conn.execute(tables['fine'].insert(), [
+        {'id': 1, 'user_id': 1, 'borrowing_id': 3, 'amount': 3.0, 'reason': 'overdue', 'status': 'paid'},
+        {'id': 2, 'user_id': 2, 'borrowing_id': 2, 'amount': 1.5, 'reason': 'overdue', 'status': 'pending'},
+    ])
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f'sqlite:///{tmp_path / "baseline.db"}')
+    baseline.create_all(engine)
+    with engine.begin() as conn:
+        seed(conn)
+    yield engine
+    engine.dispose()
+
+
+def rows(conn, sql):
+    return conn.exec_driver_sql(sql).all()
+
+
+def test_upgrade_baseline_to_head(engine):
+    assert migrate.upgrade(engine) == len(migrate.MIGRATIONS)
+    assert migrate.applied_versions(engine) == {m.version for m in migrate.MIGRATIONS}
+
+    schema = inspect(engine)
+    assert {'last_notice', 'last_renewed_at', 'copy_id'} <= {c['name'] for c in schema.get_columns('borrowing')}
+    assert 'isbn13' in {c['name'] for c in schema.get_columns('book')}
+    assert 'active_loans' in {c['name'] for c in schema.get_columns('user')}
+    reservation_indexes = {i['name'] for i in schema.get_indexes('reservation')}
+    assert 'ix_reservation_book_id_status_priority' in reservation_indexes
+    assert 'ix_reservation_book_id_status' not in reservation_indexes
+
+    with engine.connect() as conn:
+        # 0003 search postings, 0004 subjects
+        assert rows(conn, "SELECT book_id FROM book_search_term WHERE term = 'gatsby'") == [(1,)]
+        assert dict(rows(conn, 'SELECT slug, book_count FROM subject')) == {'fiction': 1, 'classic': 1, 'science': 1}
+        # 0005 active loan counters
+        assert dict(rows(conn, 'SELECT id, active_loans FROM user')) == {1: 1, 2: 1}
+        # 0007 dashboard counters
+        counters = dict(rows(conn, 'SELECT name, SUM(value) FROM stat_counter GROUP BY name'))
+        assert counters == {
+            'total_books': 3, 'total_users': 2, 'active_users': 1, 'borrowed': 2, 'overdue': 1,
+            'returned': 1, 'paid_fine_users': 1, 'unpaid_fine_users': 1,
+        }
+        # 0009 queue positions
+        assert rows(conn, 'SELECT id, priority FROM reservation ORDER BY id') == [(1, 1), (2, 2)]
+        # 0010 rollup of closed days
+        rollup = conn.execute(select(func.sum(migrate.circulation_daily_rows.c.borrows))).scalar()
+        assert rollup == 3
+        # 0011 ISBN-13 keys
+        assert dict(rows(conn, 'SELECT id, isbn13 FROM book')) == {1: '9780743273565', 2: '9780553380163', 3: None}
+        # 0012 copies, with each open loan on its own copy of the right book
+        assert dict(rows(conn, 'SELECT book_id, COUNT(*) FROM book_copy GROUP BY book_id')) == {1: 2, 2: 1}
+        loans = rows(conn, 'SELECT b.id, c.book_id FROM borrowing b JOIN book_copy c ON c.id = b.copy_id '
+                           "WHERE b.status IN ('borrowed', 'overdue') ORDER BY b.id")
+        assert loans == [(1, 1), (2, 1)]
+        assert len(set(rows(conn, 'SELECT copy_id FROM borrowing WHERE copy_id IS NOT NULL'))) == 2
+
+    assert migrate.upgrade(engine) == 0
+
+
+def test_upgrade_keeps_duplicate_isbns_for_manual_merge(engine):
+    # The same book entered twice, once as ISBN-13 and once as ISBN-10, before isbn13 existed
+    with engine.begin() as conn:
+        conn.execute(baseline.tables['book'].insert(), [
+            {'id': 4, 'title': 'The Great Gatsby', 'author': 'F. Scott Fitzgerald', 'isbn': '9780743273565 ',
+             'total_copies': 1, 'available_copies': 1},
+            {'id': 5, 'title': 'Gatsby (reprint)', 'author': 'F. Scott Fitzgerald', 'isbn': '0743273567',
+             'total_copies': 1, 'available_copies': 1},
+        ])
+
+    assert migrate.upgrade(engine) == len(migrate.MIGRATIONS)
+    with engine.connect() as conn:
+        keys = dict(rows(conn, 'SELECT id, isbn13 FROM book'))
+    assert keys[1] == '9780743273565'
+    assert keys[4] is None and keys[5] is None
@@ -0,0 +1,89 @@
+"""
+Query budgets for the dashboard and fines endpoints.
+Each request runs inside query_budget(), so a change that adds per-row
+queries (an N+1) fails here instead of in production.
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+import migrate
+from app import app, db, Admin, Book, Borrowing, Fine, Notification, User, reconcile_stat_counters
+from query_profiler import QueryBudgetExceeded, query_budget
+
+USERS = 3
+BOOKS = 12
+
+
+@pytest.fixture(scope='module')
+def library():
+    now = datetime.utcnow()
+    with app.app_context():
+        db.drop_all()
+        migrate.upgrade(db.engine)
+        db.session.add(Admin(username='admin', password_hash='x', email='admin@example.edu', role='super_admin'))
+        users = [
+            User(email=f'reader{i}@example.edu', password_hash='x', first_name='Reader', last_name=str(i),
+                 user_type='student', max_books=20)
+            for i in range(USERS)
+        ]
+        books = [
+            Book(title=f'Book {i}', author=f'Author {i}', isbn=None, subject='Fiction', description='x' * 500,
+                 total_copies=5, available_copies=5)
+            for i in range(BOOKS)
+        ]
+        db.session.add_all(users + books)
+        db.session.flush()
+
+        # Every reader has current, overdue and returned loans, fines and notifications,
+        # so a per-row lazy load would show up as extra queries
+        for user in users:
+            for i, book in enumerate(books):
+                if i % 3 == 0:
+                    status, due, returned = 'returned', now - timedelta(days=30), now - timedelta(days=20)
+                elif i % 3 == 1:
+                    status, due, returned = 'overdue', now - timedelta(days=5), None
+                else:
+                    status, due, returned = 'borrowed', now + timedelta(days=7), None
+                loan = Borrowing(user_id=user.id, book_id=book.id, borrowed_date=due - timedelta(days=14),
+                                 due_date=due, returned_date=returned, status=status)
+                db.session.add(loan)
+                db.session.flush()
+                if status != 'borrowed':
+                    db.session.add(Fine(user_id=user.id, borrowing_id=loan.id, amount=2.5, reason='overdue',
+                                        status='pending' if status == 'overdue' else 'paid'))
+                db.session.add(Notification(user_id=user.id, title='Notice', message=f'About book {i}'))
+            user.active_loans = sum(1 for i in range(BOOKS) if i % 3)
+        db.session.commit()
+        reconcile_stat_counters()
+        yield {'user_id': users[0].id}
+
+
+def client_for(**session_values):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session.update(session_values)
+    return client
+
+
+@pytest.mark.parametrize('path, login, budget', [
+    ('/api/user/dashboard', 'user', 4),
+    ('/api/admin/fines', 'admin', 2),
+    ('/api/admin/fines?status=paid&per_page=5', 'admin', 2),
+    ('/api/admin/dashboard', 'admin', 4),
+])
+def test_endpoint_stays_within_query_budget(library, path, login, budget):
+    client = client_for(user_id=library['user_id']) if login == 'user' else client_for(admin_id=1)
+    with query_budget(budget, path) as profile:
+        response = client.get(path)
+    assert response.status_code == 200
+    assert profile.statements, 'the profile saw none of the request queries'
+    assert not profile.repeated_selects(), profile.report()
+
+
+def test_budget_failure_reports_the_queries(library):
+    client = client_for(user_id=library['user_id'])
+    with pytest.raises(QueryBudgetExceeded, match='Query budget of 1 exceeded'):
+        with query_budget(1, 'user dashboard'):
+            client.get('/api/user/dashboard')